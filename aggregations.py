@@ -0,0 +1,217 @@
+import re
+from data_loader import GRADE_FIELDS, TERM_SEASONS, name_key, term_label, term_ordinal
+
+"""
+aggregations.py
+
+Server side aggregation helpers for grade distributions.
+The grouping and averaging of aprec..fprec is pushed into a MongoDB $group
+pipeline so only one small document per chart label comes back over the wire.
+The same pipeline runs over raw grade sections or over the rollup collections
+kept by DataLoader, which the user page and /api/distribution read from.
+"""
+
+GRADE_LETTERS = ("A", "B", "C", "D", "F")
+
+
+def build_distribution_query(department="", single_class="", selected_teacher="", selected_level=""):
+    """
+    Creates the MongoDB query for the user page filters.
+    Every filter is an equality match on a field stored in the rollup collections. A teacher
+    is matched on name_key, so "John Doe" finds the sections listed as "DOE, JOHN".
+
+    Parameters:
+        department (str): Department code (e.g., 'CIS')
+        single_class (str): Full course code (e.g., 'CIS210')
+        selected_teacher (str): Instructor name, in any format name_key accepts
+        selected_level (str): Department and level (e.g., 'CIS-200')
+
+    Returns:
+        dict: MongoDB query dictionary.
+
+    Raises:
+        ValueError: If the level is not a department code and a number, e.g. 'CIS-200'.
+    """
+    query = {}
+    if selected_level:
+        # Handle Level Filtering
+        match = re.fullmatch(r"([A-Za-z]+)-(\d+)", selected_level.strip())
+        if match is None:
+            raise ValueError(f"Invalid level: {selected_level} (expected e.g. CIS-200)")
+        query["dept"] = match.group(1)
+        query["level"] = int(match.group(2))
+    elif department:
+        query["dept"] = department
+
+    if single_class:
+        query["course"] = single_class
+    if selected_teacher:
+        query["name_key"] = name_key(selected_teacher)
+
+    return query
+
+
+def grade_distribution(collection, query, group_by, rollup=False):
+    """
+    Averages the grade percentages of the matching sections per group inside MongoDB.
+    Raw sections count once each, rollup documents carry their own section count and sums,
+    so both give the average over the underlying sections.
+
+    Parameters:
+        collection (pymongo.collection.Collection): The grades collection or a rollup collection.
+        query (dict): MongoDB query selecting the sections or rollup documents.
+        group_by (str): Field to group on, "course" for the level view or "instructor" otherwise.
+        rollup (bool): True when collection is a rollup collection.
+
+    Returns:
+        list: One dictionary per group with a "label", the section "count" and the average of each grade field.
+    """
+    group_stage = {
+        "_id": {"$ifNull": [f"${group_by}", "Unknown"]},
+        "count": {"$sum": "$count" if rollup else 1},
+    }
+    for field in GRADE_FIELDS:
+        value = f"${field}_sum" if rollup else {"$ifNull": [f"${field}", 0.0]}
+        group_stage[field] = {"$sum": value}
+
+    projection = {group_by: 1}
+    if rollup:
+        projection["count"] = 1
+    for field in GRADE_FIELDS:
+        projection[f"{field}_sum" if rollup else field] = 1
+
+    averages = {"_id": 0, "label": "$_id", "count": 1}
+    for field in GRADE_FIELDS:
+        averages[field] = {"$divide": [f"${field}", "$count"]}
+
+    pipeline = [
+        {"$match": query},
+        {"$project": projection},
+        {"$group": group_stage},
+        {"$project": averages},
+    ]
+    return list(collection.aggregate(pipeline))
+
+
+def rollup_distribution(db, query, group_by):
+    """
+    Computes the grade distribution from the rollup collections.
+    Course groupings without a teacher filter read the smaller per course rollup.
+
+    Parameters:
+        db (pymongo.database.Database): The MongoDB database connection.
+        query (dict): Query from build_distribution_query.
+        group_by (str): "course" or "instructor".
+
+    Returns:
+        list: One dictionary per group with a "label" and the average of each grade field.
+    """
+    if group_by == "course" and "name_key" not in query:
+        collection = db.rollup_course
+    else:
+        collection = db.rollup_course_instructor
+    return grade_distribution(collection, query, group_by, rollup=True)
+
+
+def sort_distribution(graph_data, grade="A"):
+    """
+    Sorts the graph data from most to least of the selected letter grade.
+
+    Parameters:
+        graph_data (list): Output of grade_distribution.
+        grade (str): Letter grade to sort on (A, B, C, D or F), case insensitive.
+
+    Returns:
+        list: The sorted graph data.
+
+    Raises:
+        ValueError: If the grade is not one of A, B, C, D or F.
+    """
+    grade = (grade or "A").upper()
+    if grade not in GRADE_LETTERS:
+        raise ValueError(f"Invalid grade: {grade}")
+    selected_grade = grade.lower() + "prec"
+    return sorted(graph_data, key=lambda x: x.get(selected_grade, 0), reverse=True)
+
+
+def parse_term_bound(value, end=False):
+    """
+    Parses a trend range bound, either a term or a year.
+
+    Parameters:
+        value (str): e.g. 'Fall 2010' or '2010'. Empty for an open bound.
+        end (bool): True for the end of the range, a year then includes its Fall term.
+
+    Returns:
+        int: Term ordinal, or None for an open bound.
+
+    Raises:
+        ValueError: If the value is neither a term nor a year.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    if value.isdigit() and len(value) == 4:
+        return int(value) * len(TERM_SEASONS) + (len(TERM_SEASONS) - 1 if end else 0)
+    ordinal = term_ordinal(value)
+    if ordinal is None:
+        raise ValueError(f"Invalid term: {value}")
+    return ordinal
+
+
+def build_trend_query(department="", single_class="", selected_teacher="", start=None, end=None):
+    """
+    Picks the collection and query for a grade trend over terms.
+    Single filters read the per term rollups, a class and teacher together group raw sections,
+    which the (course, term_ord) index narrows to one course.
+
+    Parameters:
+        department (str): Department code (e.g., 'MATH')
+        single_class (str): Full course code (e.g., 'MATH111')
+        selected_teacher (str): Instructor name, matched on name_key
+        start (int): First term ordinal, None for no lower bound.
+        end (int): Last term ordinal, None for no upper bound.
+
+    Returns:
+        tuple: (collection name, MongoDB query, whether the collection is a rollup collection).
+    """
+    query = {}
+    if start is not None or end is not None:
+        query["term_ord"] = {}
+        if start is not None:
+            query["term_ord"]["$gte"] = start
+        if end is not None:
+            query["term_ord"]["$lte"] = end
+
+    if single_class and selected_teacher:
+        return "grades", {"course": single_class, "name_key": name_key(selected_teacher), **query}, False
+    if selected_teacher:
+        return "rollup_term_instructor", {"name_key": name_key(selected_teacher), **query}, True
+    if single_class:
+        return "rollup_term_course", {"course": single_class, **query}, True
+    if department:
+        return "rollup_term_course", {"dept": department, **query}, True
+    return "rollup_term_course", query, True
+
+
+def trend_distribution(db, department="", single_class="", selected_teacher="", start=None, end=None):
+    """
+    Averages the grade fields per term for the trend view.
+
+    Parameters:
+        db (pymongo.database.Database): The MongoDB database connection.
+        department, single_class, selected_teacher, start, end: See build_trend_query.
+
+    Returns:
+        list: One dictionary per term in term order, with "term", "term_ord" and the average of each grade field.
+    """
+    collection, query, rollup = build_trend_query(department, single_class, selected_teacher, start, end)
+    if "term_ord" not in query:
+        query["term_ord"] = {"$ne": None}  # Sections whose term could not be parsed have no place on the axis
+
+    rows = grade_distribution(db[collection], query, "term_ord", rollup=rollup)
+    trend = []
+    for row in sorted(rows, key=lambda r: r["label"]):
+        ordinal = row.pop("label")
+        trend.append({"term": term_label(ordinal), "term_ord": ordinal, **row})
+    return trend
@@ -1,18 +1,50 @@
+import os
 import requests
-import re
-import json
-import time
-from flask import Flask, render_template, request, redirect, url_for, flash
+import itertools
+import click
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
 from flask_pymongo import PyMongo
-from data_loader import DataLoader
-from scrap import run_scraper
+from data_loader import DataLoader, report, name_key
+from catalog import FilterCatalog
+from cache import QueryCache
+from grade_stream import iter_course_groups
+from jobs import JobRunner, JobConflict
+from aggregations import build_distribution_query, rollup_distribution, sort_distribution, parse_term_bound, trend_distribution
+from columnar import ColumnarGrades
+from leaderboard import Leaderboard
+from search_index import CatalogSearch
+from grades_api import grades_projection, parse_cursor, parse_limit, find_grades, page_grades, iter_ndjson
+from indexes import ensure_indexes, audit_query_shapes
+from metrics import Metrics
+from http_caching import HttpCaching
+from snapshots import SnapshotExporter
+from scrap import run_scraper, http_cache
 from config import Config
 
 
 # Init flask app and configure MongoDB connection
 app = Flask(__name__)
 app.config.from_object(Config)
-mongo = PyMongo(app)
+
+# Request latency, MongoDB command and job metrics, served at /metrics. Every gunicorn worker
+# keeps its own, so each series carries the worker pid (workers import the app after the fork)
+metrics = Metrics(app.config["SLOW_REQUEST_SECONDS"], app.logger, const_labels={"pid": os.getpid()})
+metrics.init_app(app)
+
+# connect=False defers the first connection to the first query, so a client created before a
+# fork is never used by two processes. Pool size and timeouts come from Config
+mongo = PyMongo(
+    app,
+    connect=False,
+    event_listeners=[metrics.listener],
+    maxPoolSize=app.config["MONGO_MAX_POOL_SIZE"],
+    minPoolSize=app.config["MONGO_MIN_POOL_SIZE"],
+    maxIdleTimeMS=app.config["MONGO_MAX_IDLE_TIME_MS"],
+    connectTimeoutMS=app.config["MONGO_CONNECT_TIMEOUT_MS"],
+    serverSelectionTimeoutMS=app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+    socketTimeoutMS=app.config["MONGO_SOCKET_TIMEOUT_MS"],
+    waitQueueTimeoutMS=app.config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+)
 
 
 NATURAL_SCIENCES_DEPARTMENTS = {
@@ -36,40 +68,245 @@ NATURAL_SCIENCES_DEPARTMENTS = {
 # Init the data processor with the database and departments 
 data_processor = DataLoader(mongo.db, NATURAL_SCIENCES_DEPARTMENTS)
 
+# Precomputed dropdown catalog, rebuilt whenever the admin page changes the data
+filter_catalog = FilterCatalog(mongo.db, NATURAL_SCIENCES_DEPARTMENTS)
+data_processor.add_change_listener(filter_catalog.rebuild)
+
+# Typeahead index over the catalog, rebuilt when the data version changes
+catalog_search = CatalogSearch()
+
+# ETag/Last-Modified from the data version, Cache-Control and compression for the pages and APIs
+http_caching = HttpCaching(
+    data_processor.get_data_state,
+    max_age=app.config["HTTP_MAX_AGE"],
+    shared_max_age=app.config["HTTP_SHARED_MAX_AGE"],
+    compress_min_size=app.config["COMPRESS_MIN_SIZE"],
+    compress_level=app.config["COMPRESS_LEVEL"],
+    salt=app.config["ETAG_SALT"],
+)
+http_caching.init_app(app)
+
+# Query result cache for the user page, invalidated by the DataLoader data version
+query_cache = QueryCache(app.config["CACHE_MAX_ENTRIES"], app.config["CACHE_TTL_SECONDS"])
+
+# Optional in-process columnar copy of the grades for the distribution views, reloaded on a new data version
+grade_store = None
+if app.config["COLUMNAR_STORE"]:
+    if ColumnarGrades.available():
+        grade_store = ColumnarGrades(mongo.db)
+    else:
+        app.logger.warning("COLUMNAR_STORE is set but numpy is not installed, using the rollup collections")
+
+
+# Top and bottom K groups per scope and grade, sorted once per data version
+leaderboard = Leaderboard(lambda query, group_by, version: distribution_rows(query, group_by, version),
+                          app.config["LEADERBOARD_MAX_BOARDS"])
+
+
+# Optional static JSON files of every filter view, refreshed after each ingest
+snapshot_exporter = None
+if app.config["SNAPSHOT_DIR"]:
+    snapshot_exporter = SnapshotExporter(mongo.db, app.config["SNAPSHOT_DIR"], NATURAL_SCIENCES_DEPARTMENTS, filter_catalog,
+                                         mongo_uri=app.config["MONGO_URI"], workers=app.config["SNAPSHOT_WORKERS"])
+
+
+# Background runner for the long admin operations, status is polled at /jobs/<id>
+# Jobs that change the data also take a lock in MongoDB, so only one runs at a time across all app processes
+job_runner = JobRunner(mongo.db, app.config["JOB_WORKERS"], app.config["JOB_LOCK_SECONDS"])
+job_runner.add_finish_listener(metrics.record_job)
+
+
+def job_started(job_id, message):
+    """
+    Responds to an admin form once its job was queued.
+    JSON clients get the job id and status URL, the admin page is redirected and polls the job.
+
+    Parameters:
+        job_id (str): The queued job id.
+        message (str): Message flashed on the admin page.
+    """
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202
+
+    flash(message, "info")
+    return redirect(url_for("admin_page", job=job_id))
+
+
+def job_conflict(error):
+    """
+    Refuses a data change while another one holds the data lock, with 409 Conflict.
+
+    Parameters:
+        error (jobs.JobConflict): The refused lock request.
+    """
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"error": str(error), "job_id": error.holder.get("owner")}), 409
+
+    flash(f"{error} Try again once it has finished.", "warning")
+    return render_template("admin_page.html"), 409
+
+
+def submit_data_job(name, message, func, *args):
+    """
+    Queues a job that changes the data, see JobRunner.submit_exclusive.
+
+    Parameters:
+        name (str): Name of the operation.
+        message (str): Message flashed on the admin page.
+        func (callable): The operation to run.
+    """
+    try:
+        job_id = job_runner.submit_exclusive(name, func, *args)
+    except JobConflict as e:
+        return job_conflict(e)
+    return job_started(job_id, message)
+
+
+def queue_snapshot_export():
+    """
+    Queues a full snapshot export after a data change made outside a job, when SNAPSHOT_DIR is set.
+    """
+    if snapshot_exporter is None:
+        return
+    try:
+        job_runner.submit_exclusive("export_snapshots", export_snapshots_job)
+    except JobConflict as e:
+        flash(f"The static snapshots were not refreshed: {e}", "warning")
+
+
+# Job status route
+@app.route("/jobs/<job_id>")
+@http_caching.no_store
+def job_status(job_id):
+    """
+    Returns the status, progress, record counts and duration of a background job as JSON.
+    """
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id."}), 404
+
+    job["id"] = job.pop("_id")
+    for field in ("created_at", "started_at", "finished_at"):
+        if job.get(field):
+            job[field] = job[field].isoformat()
+    return jsonify(job)
+
 
 # Merge Data Route
 @app.route("/merge_data", methods=["POST"])
 def merge_data():
     """
-    Merges faculty data with grade records in MongoDB.
+    Merges faculty data with grade records in MongoDB, in the background.
     """
-    try:
-        data_processor.merge_faculty_with_grades()
-        flash("Faculty data successfully merged with grade records.", "success")
-    except Exception as e:
-        flash(f"An error occurred during data merging: {e}", "danger")
+    return submit_data_job("merge_data", "Started merging faculty data with grade records.", merge_data_job)
 
-    return redirect(url_for("admin_page"))
 
-# Trying to process grade data in the dropdown choices and narrow 
-# functionality of the user_page
-@app.before_request
-def create_indexes():
+def merge_data_job(job):
+    """
+    Runs merge_faculty_with_grades as a background job.
+
+    Returns:
+        dict: Matched, unmatched, ambiguous and modified grade record counts.
+    """
+    job.progress("Merging faculty data with grade records")
+    counts = data_processor.merge_faculty_with_grades()
+    export_snapshots(job)
+    return counts
+
+
+def export_snapshots(job=None, affected=None):
+    """
+    Refreshes the static snapshot files when SNAPSHOT_DIR is set.
+
+    Parameters:
+        job (jobs.Job): Optional progress handle of the running job.
+        affected (dict): Courses and instructors changed by a delta load, None rebuilds every shard
+                         and an empty dict only rewrites the catalog and manifest.
+
+    Returns:
+        dict: Shards written and stale files removed, None when the export is off.
+    """
+    if snapshot_exporter is None:
+        return None
+    if job:
+        job.progress("Exporting static snapshots")
+    return snapshot_exporter.export(affected, data_processor.get_data_version())
+
+
+def export_snapshots_job(job):
+    """
+    Runs a full snapshot export as a background job.
+    """
+    result = export_snapshots(job)
+    return {"snapshot_shards": result["shards"], "snapshot_removed": result["removed"]} if result else {}
+
+
+# Index management, run once per deploy instead of on the first request
+# (the docker image runs `flask init-indexes` before starting the app)
+@app.cli.command("init-indexes")
+@click.option("--prune", is_flag=True, help="Also drop indexes that are not in indexes.INDEX_SPEC.")
+def init_indexes_command(prune):
+    """
+    Creates the indexes in indexes.INDEX_SPEC and adds the derived course, term and name_key fields to older records.
+    """
+    result = ensure_indexes(mongo.db, prune=prune)
+    click.echo(f"Ensured {len(result['indexes'])} indexes.")
+    for name in result["unlisted"]:
+        click.echo(f"{'Dropped' if prune else 'Not in spec'}: {name}")
+
+    backfilled = data_processor.backfill_course_fields()
+    if backfilled:
+        click.echo(f"Added dept, course_num and level to {backfilled} grade records.")
+
+    keyed = data_processor.backfill_instructor_keys()
+    if keyed:
+        click.echo(f"Added name_key to {keyed} grade and rollup records.")
+
+    faculty = data_processor.backfill_faculty_keys()
+    if faculty["keyed"]:
+        click.echo(f"Added name_key to {faculty['keyed']} faculty records, removed {faculty['duplicates']} duplicates.")
+
+    terms = data_processor.backfill_terms()
+    if terms["updated"]:
+        click.echo(f"Added term_ord to {terms['updated']} grade records.")
+    if terms["rolled_up"]:
+        click.echo(f"Built the term rollups from {terms['rolled_up']} grade records.")
+
+
+@app.cli.command("export-snapshots")
+@click.option("--out", default=None, help="Export directory, defaults to SNAPSHOT_DIR.")
+@click.option("--workers", default=None, type=int, help="Render processes, defaults to SNAPSHOT_WORKERS.")
+def export_snapshots_command(out, workers):
+    """
+    Writes the static JSON snapshot of every filter view, see snapshots.py.
+    """
+    out = out or app.config["SNAPSHOT_DIR"]
+    if not out:
+        raise click.ClickException("Set SNAPSHOT_DIR or pass --out.")
+    exporter = SnapshotExporter(mongo.db, out, NATURAL_SCIENCES_DEPARTMENTS, filter_catalog, mongo_uri=app.config["MONGO_URI"],
+                                workers=workers or app.config["SNAPSHOT_WORKERS"])
+    result = exporter.export(version=data_processor.get_data_version())
+    click.echo(f"Wrote {result['shards']} shards to {out}, removed {result['removed']} stale files.")
+
+
+@app.cli.command("audit-indexes")
+def audit_indexes_command():
     """
-    Creates necessary MongoDB indexes for query performance.
+    Explains every query shape in indexes.QUERY_SHAPES and fails if any is not served by an index.
     """
-    if not hasattr(app, 'indexes_created'):
-        mongo.db.grades.create_index("course")
-        mongo.db.grades.create_index("instructor")
-        mongo.db.grades.create_index([("course", 1), ("instructor", 1)])  # Compound index
-        mongo.db.faculty.create_index("department")  # Add index for faculty department
-        mongo.db.faculty.create_index("instructor")  # Add index for instructor name
-        app.indexes_created = True
-        print("Indexes created successfully.")
+    flagged = 0
+    for result in audit_query_shapes(mongo.db):
+        status = ", ".join(result["problems"]) if result["problems"] else "ok"
+        click.echo(f"{result['collection']:<26} {result['name']:<40} {' > '.join(result['stages']):<30} {status}")
+        flagged += bool(result["problems"])
+
+    if flagged:
+        raise click.ClickException(f"{flagged} query shapes are not served by an index.")
 
 
 # Admin page
 @app.route("/admin")
+@http_caching.no_store
 def admin_page():
     """
     Renders the admin page for data handling
@@ -77,151 +314,366 @@ def admin_page():
     return render_template("admin_page.html")
 
 
+# Shared by the user page, the distribution API and the leaderboard
+def distribution_scope(args):
+    """
+    Turns the user page filters in the request args into a distribution query and grouping.
+
+    Parameters:
+        args (werkzeug.datastructures.MultiDict): Request args with department, class, teacher and level.
+
+    Returns:
+        tuple: (MongoDB query, "course" or "instructor").
+    """
+    department = args.get("department", "")
+    single_class = args.get("class", "")
+    selected_teacher = args.get("teacher", "")
+    selected_level = args.get("level", "")  # Capture selected level
+
+    # Auto-select department based on the selected teacher if not already chosen,
+    # only when the faculty pages list the teacher in exactly one department
+    if selected_teacher and not department:
+        teacher_departments = mongo.db.faculty.distinct("department", {"name_key": name_key(selected_teacher)})
+        if len(teacher_departments) == 1:
+            department = teacher_departments[0] or ""
+
+    query = build_distribution_query(department, single_class, selected_teacher, selected_level)
+
+    # Group data by Class when Level is selected, otherwise by Instructor
+    group_by = "course" if selected_level else "instructor"
+    return query, group_by
+
+
+def distribution_rows(query, group_by, version=None):
+    """
+    Computes the unsorted grade distribution for a query.
+    Served from the columnar store when COLUMNAR_STORE is set, otherwise from the rollup
+    collections DataLoader keeps at ingest, see aggregations.py.
+
+    Parameters:
+        query (dict): Query from build_distribution_query.
+        group_by (str): "course" or "instructor".
+        version (int): Current data version, read from the meta collection when not given.
+
+    Returns:
+        list: One entry per class or instructor with its section count and grade averages.
+    """
+    if grade_store is not None:
+        if version is None:
+            version = data_processor.get_data_version()
+        return grade_store.distribution(query, group_by, version)
+    return rollup_distribution(mongo.db, query, group_by)
+
+
+def distribution_from_args(args, version=None):
+    """
+    Computes the grade distribution for the user page filters in the request args.
+
+    Parameters:
+        args (werkzeug.datastructures.MultiDict): Request args with department, class, teacher, level and grade.
+        version (int): Current data version, read from the meta collection when not given.
+
+    Returns:
+        list: Graph data sorted by the selected grade, one entry per class or instructor.
+    """
+    query, group_by = distribution_scope(args)
+
+    # Sort based on the selected grade (default to A)
+    return sort_distribution(distribution_rows(query, group_by, version), args.get("grade", "A"))
+
+
+def leaderboard_from_args(args, version=None, k=None):
+    """
+    Returns the easiest and hardest classes or instructors for the filters in the request args.
+
+    Parameters:
+        args (werkzeug.datastructures.MultiDict): Request args with the user page filters, grade,
+            k and group ("course" or "instructor", defaults to the user page grouping).
+        version (int): Current data version.
+        k (int): Groups at each end, overrides the k arg.
+
+    Returns:
+        dict: Top and bottom groups and the others bucket, see leaderboard.Board.slice.
+
+    Raises:
+        ValueError: If the grade, group or k is invalid.
+    """
+    query, group_by = distribution_scope(args)
+    if args.get("group"):
+        if args["group"] not in ("course", "instructor"):
+            raise ValueError(f"Invalid group: {args['group']}")
+        group_by = args["group"]
+
+    if k is None:
+        k = args.get("k", app.config["LEADERBOARD_K"])
+        if not str(k).isdigit() or not 1 <= int(k) <= app.config["LEADERBOARD_MAX_K"]:
+            raise ValueError(f"k must be between 1 and {app.config['LEADERBOARD_MAX_K']}")
+    return leaderboard.get(query, group_by, args.get("grade", "A"), int(k), version)
+
+
+def leaderboard_chart(board):
+    """
+    Flattens a leaderboard into the bars of the user page chart: the top groups, one
+    "Others" bar for everything in between and the bottom groups.
+    """
+    graph_data = list(board["top"])
+    if board["others"]:
+        graph_data.append({**board["others"], "label": f"{board['others']['label']} ({board['others']['groups']})", "others": True})
+    graph_data.extend(board["bottom"])
+    return graph_data
+
+
 # User page
 @app.route("/user")
+@http_caching.cached()
 def user_page():
     """
     Render the user page. Displays course and grade data based on 
     user-selected filters such as department, class, and instructor.
     """
     try:
-        department = request.args.get("department", "")
-        single_class = request.args.get("class", "")
-        instructor_type = request.args.get("faculty_type", "all")
-        grade_view = request.args.get("grade_view", "easyA")
-        selected_teacher = request.args.get("teacher", "")
-        selected_level = request.args.get("level", "")  # Capture selected level
-
-        # Auto-select department based on the selected teacher if not already chosen
-        if selected_teacher and not department:
-            teacher_dept = mongo.db.faculty.find_one({"instructor": selected_teacher}, {"department": 1})
-            if teacher_dept:
-                department = teacher_dept.get("department", "")
-
-        query = {}
-        if selected_level:
-            # Handle Level Filtering
-            dept_abbr, level_prefix = selected_level.split("-")
-            query["course"] = {"$regex": f"^{dept_abbr}{level_prefix[0]}"}
-        elif department:
-            query["course"] = {"$regex": f"^{department}"}
-
-        if single_class:
-            query["course"] = single_class
-        if selected_teacher:
-            query["instructor"] = selected_teacher
-
-        natural_sciences_abbrevs = NATURAL_SCIENCES_DEPARTMENTS.keys()
-
-        natural_science_classes = mongo.db.grades.distinct(
-            "course", {"course": {"$regex": f"^({'|'.join(natural_sciences_abbrevs)})"}}
-        )
-        natural_science_teachers = mongo.db.faculty.distinct("name")
-
-        # Build mappings
-        teacher_department_map = {}
-        for doc in mongo.db.faculty.find({}, {"name": 1, "department": 1}):
-            instructor_name = doc.get("name", "Unknown")
-            department = doc.get("department", "Unknown")
-            teacher_department_map[instructor_name] = department
-
-        teacher_classes_map = {
-            teacher: ';'.join(str(course) for course in mongo.db.grades.distinct("course", {"instructor": teacher}))
-            for teacher in natural_science_teachers
-        }
-
-        class_department_map = {
-            # Extracts CIS, BI, CH, etc.
-            course: re.match(r'^[A-Z]+', course).group()  
-            for course in natural_science_classes
-        }
-
-        class_teachers_map = {
-            course: ';'.join(mongo.db.grades.distinct("instructor", {"course": course}))
-            for course in natural_science_classes
-        }
-
-        # Graph Data
-        results = list(mongo.db.grades.find(query))
-
-        if selected_level:
-            # Group data by Class when Level is selected
-            data_by_class = {}
-            for r in results:
-                course = r.get("course", "Unknown")
-                data_by_class.setdefault(course, {"count": 0, "sum": 0.0, "aprec": 0.0, "bprec": 0.0, "cprec": 0.0, "dprec": 0.0, "fprec": 0.0})
-
-                data_by_class[course]["aprec"] += r.get("aprec", 0.0)
-                data_by_class[course]["bprec"] += r.get("bprec", 0.0)
-                data_by_class[course]["cprec"] += r.get("cprec", 0.0)
-                data_by_class[course]["dprec"] += r.get("dprec", 0.0)
-                data_by_class[course]["fprec"] += r.get("fprec", 0.0)
-
-                data_by_class[course]["count"] += 1
-
-            graph_data = [
-                {
-                    "label": course,
-                    "aprec": info["aprec"] / info["count"],
-                    "bprec": info["bprec"] / info["count"],
-                    "cprec": info["cprec"] / info["count"],
-                    "dprec": info["dprec"] / info["count"],
-                    "fprec": info["fprec"] / info["count"],
-                }
-                for course, info in data_by_class.items()
-            ]
+        # Repeated filter combinations are served from the cache until the data changes
+        version = data_processor.get_data_version()
+        # The leaderboard also reads ?group=, k is fixed to LEADERBOARD_K on this page
+        cache_key = QueryCache.make_key(request.args, "user", extra=("group",))
+        cached = query_cache.get(cache_key, version)
 
-        else:
-            # Default: Group data by Instructor
-            data_by_instructor = {}
-            for r in results:
-                instructor = r.get("instructor", "Unknown")
-                data_by_instructor.setdefault(instructor, {"count": 0, "aprec": 0.0, "bprec": 0.0, "cprec": 0.0, "dprec": 0.0, "fprec": 0.0})
-
-                data_by_instructor[instructor]["aprec"] += r.get("aprec", 0.0)
-                data_by_instructor[instructor]["bprec"] += r.get("bprec", 0.0)
-                data_by_instructor[instructor]["cprec"] += r.get("cprec", 0.0)
-                data_by_instructor[instructor]["dprec"] += r.get("dprec", 0.0)
-                data_by_instructor[instructor]["fprec"] += r.get("fprec", 0.0)
-
-                data_by_instructor[instructor]["count"] += 1
-
-            graph_data = [
-                {
-                    "label": instructor,
-                    "aprec": info["aprec"] / info["count"],
-                    "bprec": info["bprec"] / info["count"],
-                    "cprec": info["cprec"] / info["count"],
-                    "dprec": info["dprec"] / info["count"],
-                    "fprec": info["fprec"] / info["count"],
-                }
-                for instructor, info in data_by_instructor.items()
-            ]
-
-        # Sort based on the selected grade (default to A)
-        selected_grade = request.args.get("grade", "A").lower() + "prec"
-        graph_data.sort(key=lambda x: x.get(selected_grade, 0), reverse=True)
+        if cached is None:
+            # Graph Data, only computed once the user picked a filter. The chart shows the
+            # LEADERBOARD_K easiest and hardest groups for the selected grade and an Others bar
+            board = leaderboard_from_args(request.args, version, app.config["LEADERBOARD_K"]) if request.args else None
+            graph_data = leaderboard_chart(board) if board else []
 
+            cached = {"graph_data": graph_data}
+            query_cache.set(cache_key, cached, version)
+
+        graph_data = cached["graph_data"]
 
         return render_template(
             "user_page.html",
-            graph_data=graph_data if request.args else [],
+            graph_data=graph_data,
+            grade=(request.args.get("grade") or "A").upper(),
             departments=NATURAL_SCIENCES_DEPARTMENTS.keys(),
-            teachers=natural_science_teachers,
-            classes=natural_science_classes,
-            teacher_department_map=teacher_department_map,
-            teacher_classes_map=teacher_classes_map,
-            class_department_map=class_department_map,
-            class_teachers_map=class_teachers_map,
         )
 
 
+    except ValueError as e:
+        return str(e), 400
+
     except Exception as e:
 
         print(f"Error: {e}")
         return str(e), 500
 
 
+# Distribution API
+@app.route("/api/distribution")
+@http_caching.cached()
+def api_distribution():
+    """
+    Returns the grade distribution for the same filters as the user page as JSON.
+    Without filters the distribution covers every instructor.
+    """
+    try:
+        version = data_processor.get_data_version()
+        cache_key = QueryCache.make_key(request.args, "api")
+        results = query_cache.get(cache_key, version)
+        if results is None:
+            results = distribution_from_args(request.args, version)
+            query_cache.set(cache_key, results, version)
+
+        return jsonify({
+            "group_by": "course" if request.args.get("level") else "instructor",
+            "grade": (request.args.get("grade") or "A").upper(),
+            "results": results,
+        })
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+
+# Typeahead search for the teacher and class fields of the user page
+def search_args():
+    """
+    Reads the typed prefix and result limit of a search request and makes sure the
+    search index matches the current data version.
+
+    Returns:
+        tuple: (prefix, limit).
+
+    Raises:
+        ValueError: If the limit is not between 1 and SEARCH_MAX_LIMIT.
+    """
+    limit = request.args.get("limit", str(app.config["SEARCH_LIMIT"]))
+    if not limit.isdigit() or not 1 <= int(limit) <= app.config["SEARCH_MAX_LIMIT"]:
+        raise ValueError(f"limit must be between 1 and {app.config['SEARCH_MAX_LIMIT']}")
+
+    catalog_search.ensure_current(filter_catalog.document, data_processor.get_data_version())
+    return request.args.get("q", "").strip(), int(limit)
+
+
+@app.route("/api/search/teachers")
+@http_caching.cached()
+def search_teachers():
+    """
+    Returns teachers with a name word starting with ?q=, optionally only those of a
+    ?department= or of a ?class=, at most ?limit= of them.
+    """
+    try:
+        prefix, limit = search_args()
+        results = catalog_search.teachers(prefix, request.args.get("department", ""),
+                                          request.args.get("class", ""), limit)
+        return jsonify({"results": results})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/search/classes")
+@http_caching.cached()
+def search_classes():
+    """
+    Returns classes whose code or number starts with ?q=, optionally only those of a
+    ?department= or taught by a ?teacher=, at most ?limit= of them.
+    """
+    try:
+        prefix, limit = search_args()
+        results = catalog_search.classes(prefix, request.args.get("department", ""),
+                                         request.args.get("teacher", ""), limit)
+        return jsonify({"results": results})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Leaderboard API, easiest and hardest classes or instructors for a grade
+@app.route("/api/leaderboard")
+@http_caching.cached()
+def api_leaderboard():
+    """
+    Returns the k classes or instructors with the most and the fewest of a grade for the
+    user page filters, plus an "others" bucket averaging every group in between.
+    ?group= picks "course" or "instructor", ?k= the number of groups at each end.
+    """
+    try:
+        version = data_processor.get_data_version()
+        return jsonify(leaderboard_from_args(request.args, version))
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Grade trend API, per term averages from the term rollups
+@app.route("/api/trend")
+@http_caching.cached()
+def api_trend():
+    """
+    Returns the average grade distribution per term for a department, class or teacher
+    (or a class and teacher together) as JSON, in term order.
+    ?from= and ?to= limit the range and take a term ('Fall 2010') or a year ('2010').
+    """
+    try:
+        start = parse_term_bound(request.args.get("from", ""))
+        end = parse_term_bound(request.args.get("to", ""), end=True)
+
+        version = data_processor.get_data_version()
+        cache_key = QueryCache.make_key(request.args, "trend", extra=("from", "to"))
+        results = query_cache.get(cache_key, version)
+        if results is None:
+            results = trend_distribution(mongo.db, request.args.get("department", ""), request.args.get("class", ""),
+                                         request.args.get("teacher", ""), start, end)
+            query_cache.set(cache_key, results, version)
+
+        return jsonify({"results": results})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Raw grade sections API, paged by keyset cursor or streamed as NDJSON
+@app.route("/api/grades")
+@http_caching.cached(vary_accept=True)
+def api_grades():
+    """
+    Returns raw grade sections for the build_course_query filters (department, class, instructor).
+    ?fields= picks the returned fields, ?limit= the page size and ?after= continues from the
+    "next" cursor of the previous page. With ?format=ndjson (or Accept: application/x-ndjson)
+    every matching row after the cursor is streamed, one JSON object per line.
+    """
+    try:
+        # Department codes are accepted as well as the full names build_course_query expects
+        department = request.args.get("department", "")
+        department = NATURAL_SCIENCES_DEPARTMENTS.get(department, department)
+        query = build_course_query(department, request.args.get("class", ""), request.args.get("instructor", ""))
+
+        projection = grades_projection(request.args.get("fields", ""))
+        after = parse_cursor(request.args.get("after", ""))
+        stream = (request.args.get("format") == "ndjson"
+                  or request.accept_mimetypes.best == "application/x-ndjson")
+
+        if stream:
+            limit = parse_limit(request.args.get("limit"), default=None, maximum=None)
+            cursor = find_grades(mongo.db, query, projection, after, limit)
+            return Response(stream_with_context(iter_ndjson(cursor)), mimetype="application/x-ndjson")
+
+        rows, next_cursor = page_grades(mongo.db, query, projection, after, parse_limit(request.args.get("limit")))
+        return jsonify({
+            "results": rows,
+            "count": len(rows),
+            "next": next_cursor,
+            "next_url": url_for("api_grades", **{**request.args.to_dict(), "after": next_cursor}) if next_cursor else None,
+        })
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+
+
+# Cache counters, used to size CACHE_MAX_ENTRIES and CACHE_TTL_SECONDS
+@app.route("/cache_stats")
+@http_caching.no_store
+def cache_stats():
+    """
+    Returns the user page query cache hit/miss/eviction counters as JSON.
+    The cache is per worker process, the pid tells which worker answered.
+    """
+    return jsonify(dict(query_cache.stats(), pid=os.getpid()))
+
+
+# Prometheus metrics, request latency per route, MongoDB commands and job throughput
+@app.route("/metrics")
+@http_caching.no_store
+def metrics_page():
+    """
+    Returns all metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 # Load js data, extract the JSON and insert it into the database
@@ -229,43 +681,114 @@ def user_page():
 def load_remote_js():
     """
     Loads and processes course data from the JS file. Then insert it into the MongoDB database.
+    The load runs in the background, see load_remote_js_job.
 
 
     Returns:
-        Redirects admin to the admin page with a message saying if the data was successful or failed.
+        Redirects admin to the admin page, which polls the job until the data was loaded or failed.
     """
-    try:
-        file_url = request.form.get("file_url")
-        if not file_url or not file_url.startswith("http"):
-            flash("Invalid file URL provided.", "danger")
-            return redirect(url_for("admin_page"))
-        
-        response = requests.get(file_url, timeout=10)
+    file_url = request.form.get("file_url")
+    if not file_url or not file_url.startswith("http"):
+        flash("Invalid file URL provided.", "danger")
+        return redirect(url_for("admin_page"))
+
+    return submit_data_job(
+        "load_remote_js",
+        "Started loading grade data.",
+        load_remote_js_job,
+        file_url,
+        bool(request.form.get("delta")),
+        bool(request.form.get("remove_missing")),
+    )
+
+
+def load_remote_js_job(job, file_url, delta=False, remove_missing=False):
+    """
+    Streams the remote JS file into the database.
+
+    Parameters:
+        job (jobs.Job): Progress handle of the running job.
+        file_url (str): URL of the grade data file.
+        delta (bool): Only write new or changed sections instead of replacing everything.
+        remove_missing (bool): With delta, delete sections missing from the file.
+
+    Returns:
+        dict: Record counts of the load.
+    """
+    job.progress("Downloading grade data")
+
+    # Stream the file in chunks instead of holding the whole response in memory
+    with requests.get(file_url, timeout=10, stream=True) as response:
         response.raise_for_status()
-        content = response.text.strip()
-
-        # Grab the JSON data 
-        match = re.search(r'var\s+groups\s*=\s*({.*?});', content, re.DOTALL)
-        if not match:
-            flash("Could not extract JSON data from the remote file.", "danger")
-            return redirect(url_for("admin_page"))
-
-        # format the JSON data for the database
-        groups = json.loads(match.group(1))
-        records = data_processor.transform_course_data(groups)
-
-        # Clear existing data dn insert new data into records 
-        if records:
-            mongo.db.grades.delete_many({})
-            mongo.db.grades.insert_many(records)
-            flash(f"Database successfully populated with {len(records)} records!", "success")
-        else:
-            flash("No valid data to insert.", "warning")
 
+        # Course groups are parsed one at a time as chunks arrive and turned into records lazily
+        groups = iter_course_groups(
+            response.iter_content(chunk_size=app.config["INGEST_CHUNK_SIZE"]),
+            response.encoding or "utf-8",
+        )
+        records = data_processor.iter_course_records(groups)
+
+        # Peek at the first record so a file without data does not clear the database
+        first_record = next(records, None)
+        if first_record is None:
+            report("No valid data to insert.", "warning")
+            return {"records": 0}
+
+        records = itertools.chain([first_record], records)
+
+        if delta:
+            # Only write sections that are new or changed since the last load,
+            # then re-export only the snapshot shards of the courses and instructors they touched
+            affected = {}
+            counts = data_processor.apply_grade_delta(
+                records, remove_missing, app.config["INGEST_BATCH_SIZE"],
+                progress=lambda counts: job.progress("Applying changed sections", **counts),
+                affected=affected,
+            )
+            if affected:
+                snapshots = export_snapshots(job, affected)
+                if snapshots:
+                    counts["snapshot_shards"] = snapshots["shards"]
+            report(
+                f"Delta load: {counts['inserted']} inserted, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged, {counts['removed']} removed, "
+                f"{counts['unmerged']} written without a faculty match.",
+                "success",
+            )
+            return counts
+
+        # Load the new records into staging collections in bounded batches, then swap them in
+        count = data_processor.replace_grade_records(
+            records, app.config["INGEST_BATCH_SIZE"],
+            progress=lambda count: job.progress("Staging grade records", records=count),
+        )
+        report(f"Database successfully populated with {count} records!", "success")
+        snapshots = export_snapshots(job)
+        if snapshots:
+            return {"records": count, "snapshot_shards": snapshots["shards"], "snapshot_removed": snapshots["removed"]}
+        return {"records": count}
+
+
+# Swap the previous grade data generation back in
+@app.route("/rollback_grades", methods=["POST"])
+def rollback_grades():
+    """
+    Restores the grade data that was live before the last load. 
+    Calls rollback_grade_records from data_loader.py
+    """
+    try:
+        with job_runner.hold("rollback_grades"):
+            restored = data_processor.rollback_grade_records()
+        if restored:
+            flash("Restored the previously loaded grade data.", "success")
+            queue_snapshot_export()
+        else:
+            flash("There is no previous grade data to restore.", "warning")
+    except JobConflict as e:
+        return job_conflict(e)
     except Exception as e:
-        flash(f"An error occurred: {str(e)}", "danger")
+        flash(f"An error occurred during rollback: {e}", "danger")
 
-    time.sleep(3)
     return redirect(url_for("admin_page"))
 
 
@@ -274,19 +797,37 @@ def load_remote_js():
 def scrape_faculty():
     """
     Scrapes faculty data from an external source and updates the MongoDB database.
-    Calls run_scraper from scrap.py file
+    Calls run_scraper from scrap.py file in the background.
     """
-    try:
-        # Run the scraper to get faculty data then insert to db
-        faculty_data = run_scraper()
-        # print("Scraped Data:", faculty_data)  
+    return submit_data_job("scrape_faculty", "Started scraping faculty data.", scrape_faculty_job)
 
-        data_processor.insert_faculty_data(faculty_data)
 
-    except Exception as e:
-        flash(f"An error occurred during faculty scraping: {e}", "danger")
+def scrape_faculty_job(job):
+    """
+    Runs the faculty scraper and saves its results as a background job.
 
-    return redirect(url_for("admin_page"))
+    Returns:
+        dict: Number of faculty entries scraped and saved.
+    """
+    # Run the scraper to get faculty data then insert to db. The page cache counters
+    # cover the whole process, so this run's share is the difference
+    job.progress("Scraping faculty pages")
+    before = http_cache.stats()
+    faculty_data = run_scraper()
+    after = http_cache.stats()
+
+    page_cache_hits = after["hits"] - before["hits"]
+    job.progress("Saving faculty records", scraped=len(faculty_data), page_cache_hits=page_cache_hits)
+    counts = {
+        "scraped": len(faculty_data),
+        "faculty": data_processor.insert_faculty_data(faculty_data),
+        "page_cache_hits": page_cache_hits,
+        "pages_downloaded": after["misses"] - before["misses"],
+    }
+
+    # Faculty only feed the teacher departments of the catalog, no distribution shard changes
+    export_snapshots(job, affected={})
+    return counts
 
 
 
@@ -296,7 +837,12 @@ def clear_database():
     Clears MongoDB of all records from the grades and faculty collections
     Calls clear_all_collections from data_loader.py 
     """
-    data_processor.clear_all_collections()
+    try:
+        with job_runner.hold("clear_database"):
+            data_processor.clear_all_collections()
+    except JobConflict as e:
+        return job_conflict(e)
+    queue_snapshot_export()
     return redirect(url_for("admin_page"))
 
 
@@ -311,7 +857,7 @@ def build_course_query(department, course_class, instructor):
     Args:
         department (str): Full name of the department (e.g., 'Mathematics')
         course_class (str): Specific course class to search for (e.g., '111')
-        instructor (str): Instructor name
+        instructor (str): Instructor name, matched on name_key
 
     Returns:
         dict: MongoDB query dictionary to fetch relevant course and instructor data.
@@ -326,15 +872,13 @@ def build_course_query(department, course_class, instructor):
             department_code = code
             break
 
-    # course "MATH111" match with actual name
-    if department_code and course_class:
-        query["course"] = f'{department_code}{course_class}'
-    elif department_code:
-        query["course"] = {'$regex': f'^{department_code}'}
-    elif course_class:
-        query["course"] = {'$regex': f'{course_class}$'}
-    elif instructor:
-        query["instructor"] = instructor
+    # Equality on the dept and course_num fields stored at ingest, both covered by indexes
+    if department_code:
+        query["dept"] = department_code
+    if course_class:
+        query["course_num"] = course_class
+    if not query and instructor:
+        query["name_key"] = name_key(instructor)
     
     return query
 
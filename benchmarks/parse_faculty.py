@@ -0,0 +1,64 @@
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from scrap import parse_faculty, parse_faculty_soup
+
+"""
+benchmarks/parse_faculty.py
+
+Times the faculty extraction on saved department pages, comparing the streaming
+parse_faculty with the BeautifulSoup tree version (parse_faculty_soup). Both must
+return the same faculty for every page before any timing is reported.
+
+Usage:
+    python benchmarks/parse_faculty.py [--repeat 5] [--number 10] [pages ...]
+"""
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "catalog", "*.html")
+
+
+def faculty_set(faculty):
+    return sorted((f["name"], f["department"]) for f in faculty)
+
+
+def best_time(func, content, repeat, number):
+    # Best of `repeat` runs, in milliseconds per page
+    return min(timeit.repeat(lambda: func(content, "DEPT"), repeat=repeat, number=number)) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse_faculty against the BeautifulSoup version.")
+    parser.add_argument("pages", nargs="*", help="HTML files, defaults to tests/fixtures/catalog/*.html")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=10)
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(glob.glob(FIXTURES))
+    total_soup = total_stream = 0
+    print(f"{'page':<28}{'KB':>8}{'faculty':>9}{'soup ms':>10}{'stream ms':>11}{'speedup':>9}")
+    for path in pages:
+        with open(path, "rb") as file:
+            content = file.read()
+
+        expected = faculty_set(parse_faculty_soup(content, "DEPT"))
+        if faculty_set(parse_faculty(content, "DEPT")) != expected:
+            sys.exit(f"{path}: parse_faculty and parse_faculty_soup disagree")
+
+        soup_ms = best_time(parse_faculty_soup, content, args.repeat, args.number)
+        stream_ms = best_time(parse_faculty, content, args.repeat, args.number)
+        total_soup += soup_ms
+        total_stream += stream_ms
+        print(f"{os.path.basename(path):<28}{len(content) / 1024:>8.0f}{len(expected):>9}"
+              f"{soup_ms:>10.2f}{stream_ms:>11.2f}{soup_ms / stream_ms:>8.1f}x")
+
+    if pages:
+        print(f"{'total':<45}{total_soup:>10.2f}{total_stream:>11.2f}{total_soup / total_stream:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
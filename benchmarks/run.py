@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aggregations import build_distribution_query, rollup_distribution, sort_distribution
+from catalog import FilterCatalog
+from columnar import ColumnarGrades
+from search_index import CatalogSearch
+from data_loader import DataLoader, canonical_name, name_key, reporting_to
+from scrap import parse_faculty
+from synthetic import SIZES, generate_dataset
+
+"""
+benchmarks/run.py
+
+Times the ingest, merge, scraping and user page code paths on synthetic data of
+several sizes and saves the results as JSON, so runs from different commits can be
+compared with --compare.
+
+Runs against mongomock by default, or a real server with --mongo-uri (the benchmark
+uses its own database, which is dropped before and after each size).
+
+Usage:
+    python benchmarks/run.py [--sizes small medium] [--repeat 3] [--mongo-uri mongodb://localhost:27017]
+                             [--output benchmarks/results] [--compare benchmarks/results/<earlier run>.json]
+"""
+
+DEPARTMENTS = {code: code for code in ("ANTH", "BI", "CH", "CIS", "ES", "GEOG", "GEOL", "HPHY", "MATH", "NEURO", "PHYS", "PSY")}
+BENCH_DB = "easya_benchmark"
+
+
+def connect(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        return MongoClient(mongo_uri), "mongod"
+
+    import mongomock
+    return mongomock.MongoClient(), "mongomock"
+
+
+def measure(func, setup=None, repeat=3):
+    """
+    Runs func repeat times, calling setup before each run outside the timing.
+
+    Returns:
+        dict: Best, mean and each run time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "mean": statistics.mean(times), "runs": times}
+
+
+def user_page_filters(groups, faculty):
+    # A spread of the filter combinations the user page sends
+    courses = sorted(groups)
+    first_course = courses[0]
+    teacher = next(s["instructor"] for s in groups[first_course])
+    dept = first_course.rstrip("0123456789")
+    return [
+        {},
+        {"department": dept},
+        {"level": f"{dept}-{first_course[len(dept)]}00"},
+        {"class": first_course},
+        {"teacher": canonical_name(teacher)},
+        {"department": dept, "teacher": canonical_name(teacher)},
+    ]
+
+
+def user_page_data(db, filters):
+    # What /user assembles on a cache miss: the sorted distribution, the dropdowns are searched separately
+    for args in filters:
+        query = build_distribution_query(args.get("department", ""), args.get("class", ""),
+                                         args.get("teacher", ""), args.get("level", ""))
+        group_by = "course" if args.get("level") else "instructor"
+        sort_distribution(rollup_distribution(db, query, group_by), "A")
+
+
+def catalog_search(search, catalog, prefixes):
+    # Rebuild the typeahead index from the catalog, then answer one teacher and one class lookup per prefix
+    search.build(catalog.document(), version=None)
+    for prefix in prefixes:
+        search.teachers(prefix, limit=20)
+        search.classes(prefix, limit=20)
+
+
+def columnar_distributions(store, filters):
+    # The same distributions as user_page_data, from the in-process columns
+    for args in filters:
+        query = build_distribution_query(args.get("department", ""), args.get("class", ""),
+                                         args.get("teacher", ""), args.get("level", ""))
+        group_by = "course" if args.get("level") else "instructor"
+        sort_distribution(store.distribution(query, group_by), "A")
+
+
+def run_size(client, size, params, repeat):
+    """
+    Benchmarks every operation on one dataset size.
+
+    Returns:
+        list: One result per operation.
+    """
+    data = generate_dataset(**params)
+    groups, faculty, pages = data["groups"], data["faculty"], data["pages"]
+
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    loader = DataLoader(db, DEPARTMENTS)
+    catalog = FilterCatalog(db, DEPARTMENTS)
+    records = loader.transform_course_data(groups)
+    filters = user_page_filters(groups, faculty)
+    search = CatalogSearch()
+    # Typed prefixes of one to three letters of every instructor and course
+    prefixes = sorted({name[:n] for name in list(groups) + [f["name"] for f in faculty] for n in (1, 2, 3)})
+
+    def clear_name_caches():
+        # Measure a cold ingest, the normalizer caches would be warm after the first run
+        canonical_name.cache_clear()
+        name_key.cache_clear()
+
+    def reset_faculty():
+        db.faculty.delete_many({})
+
+    def reset_merge():
+        db.grades.update_many({}, {"$unset": {"department": "", "course_number": ""}})
+
+    operations = [
+        ("transform_course_data", len(records),
+         lambda: loader.transform_course_data(groups), clear_name_caches),
+        ("replace_grade_records", len(records),
+         lambda: loader.replace_grade_records([dict(r) for r in records]), None),
+        ("insert_faculty_data", len(faculty),
+         lambda: loader.insert_faculty_data(faculty), reset_faculty),
+        ("merge_faculty_with_grades", len(records),
+         lambda: loader.merge_faculty_with_grades(), reset_merge),
+        ("parse_faculty", len(pages),
+         lambda: [parse_faculty(html.encode(), dept) for dept, html in pages.items()], None),
+        ("user_page_data", len(filters),
+         lambda: user_page_data(db, filters), None),
+        ("catalog_search", len(prefixes),
+         lambda: catalog_search(search, catalog, prefixes), catalog.rebuild),
+    ]
+    if ColumnarGrades.available():
+        store = ColumnarGrades(db)
+        operations += [
+            ("columnar_load", len(records), lambda: store.load(1), None),
+            ("columnar_distributions", len(filters), lambda: columnar_distributions(store, filters), None),
+        ]
+
+    results = []
+    with reporting_to(lambda message, category: None):
+        for name, items, func, setup in operations:
+            timing = measure(func, setup, repeat)
+            results.append({
+                "size": size,
+                "operation": name,
+                "items": items,
+                "best_seconds": round(timing["best"], 6),
+                "mean_seconds": round(timing["mean"], 6),
+                "items_per_second": round(items / timing["best"], 1) if timing["best"] else None,
+            })
+            print(f"{size:<8}{name:<28}{items:>8}{timing['best'] * 1000:>12.1f} ms{results[-1]['items_per_second'] or 0:>14.0f}/s")
+
+    client.drop_database(BENCH_DB)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    # Prints the change in best time against an earlier results file
+    with open(baseline_path) as file:
+        baseline = {(r["size"], r["operation"]): r for r in json.load(file)["results"]}
+
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get((result["size"], result["operation"]))
+        if before and before["best_seconds"]:
+            change = result["best_seconds"] / before["best_seconds"] - 1
+            print(f"{result['size']:<8}{result['operation']:<28}{change:>+9.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EasyA ingest, merge, scraping and user page paths.")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=sorted(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mongo-uri", help="Benchmark against this server instead of mongomock.")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results"))
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    client, backend = connect(args.mongo_uri)
+    print(f"{'size':<8}{'operation':<28}{'items':>8}{'best':>15}{'throughput':>16}")
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(client, size, SIZES[size], args.repeat))
+
+    commit = git_commit()
+    started = datetime.now(timezone.utc)
+    report = {
+        "commit": commit,
+        "created_at": started.isoformat(),
+        "backend": backend,
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "sizes": {size: SIZES[size] for size in args.sizes},
+        "results": results,
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{started:%Y%m%d-%H%M%S}-{commit or 'nogit'}-{backend}.json")
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nSaved {path}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import requests
+
+"""
+benchmarks/serving.py
+
+Load test for sizing the production server (WEB_WORKERS, WEB_THREADS, MONGO_MAX_POOL_SIZE).
+Sends /user and /api/distribution requests from several client threads at once against a
+running server and reports throughput and latency percentiles per concurrency level.
+
+Start the server with the settings to try, load some data, then run e.g.:
+    WEB_WORKERS=4 WEB_THREADS=4 gunicorn -c gunicorn.conf.py wsgi:app
+    python benchmarks/serving.py --url http://localhost:5000 --concurrency 1 4 16 32 --duration 20
+
+Run it once per configuration with --label and compare the saved JSON files.
+"""
+
+# Filter combinations mixed into the load, "{dept}" is filled in from --departments
+PATHS = [
+    ("/user", {}),
+    ("/user", {"department": "{dept}"}),
+    ("/user", {"department": "{dept}", "grade": "B"}),
+    ("/api/distribution", {"department": "{dept}"}),
+    ("/api/distribution", {"department": "{dept}", "grade": "F"}),
+]
+
+
+def build_urls(base_url, departments):
+    """
+    Expands PATHS into full URLs, one set per department.
+    """
+    urls = []
+    for dept in departments:
+        for path, args in PATHS:
+            query = urlencode({key: value.format(dept=dept) for key, value in args.items()})
+            urls.append(f"{base_url.rstrip('/')}{path}{'?' + query if query else ''}")
+    return urls
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_level(urls, concurrency, duration):
+    """
+    Sends requests from concurrency threads for duration seconds.
+
+    Returns:
+        dict: Request count, errors, throughput and latency percentiles in milliseconds.
+    """
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        session = requests.Session()
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = session.get(urls[i % len(urls)], timeout=60).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+            i += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(1000 * percentile(latencies, 0.5), 1) if latencies else None,
+        "p95_ms": round(1000 * percentile(latencies, 0.95), 1) if latencies else None,
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 1) if latencies else None,
+        "mean_ms": round(1000 * statistics.mean(latencies), 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running EasyA server.")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level.")
+    parser.add_argument("--departments", nargs="+", default=["CIS", "MATH", "BI", "PHYS"])
+    parser.add_argument("--label", default="", help="Name of the server configuration, e.g. w4t4.")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results"))
+    args = parser.parse_args()
+
+    urls = build_urls(args.url, args.departments)
+    for url in urls[:len(PATHS)]:
+        requests.get(url, timeout=60)  # warm the caches once, like a server that has been up a while
+
+    print(f"{'clients':>8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    results = []
+    for concurrency in args.concurrency:
+        result = run_level(urls, concurrency, args.duration)
+        results.append(result)
+        print(f"{concurrency:>8}{result['requests']:>10}{result['errors']:>8}{result['requests_per_second']:>10}"
+              f"{result['p50_ms'] or 0:>8.1f}ms{result['p95_ms'] or 0:>8.1f}ms{result['p99_ms'] or 0:>8.1f}ms")
+
+    started = datetime.now(timezone.utc)
+    report = {
+        "created_at": started.isoformat(),
+        "url": args.url,
+        "label": args.label,
+        "duration": args.duration,
+        "server": {key: os.environ[key] for key in sorted(os.environ) if key.startswith(("WEB_", "MONGO_"))},
+        "results": results,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{started:%Y%m%d-%H%M%S}-serving{'-' + args.label if args.label else ''}.json")
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import random
+
+"""
+benchmarks/synthetic.py
+
+Seeded generator for benchmark data shaped like the real inputs:
+- groups: the `var groups = {...}` payload of gradedata.js, course -> list of sections
+- faculty: scraper output, {"name": "Last, First M.", "department": code}
+- department pages: catalog HTML with one <p> per faculty member, as parsed by get_faculty
+
+The same seed and size always give the same data, so timings are comparable between commits.
+"""
+
+DEPARTMENTS = ["ANTH", "BI", "CH", "CIS", "ES", "GEOG", "GEOL", "HPHY", "MATH", "NEURO", "PHYS", "PSY"]
+TERMS = ["Fall", "Winter", "Spring", "Summer"]
+TITLES = ["professor", "associate professor", "assistant professor", "senior lecturer", "instructor"]
+SYLLABLES = ["an", "ber", "cal", "dor", "el", "fen", "gar", "hol", "is", "jen", "kar", "lin",
+             "mor", "nel", "os", "per", "quin", "ros", "sten", "tor", "ul", "ven", "wil", "yar"]
+
+# Named sizes for benchmarks/run.py, each scales courses, instructors and terms
+SIZES = {
+    "small": {"courses": 60, "instructors": 40, "terms": 4},
+    "medium": {"courses": 240, "instructors": 160, "terms": 8},
+    "large": {"courses": 960, "instructors": 640, "terms": 12},
+}
+
+
+def make_name(rng, syllables=2):
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables)).capitalize()
+
+
+def make_instructors(rng, count):
+    """
+    Returns unique (last, first, middle initial, department) tuples.
+    """
+    instructors, seen = [], set()
+    while len(instructors) < count:
+        last, first = make_name(rng, 3), make_name(rng, 2)
+        if (last, first) in seen:
+            continue
+        seen.add((last, first))
+        instructors.append((last, first, rng.choice("ABCDEFGHJKLMNPRSTW"), rng.choice(DEPARTMENTS)))
+    return instructors
+
+
+def term_names(count):
+    # Consecutive terms starting Fall 2010, e.g. "Fall 2010", "Winter 2011", ...
+    names = []
+    for i in range(count):
+        season = TERMS[i % len(TERMS)]
+        year = 2010 + (i + 3) // len(TERMS)
+        names.append(f"{season} {year}")
+    return names
+
+
+def generate_dataset(courses, instructors, terms, seed=422):
+    """
+    Generates a grade payload, the matching faculty list and a department page per department.
+
+    Parameters:
+        courses (int): Number of distinct courses.
+        instructors (int): Number of distinct instructors.
+        terms (int): Number of terms each course can be offered in.
+        seed (int): Random seed.
+
+    Returns:
+        dict: "groups" (course -> sections), "faculty" (scraper records) and "pages" (department -> HTML).
+    """
+    rng = random.Random(seed)
+    people = make_instructors(rng, instructors)
+    by_department = {}
+    for person in people:
+        by_department.setdefault(person[3], []).append(person)
+
+    # Course codes are unique per department, e.g. CIS210
+    course_codes, seen = [], set()
+    while len(course_codes) < courses:
+        dept = rng.choice(sorted(by_department))
+        code = f"{dept}{rng.randint(1, 4)}{rng.randint(0, 9)}{rng.randint(0, 9)}"
+        if code not in seen:
+            seen.add(code)
+            course_codes.append(code)
+
+    groups = {}
+    crn = 10000
+    for code in course_codes:
+        teachers = by_department[code.rstrip("0123456789")]
+        sections = []
+        for term in term_names(terms):
+            if rng.random() < 0.25:
+                continue
+            for _ in range(rng.randint(1, 3)):
+                last, first, middle, _ = rng.choice(teachers)
+                grades = [rng.random() for _ in range(5)]
+                grades[0] += 1.5  # mostly A and B, like the real data
+                grades[1] += 1.0
+                total = sum(grades)
+                crn += 1
+                sections.append({
+                    "TERM_DESC": term,
+                    "crn": str(crn),
+                    "instructor": f"{last}, {first} {middle}",
+                    "aprec": str(round(100 * grades[0] / total, 1)),
+                    "bprec": str(round(100 * grades[1] / total, 1)),
+                    "cprec": str(round(100 * grades[2] / total, 1)),
+                    "dprec": str(round(100 * grades[3] / total, 1)),
+                    "fprec": str(round(100 * grades[4] / total, 1)),
+                })
+        groups[code] = sections
+
+    # Most instructors are on a faculty page, a few are missing and a few are listed twice
+    faculty = []
+    for last, first, middle, dept in people:
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        faculty.append({"name": f"{last}, {first} {middle}.", "department": dept})
+        if roll > 0.97:
+            faculty.append({"name": f"{last}, {first} {middle}.", "department": rng.choice(DEPARTMENTS)})
+
+    pages = {dept: department_page(rng, dept, members, course_codes) for dept, members in by_department.items()}
+    return {"groups": groups, "faculty": faculty, "pages": pages}
+
+
+def department_page(rng, dept, members, course_codes):
+    """
+    Builds a catalog department page listing members the way the archived pages do.
+    """
+    entries = "".join(
+        f"<p>{first} {middle}. {last}, {rng.choice(TITLES)} ({dept.lower()}). "
+        f"B.S., {rng.randint(1970, 2000)}, Oregon; Ph.D., {rng.randint(1975, 2008)}, <em>Stanford</em>.</p>\n"
+        for last, first, middle, _ in members
+    )
+    courses = "".join(
+        f'<div class="courseblock"><p class="courseblocktitle"><strong>{code}. Topics. 4 Credits.</strong></p>'
+        f"<p>Prereq: instructor's consent &amp; junior standing.</p></div>\n"
+        for code in course_codes if code.startswith(dept)
+    )
+    navigation = "".join(f'<li><a href="/arts_sciences/{d.lower()}/">{d}</a></li>' for d in DEPARTMENTS * 10)
+    return (
+        f"<html><head><title>{dept}</title><script>var nav = '<p>';</script></head><body>"
+        f"<ul>{navigation}</ul><div id='textcontainer'><h2>Faculty</h2>\n{entries}</div>"
+        f"<div id='coursestextcontainer'>{courses}</div></body></html>"
+    )
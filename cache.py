@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+
+"""
+cache.py
+
+In-process LRU/TTL cache for user page query results.
+Entries are keyed by the normalized request filters and tagged with the data version
+kept by DataLoader, so any admin load, merge or clear invalidates everything at once.
+Hit, miss and eviction counters are kept so the cache can be sized.
+"""
+
+# Request args that change what the user page shows
+KEY_ARGS = ("department", "class", "teacher", "level", "grade")
+
+
+class QueryCache:
+    """
+    A thread safe least recently used cache with a time to live and a data version.
+
+    ...
+
+    Attributes
+    ----------
+    max_entries : int
+        Maximum number of entries kept before the least recently used one is evicted.
+    ttl : float
+        Seconds an entry stays valid.
+
+
+    Methods
+    -------
+    make_key(args, scope, extra=()):
+        Builds a cache key from the request args.
+
+    get(key, version):
+        Returns the cached value or None.
+
+    set(key, value, version):
+        Stores a value computed for the given data version.
+
+    stats():
+        Returns the hit/miss/eviction counters.
+    """
+
+
+    def __init__(self, max_entries=256, ttl=300, clock=time.monotonic):
+        """
+        Initializes an empty cache.
+
+        Parameters:
+            max_entries (int): Maximum number of entries.
+            ttl (float): Seconds an entry stays valid.
+            clock (callable): Time source, replaceable in tests.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+
+    @staticmethod
+    def make_key(args, scope="user", extra=()):
+        """
+        Builds a cache key from the request args. Values are stripped and the grade is
+        upper-cased so equivalent requests share an entry.
+
+        Parameters:
+            args (dict): Request args.
+            scope (str): Name of the view the value belongs to.
+            extra (tuple): Names of view specific args to include besides KEY_ARGS.
+
+        Returns:
+            tuple: Hashable cache key.
+        """
+        values = []
+        for name in KEY_ARGS + tuple(extra):
+            value = (args.get(name) or "").strip()
+            if name == "grade":
+                value = value.upper() or "A"
+            values.append(value)
+        return (scope,) + tuple(values)
+
+
+    def _check_version(self, version):
+        # A new data version makes every stored entry stale
+        if version != self._version:
+            if self._entries:
+                self._counters["invalidations"] += 1
+            self._entries.clear()
+            self._version = version
+
+
+    def get(self, key, version):
+        """
+        Returns the cached value for key if it was computed for this data version and has not expired.
+
+        Parameters:
+            key (tuple): Key from make_key.
+            version (int): Current data version.
+
+        Returns:
+            object: The cached value, or None on a miss.
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+
+            expires_at, value = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+
+    def set(self, key, value, version):
+        """
+        Stores a value, evicting the least recently used entries when full.
+
+        Parameters:
+            key (tuple): Key from make_key.
+            value (object): Value to cache.
+            version (int): Data version the value was computed from.
+        """
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, expirations, invalidations, size and limits.
+        """
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return dict(
+                self._counters,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                ttl=self.ttl,
+                data_version=self._version,
+                hit_rate=self._counters["hits"] / lookups if lookups else 0.0,
+            )
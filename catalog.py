@@ -0,0 +1,146 @@
+from data_loader import name_key
+
+"""
+catalog.py
+
+Builds and reads the precomputed filter catalog used by the user page dropdowns.
+The catalog is a single document in the `catalog` collection holding every teacher
+and natural sciences class together with the classes/teachers they are linked to.
+It is rebuilt with one aggregation pass over the grades collection whenever the
+admin page changes the data, so the user page only needs a single lookup.
+Teachers are the grade instructors joined to the faculty on name_key, the same join
+merge_faculty_with_grades does, so "Doe, John A." in the grades matches "Doe, John" on a
+faculty page. A teacher listed in several departments has no single department.
+"""
+
+CATALOG_ID = "filters"
+
+
+class FilterCatalog:
+    """
+    A class to build and read the materialized dropdown catalog for the user page.
+
+    ...
+
+    Attributes
+    ----------
+    db : pymongo.database.Database
+        The MongoDB database connection.
+    NATURAL_SCIENCES_DEPARTMENTS : dict
+        A mapping of department codes to full department names.
+
+
+    Methods
+    -------
+    rebuild():
+        Recomputes the catalog from the grades and faculty collections and stores it.
+
+    document():
+        Returns the stored catalog document, building it if needed.
+
+    load():
+        Returns the stored catalog as the dropdown maps.
+    """
+
+
+    def __init__(self, db, NATURAL_SCIENCES_DEPARTMENTS):
+        """
+        Initializes the catalog with the database and the natural sciences departments.
+
+        Parameters:
+            db (pymongo.database.Database): The MongoDB database connection.
+            NATURAL_SCIENCES_DEPARTMENTS (dict): Mapping of department codes to full department names.
+        """
+        self.db = db
+        self.NATURAL_SCIENCES_DEPARTMENTS = NATURAL_SCIENCES_DEPARTMENTS
+
+
+    def rebuild(self):
+        """
+        Recomputes the catalog and replaces the stored catalog document.
+        Both the course -> instructors and instructor -> courses groupings are
+        computed server side in a single $facet aggregation over grades.
+
+        Returns:
+            dict: The catalog document that was stored.
+        """
+        pipeline = [
+            {"$facet": {
+                "classes": [
+                    {"$match": {"dept": {"$in": list(self.NATURAL_SCIENCES_DEPARTMENTS)}}},
+                    {"$group": {"_id": "$course", "dept": {"$first": "$dept"}, "teachers": {"$addToSet": "$instructor"}}},
+                ],
+                "instructors": [
+                    {"$group": {"_id": "$instructor", "name_key": {"$first": "$name_key"}, "classes": {"$addToSet": "$course"}}},
+                ],
+            }}
+        ]
+        facets = next(iter(self.db.grades.aggregate(pipeline)), {"classes": [], "instructors": []})
+
+        # name_key -> {instructor name as written in the grades: classes}
+        instructors_by_key = {}
+        for doc in facets["instructors"]:
+            key = doc.get("name_key") or name_key(doc["_id"])
+            instructors_by_key.setdefault(key, {})[doc["_id"]] = sorted(doc["classes"])
+
+        # Faculty departments and display name per name_key
+        faculty_departments, faculty_names = {}, {}
+        for doc in self.db.faculty.find({}, {"name": 1, "name_key": 1, "department": 1}):
+            key = doc.get("name_key") or name_key(doc.get("name"))
+            faculty_departments.setdefault(key, set()).add(doc.get("department") or "Unknown")
+            faculty_names.setdefault(key, doc.get("name", "Unknown"))
+
+        # Faculty without grades are still listed under their faculty name
+        teachers = []
+        for key, departments in faculty_departments.items():
+            for name, classes in (instructors_by_key.get(key) or {faculty_names[key]: []}).items():
+                teachers.append({
+                    "name": name,
+                    "department": next(iter(departments)) if len(departments) == 1 else None,
+                    "departments": sorted(departments),
+                    "classes": classes,
+                })
+        teachers.sort(key=lambda teacher: teacher["name"])
+
+        classes = []
+        for doc in sorted(facets["classes"], key=lambda d: d["_id"]):
+            classes.append({
+                "course": doc["_id"],
+                "department": doc["dept"],
+                "teachers": sorted(doc["teachers"]),
+            })
+
+        catalog = {"_id": CATALOG_ID, "teachers": teachers, "classes": classes}
+        self.db.catalog.replace_one({"_id": CATALOG_ID}, catalog, upsert=True)
+        return catalog
+
+
+    def document(self):
+        """
+        Reads the stored catalog document, building it first if it does not exist yet.
+
+        Returns:
+            dict: The catalog document with its "teachers" and "classes" lists.
+        """
+        catalog = self.db.catalog.find_one({"_id": CATALOG_ID})
+        if catalog is None:
+            catalog = self.rebuild()
+        return catalog
+
+
+    def load(self):
+        """
+        Reads the stored catalog with a single lookup, building it first if it does not exist yet.
+
+        Returns:
+            dict: Teachers, classes and the four dropdown maps used by user_page.html.
+        """
+        catalog = self.document()
+        return {
+            "teachers": [t["name"] for t in catalog["teachers"]],
+            "classes": [c["course"] for c in catalog["classes"]],
+            "teacher_department_map": {t["name"]: t["department"] for t in catalog["teachers"]},
+            "teacher_classes_map": {t["name"]: ';'.join(t["classes"]) for t in catalog["teachers"]},
+            "class_department_map": {c["course"]: c["department"] for c in catalog["classes"]},
+            "class_teachers_map": {c["course"]: ';'.join(c["teachers"]) for c in catalog["classes"]},
+        }
@@ -0,0 +1,221 @@
+import threading
+from array import array
+from data_loader import GRADE_FIELDS, name_key
+
+try:
+    import numpy as np
+except ImportError:  # The store is optional, the app falls back to the rollup collections
+    np = None
+
+"""
+columnar.py
+
+Optional in-process columnar copy of the grades collection for the distribution views.
+Each grade field is a float32 array and course, instructor, term and dept are categorical
+int32 codes into a list of labels, so a section costs about 40 bytes instead of a decoded
+BSON dict. Filters are array comparisons and the per group averages are np.bincount
+reductions, so a user page miss needs no MongoDB round trip once the store is loaded.
+The store is reloaded whenever the DataLoader data version changes.
+Enabled with COLUMNAR_STORE, needs numpy.
+"""
+
+CATEGORICAL_FIELDS = ("course", "instructor", "term", "dept")
+UNKNOWN_LABEL = "Unknown"
+
+
+class ColumnarGrades:
+    """
+    A class holding the grade sections as NumPy columns and answering distribution queries.
+
+    ...
+
+    Attributes
+    ----------
+    db : pymongo.database.Database
+        The MongoDB database connection.
+    version : int
+        Data version the columns were loaded from, None before the first load.
+    size : int
+        Number of sections held.
+    labels : dict
+        Categorical field -> list of labels, indexed by code.
+
+
+    Methods
+    -------
+    available():
+        Returns whether numpy is installed.
+
+    load(version):
+        Reads every grade section into columns.
+
+    ensure_current(version):
+        Reloads the columns if they were loaded from another data version.
+
+    distribution(query, group_by, version):
+        Averages the grade fields per group, like aggregations.rollup_distribution.
+
+    nbytes():
+        Returns the memory held by the columns.
+    """
+
+
+    def __init__(self, db, batch_size=5000):
+        """
+        Initializes an empty store.
+
+        Parameters:
+            db (pymongo.database.Database): The MongoDB database connection.
+            batch_size (int): Documents per round trip while loading.
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.version = None
+        self.size = 0
+        self.labels = {field: [] for field in CATEGORICAL_FIELDS}
+        self._codes = {}
+        self._grades = {}
+        self._level = None
+        self._lookup = {field: {} for field in CATEGORICAL_FIELDS}
+        self._name_keys = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+
+    @staticmethod
+    def available():
+        """
+        Returns whether numpy is installed.
+        """
+        return np is not None
+
+
+    def load(self, version):
+        """
+        Reads every grade section into columns, replacing the current ones.
+        The columns are filled through compact array.array buffers, so the load never
+        holds more than one batch of decoded documents.
+
+        Parameters:
+            version (int): Data version being loaded.
+        """
+        lookup = {field: {} for field in CATEGORICAL_FIELDS}
+        labels = {field: [] for field in CATEGORICAL_FIELDS}
+        codes = {field: array("i") for field in CATEGORICAL_FIELDS}
+        grades = {field: array("f") for field in GRADE_FIELDS}
+        level = array("h")
+
+        projection = {"_id": 0, "level": 1}
+        projection.update({field: 1 for field in CATEGORICAL_FIELDS + GRADE_FIELDS})
+        for doc in self.db.grades.find({}, projection).batch_size(self.batch_size):
+            for field in CATEGORICAL_FIELDS:
+                value = doc.get(field)
+                code = lookup[field].get(value)
+                if code is None:
+                    code = lookup[field][value] = len(labels[field])
+                    labels[field].append(value)
+                codes[field].append(code)
+            for field in GRADE_FIELDS:
+                grades[field].append(doc.get(field) or 0.0)
+            level.append(doc.get("level") or 0)
+
+        # Teacher filters match name_key, which maps to the codes of every instructor spelling
+        name_keys = {}
+        for code, instructor in enumerate(labels["instructor"]):
+            name_keys.setdefault(name_key(instructor), []).append(code)
+
+        with self._lock:
+            self._codes = {field: np.frombuffer(column, dtype=np.int32) for field, column in codes.items()}
+            self._grades = {field: np.frombuffer(column, dtype=np.float32) for field, column in grades.items()}
+            self._level = np.frombuffer(level, dtype=np.int16)
+            self._lookup = lookup
+            self._name_keys = name_keys
+            self.labels = labels
+            self.size = len(level)
+            self.version = version
+
+
+    def ensure_current(self, version):
+        """
+        Reloads the columns if they were loaded from another data version.
+        Only one thread reloads, requests arriving meanwhile wait for it instead of each
+        scanning the grades collection, and then find the columns current.
+
+        Parameters:
+            version (int): Current data version.
+        """
+        if self.version == version:
+            return
+        with self._reload_lock:
+            if self.version != version:
+                self.load(version)
+
+
+    def _mask(self, query):
+        # Equality filters from build_distribution_query, None when a value is not in the data
+        mask = np.ones(self.size, dtype=bool)
+        for field, value in query.items():
+            if field == "level":
+                mask &= self._level == value
+            elif field == "name_key":
+                instructors = self._name_keys.get(value)
+                if instructors is None:
+                    return None
+                mask &= np.isin(self._codes["instructor"], instructors)
+            elif field in self._lookup:
+                code = self._lookup[field].get(value)
+                if code is None:
+                    return None
+                mask &= self._codes[field] == code
+            else:
+                raise ValueError(f"Unsupported filter field: {field}")
+        return mask
+
+
+    def distribution(self, query, group_by, version=None):
+        """
+        Averages the grade fields of the matching sections per group.
+        Gives the same rows as aggregations.rollup_distribution, in no particular order.
+
+        Parameters:
+            query (dict): Query from build_distribution_query.
+            group_by (str): "course" or "instructor".
+            version (int): Current data version, the columns are reloaded if it changed.
+
+        Returns:
+            list: One dictionary per group with a "label", the section "count" and the average of each grade field.
+        """
+        if version is not None:
+            self.ensure_current(version)
+
+        with self._lock:
+            codes, grades, labels = self._codes, self._grades, self.labels
+            mask = self._mask(query)
+        if mask is None or not self.size:
+            return []
+
+        groups = codes[group_by][mask]
+        counts = np.bincount(groups, minlength=len(labels[group_by]))
+        present = np.nonzero(counts)[0]
+        averages = {
+            field: np.bincount(groups, weights=grades[field][mask], minlength=len(counts))[present] / counts[present]
+            for field in GRADE_FIELDS
+        }
+
+        results = []
+        for i, code in enumerate(present):
+            label = labels[group_by][code]
+            row = {"label": UNKNOWN_LABEL if label is None else label, "count": int(counts[code])}
+            row.update((field, float(averages[field][i])) for field in GRADE_FIELDS)
+            results.append(row)
+        return results
+
+
+    def nbytes(self):
+        """
+        Returns the memory held by the columns in bytes, labels not included.
+        """
+        columns = list(self._codes.values()) + list(self._grades.values())
+        if self._level is not None:
+            columns.append(self._level)
+        return sum(column.nbytes for column in columns)
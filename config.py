@@ -5,6 +5,71 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "defaultsecretkey")
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongo:27017/easya")
 
+    # User page query cache
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+    CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+
+    # Grade data ingest, bytes read per chunk and records per insert_many batch
+    INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "65536"))
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+
+    # Background admin jobs that can run at the same time
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+    # Jobs that change the data run one at a time, across all app processes. The lock they hold
+    # expires this long after the last progress report, in case the process holding it died
+    JOB_LOCK_SECONDS = int(os.getenv("JOB_LOCK_SECONDS", "3600"))
+
+    # Requests at least this slow are logged with their MongoDB commands, 0 turns the log off
+    SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+
+    # Easiest/hardest groups shown at each end of the user page chart and /api/leaderboard,
+    # the largest k a client may ask for, and the number of filter scopes kept sorted in memory
+    LEADERBOARD_K = int(os.getenv("LEADERBOARD_K", "10"))
+    LEADERBOARD_MAX_K = int(os.getenv("LEADERBOARD_MAX_K", "100"))
+    LEADERBOARD_MAX_BOARDS = int(os.getenv("LEADERBOARD_MAX_BOARDS", "256"))
+
+    # Typeahead results returned by /api/search/* by default and at most
+    SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "20"))
+    SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+
+    # Serve the distribution views from the in-process NumPy columns in columnar.py (needs numpy)
+    COLUMNAR_STORE = os.getenv("COLUMNAR_STORE", "false").lower() in ("1", "true", "yes")
+
+    # Static JSON export of every user page filter view after each ingest, see snapshots.py.
+    # Empty turns the export off, SNAPSHOT_WORKERS processes render the shards
+    SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+    SNAPSHOT_WORKERS = int(os.getenv("SNAPSHOT_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+    # HTTP caching of the user page and APIs: browser max-age and proxy s-maxage in seconds.
+    # ETags and Last-Modified follow the data version, ETAG_SALT changes them on a release
+    HTTP_MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "0"))
+    HTTP_SHARED_MAX_AGE = int(os.getenv("HTTP_SHARED_MAX_AGE", "60"))
+    ETAG_SALT = os.getenv("ETAG_SALT", "")
+
+    # Responses at least this large are gzip (or brotli) compressed, 0 turns compression off
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+    # MongoDB connection pool, one per app process. Every request thread and job thread
+    # borrows a connection, so MONGO_MAX_POOL_SIZE should cover WEB_THREADS + JOB_WORKERS
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "16"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
+    # Production WSGI server, see gunicorn.conf.py. Each worker is a separate process
+    # with WEB_THREADS request threads and its own MongoDB pool
+    WEB_BIND = os.getenv("WEB_BIND", "0.0.0.0:5000")
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(min(2 * (os.cpu_count() or 1) + 1, 8))))
+    WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))
+    WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "60"))
+    WEB_KEEPALIVE = int(os.getenv("WEB_KEEPALIVE", "5"))
+    WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+
 
 """
 from dotenv import load_dotenv
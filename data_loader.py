@@ -1,6 +1,248 @@
 import re
-from pymongo import UpdateOne 
-from flask import flash
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, ReturnDocument
+from flask import flash, has_request_context
+from indexes import INDEX_SPEC
+
+
+GRADE_FIELDS = ("aprec", "bprec", "cprec", "dprec", "fprec")
+
+# Rollup collection -> (fields identifying a rollup document, descriptive fields copied onto it)
+ROLLUPS = {
+    # Instructor rollups also carry name_key, which teacher filters match on
+    "rollup_course_instructor": (("course", "instructor"), ("dept", "level", "name_key")),
+    "rollup_course": (("course",), ("dept", "level")),
+    "rollup_department": (("dept",), ()),
+    # Per term rollups for the trend view
+    "rollup_term_course": (("course", "term_ord"), ("dept", "level", "term")),
+    "rollup_term_instructor": (("instructor", "term_ord"), ("term", "name_key")),
+}
+TERM_ROLLUPS = ("rollup_term_course", "rollup_term_instructor")
+
+# A grade section is identified by (course, term, crn); the content hash covers every stored value
+SECTION_KEY_FIELDS = ("course", "term", "crn")
+HASHED_FIELDS = SECTION_KEY_FIELDS + ("instructor",) + GRADE_FIELDS
+
+# Fields derived from the course code at ingest, so department and level filters are index seeks
+COURSE_FIELDS = ("dept", "course_num", "level")
+
+# Terms in calendar order within a year, "Fall 2013" -> 2013 * 4 + 3, so term_ord sorts and ranges
+TERM_SEASONS = ("Winter", "Spring", "Summer", "Fall")
+TERM_PATTERN = re.compile(r"\b(winter|spring|summer|fall)\b\D*(\d{4})", re.IGNORECASE)
+
+# Instructor names repeat across hundreds of thousands of sections, but there are only a few
+# thousand distinct ones, so name normalization is memoized with bounded caches
+NAME_CACHE_SIZE = 8192
+
+# Collections that make up one generation of grade data, swapped together on reload
+GENERATION_COLLECTIONS = ("grades",) + tuple(ROLLUPS)
+STAGING_PREFIX = "staging_"
+PREVIOUS_PREFIX = "previous_"
+
+
+# Per thread handler for messages reported outside a request (e.g. by background jobs)
+_report_handler = threading.local()
+
+
+def report(message, category="info"):
+    """
+    Reports a status message to the admin. Inside a request it is flashed on the admin page,
+    otherwise it goes to the handler installed with reporting_to, or is printed.
+
+    Parameters:
+        message (str): The message.
+        category (str): Bootstrap alert category (success, info, warning, danger).
+    """
+    if has_request_context():
+        flash(message, category)
+        return
+
+    handler = getattr(_report_handler, "handler", None)
+    if handler is not None:
+        handler(message, category)
+    else:
+        print(f"[{category}] {message}")
+
+
+@contextmanager
+def reporting_to(handler):
+    """
+    Sends report() messages from the current thread to handler(message, category).
+
+    Parameters:
+        handler (callable): Receives each reported message and category.
+    """
+    previous = getattr(_report_handler, "handler", None)
+    _report_handler.handler = handler
+    try:
+        yield
+    finally:
+        _report_handler.handler = previous
+
+
+def batched(iterable, size):
+    """
+    Groups an iterable into lists of at most size items.
+
+    Parameters:
+        iterable (iterable): Items to group.
+        size (int): Maximum number of items per list.
+
+    Yields:
+        list: The next batch of items.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def section_key(record):
+    """
+    Returns the (course, term, crn) key identifying a grade section.
+
+    Parameters:
+        record (dict): Grade record.
+
+    Returns:
+        tuple: The section key.
+    """
+    return tuple(record.get(field) for field in SECTION_KEY_FIELDS)
+
+
+def content_hash(record):
+    """
+    Hashes the stored values of a grade record so unchanged sections can be skipped on delta loads.
+
+    Parameters:
+        record (dict): Grade record.
+
+    Returns:
+        str: Hex digest of the record values.
+    """
+    values = [record.get(field) for field in HASHED_FIELDS]
+    return hashlib.sha1(json.dumps(values, separators=(",", ":")).encode()).hexdigest()
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def canonical_name(name):
+    """
+    Normalizes an instructor name for display by capitalizing the last and first names.
+
+    Parameters:
+        name (str): Instructor name, e.g. "DOE, JOHN A".
+
+    Returns:
+        str: Normalized name in the format "Last, First".
+    """
+    if not name:
+        return ""
+    parts = name.strip().lower().split(',')
+    last_name = parts[0].strip().capitalize()
+    first_name = parts[1].strip().split()[0].capitalize() if len(parts) > 1 and parts[1].split() else ''
+    return f"{last_name}, {first_name}"
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def name_key(name):
+    """
+    Returns the key used to join and look up people by name, stored as `name_key` on
+    grades and faculty. Grade data writes names as "Last, First Middle" and the scraper
+    formats them the same way, but without a comma the last word is taken as the last name.
+
+    Parameters:
+        name (str): Name in any of those formats, e.g. "Doe, John A." or "John A. Doe".
+
+    Returns:
+        str: Lowercase "last, first" (e.g., "doe, john"), or "" for an empty name.
+    """
+    words = (name or "").replace(".", " ").lower()
+    if "," in words:
+        last, _, first = words.partition(",")
+    else:
+        *first, last = words.split() or [""]
+        first = " ".join(first)
+    last = " ".join(last.split())
+    first = first.split()
+    return f"{last}, {first[0]}" if first else last
+
+
+def match_faculty(faculty, grade):
+    """
+    Finds the faculty listing of a grade record. A name listed in several departments is
+    resolved by the department of the course.
+
+    Parameters:
+        faculty (dict): Output of DataLoader.faculty_by_key.
+        grade (dict): Grade record with instructor (or name_key) and course (or dept).
+
+    Returns:
+        tuple: ("matched", (department, course_number)), or ("unmatched", None) / ("ambiguous", None).
+    """
+    # Grades loaded before name_key existed get their key computed here
+    candidates = faculty.get(grade.get("name_key") or name_key(grade.get("instructor")))
+    if not candidates:
+        return "unmatched", None
+    if len(candidates) > 1:
+        dept = grade.get("dept") or split_course_code(grade.get("course"))[0]
+        candidates = {candidate for candidate in candidates if candidate[0] == dept}
+        if len(candidates) != 1:
+            return "ambiguous", None
+    return "matched", next(iter(candidates))
+
+
+@lru_cache(maxsize=256)
+def term_ordinal(term):
+    """
+    Converts a term description into a sortable number.
+
+    Parameters:
+        term (str): Term description (e.g., 'Fall 2013').
+
+    Returns:
+        int: year * 4 + season (Winter 0 .. Fall 3), e.g. 8055 for 'Fall 2013'.
+             None when the text has no season and year.
+    """
+    match = TERM_PATTERN.search(term or "")
+    if not match:
+        return None
+    season, year = match.groups()
+    return int(year) * len(TERM_SEASONS) + TERM_SEASONS.index(season.capitalize())
+
+
+def term_label(ordinal):
+    """
+    Converts a term ordinal back into its description, e.g. 8055 -> 'Fall 2013'.
+    """
+    year, season = divmod(ordinal, len(TERM_SEASONS))
+    return f"{TERM_SEASONS[season]} {year}"
+
+
+def split_course_code(course):
+    """
+    Splits a course code into its department, course number and level.
+
+    Parameters:
+        course (str): Course code (e.g., 'CIS210').
+
+    Returns:
+        tuple: Department (e.g., 'CIS'), course number (e.g., '210') and level (e.g., 200).
+               The number and level are None when the code has no digits.
+    """
+    match = re.match(r'^([A-Za-z]*)\s*(\d+)?', course or "")
+    dept, number = match.groups()
+    level = int(number[0]) * 100 if number else None
+    return dept, number, level
 
 class DataLoader:
     """
@@ -36,12 +278,51 @@ class DataLoader:
         Inserts scraped faculty data into the MongoDB faculty collection.
         Normalizes faculty names before insertion. 
         
-    merge_faculty_with_grades():
+    merge_faculty_with_grades(batch_size=5000):
         Merges faculty data into the grades collection by associating instructors
-        with their respective departments and course numbers.
+        with their respective departments and course numbers, in one pass over the grades.
+
+    iter_course_records(groups):
+        Generator version of transform_course_data that yields one record at a time.
+
+    backfill_course_fields():
+        Adds dept, course_num and level to grade records loaded before those fields existed.
+
+    backfill_terms():
+        Adds term_ord to older grade records and builds the per term rollups if they are missing.
+
+    replace_grade_records(records, batch_size=5000, progress=None):
+        Stages new grade records and their rollups, then swaps them in for the live collections.
+
+    rollback_grade_records():
+        Swaps the previous generation of grade data back in.
+
+    apply_grade_delta(records, remove_missing=False, batch_size=5000, progress=None):
+        Inserts new and updates changed sections by (course, term, crn), skipping unchanged ones.
+
+    update_rollups(records, sign=1, prefix="", names=tuple(ROLLUPS)):
+        Adds (or with sign=-1 removes) grade records to the rollup collections.
+
+    clear_rollups():
+        Removes every rollup document.
+
+    add_change_listener(callback):
+        Registers a callback that runs whenever the data changes, before the version is bumped.
+
+    bump_data_version():
+        Increments the data version so cached user page results are invalidated.
+
+    get_data_version():
+        Returns the current data version.
+
+    get_data_state():
+        Returns the current data version and when it was set.
 
     clear_all_collections():
         Clears all records from the grades and faculty collections in MongoDB.
+
+    Status messages go through report(), which flashes them inside a request and hands
+    them to the running job otherwise.
     """
 
 
@@ -56,6 +337,7 @@ class DataLoader:
         """
         self.db = db
         self.NATURAL_SCIENCES_DEPARTMENTS = NATURAL_SCIENCES_DEPARTMENTS
+        self.change_listeners = []
 
     
     def clean_instructor_names(self, instructor_list):
@@ -120,43 +402,7 @@ class DataLoader:
         Returns:
             str: Normalized name in the format "Last Name, First Name".
         """
-        if not name:
-            return ""
-        parts = name.strip().lower().split(',')
-        last_name = parts[0].strip().capitalize()
-        first_name = parts[1].strip().split()[0].capitalize() if len(parts) > 1 else ''
-        return f"{last_name}, {first_name}"
-
-
-    def transform_course_data(self, groups):
-        """
-        Transforms the JSON course data that will be inputed from the admin page to be compatiable for 
-        MongoDB insertion.
-
-        Parameters:
-            groups (dict): JSON-like dictionary containing historical course data.
-
-        Returns:
-            list: A list of formatted course records for database insertion.
-        """
-        records = []
-
-        for course, details in groups.items():
-            for entry in details:
-                records.append({
-                    "course": course,
-                    "term": entry.get("TERM_DESC", ""),
-                    "aprec": float(entry.get("aprec", 0.0)),
-                    "bprec": float(entry.get("bprec", 0.0)),
-                    "cprec": float(entry.get("cprec", 0.0)),
-                    "crn": entry.get("crn", "N/A"),
-                    "dprec": float(entry.get("dprec", 0.0)),
-                    "fprec": float(entry.get("fprec", 0.0)),
-                    "instructor": entry.get("instructor", "Unknown"),
-                })
-                
-        return records 
-
+        return canonical_name(name)
 
 
     # DATABASE SECTION, possibly make into seperate class or file
@@ -169,48 +415,56 @@ class DataLoader:
 
         Parameters:
             faculty_data (list): List of dictionaries containing faculty details.
+
+        Returns:
+            int: Number of faculty records written.
         """
+        # Records written before name_key existed would not match the upserts below
+        self.backfill_faculty_keys()
         bulk_operations = []
 
         for entry in faculty_data:
 
             course_num = entry.get("course_number", None)
             name = self.normalize_name(entry.get("name", "Unknown"))
+            key = name_key(entry.get("name", "Unknown"))
             department = entry.get("department", "Unknown")
             # print("Inserting entry:", entry)
             # print("INSERTING COURSE:", entry.get("course"))
 
             bulk_operations.append(
                 UpdateOne(
-                    {"name": name, "department": department, "course_number": course_num},
-                    {"$set": {"name": name, "department": department, "course_number": course_num}},
+                    {"name_key": key, "department": department, "course_number": course_num},
+                    {"$set": {"name": name, "name_key": key, "department": department, "course_number": course_num}},
                     upsert=True
                 )
             )
 
         if bulk_operations:
             self.db.faculty.bulk_write(bulk_operations, ordered=False)
-            flash(f"Successfully merged {len(bulk_operations)} faculty records.", "success")
+            self.bump_data_version()
+            report(f"Successfully merged {len(bulk_operations)} faculty records.", "success")
         else:
-            flash("No faculty data found.", "warning")
+            report("No faculty data found.", "warning")
 
+        return len(bulk_operations)
 
-    def transform_course_data(self, groups):
+
+    def iter_course_records(self, groups):
         """
-        Transforms raw JSON course data into a structured format for MongoDB.
+        Generator version of transform_course_data. Yields one formatted record at a time
+        so ingest can stream course groups straight from the remote file.
 
         Parameters:
-            groups (dict): JSON-like dictionary containing course data.
+            groups (iterable): (course, sections) pairs, e.g. groups.items() or grade_stream.iter_course_groups().
 
-        Returns:
-            list: A list of formatted course records for database insertion.
+        Yields:
+            dict: A formatted course record for database insertion.
         """
-        records = []
-
-        for course, details in groups.items():
+        for course, details in groups:
             for entry in details:
                 instructor = self.normalize_name(entry.get("instructor", "Unknown"))
-                records.append({
+                record = {
                     "course": course,
                     "term": entry.get("TERM_DESC", ""),
                     "aprec": float(entry.get("aprec", 0.0)),
@@ -220,42 +474,533 @@ class DataLoader:
                     "dprec": float(entry.get("dprec", 0.0)),
                     "fprec": float(entry.get("fprec", 0.0)),
                     "instructor": instructor,
-                })
+                    "name_key": name_key(instructor),
+                }
+                record["term_ord"] = term_ordinal(record["term"])
+                record.update(zip(COURSE_FIELDS, split_course_code(course)))
+                record["content_hash"] = content_hash(record)
+                yield record
 
-        return records
 
+    def transform_course_data(self, groups):
+        """
+        Transforms raw JSON course data into a structured format for MongoDB.
 
-    def merge_faculty_with_grades(self):
+        Parameters:
+            groups (dict): JSON-like dictionary containing course data.
+
+        Returns:
+            list: A list of formatted course records for database insertion.
+        """
+        return list(self.iter_course_records(groups.items()))
+
+
+    def backfill_course_fields(self):
+        """
+        Adds dept, course_num and level to grade records loaded before those fields existed.
+        One UpdateMany per course, records that already have them are not touched.
+
+        Returns:
+            int: Number of grade records updated.
+        """
+        missing = {"dept": {"$exists": False}}
+        updated = 0
+        for course in self.db.grades.distinct("course", missing):
+            fields = dict(zip(COURSE_FIELDS, split_course_code(course)))
+            updated += self.db.grades.update_many({"course": course, **missing}, {"$set": fields}).modified_count
+        return updated
+
+
+    def backfill_faculty_keys(self):
+        """
+        Adds name_key to faculty records written before it existed, then removes duplicates of
+        (name_key, department, course_number), which a scrape upserting on name_key made of them.
+        The most recently written record of each is kept.
+
+        Returns:
+            dict: Number of faculty records keyed and duplicates removed.
+        """
+        counts = {"keyed": 0, "duplicates": 0}
+        missing = {"name_key": {"$exists": False}}
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"name_key": name_key(doc.get("name"))}})
+            for doc in self.db.faculty.find(missing, {"name": 1})
+        ]
+        if not operations:
+            return counts
+        counts["keyed"] = self.db.faculty.bulk_write(operations, ordered=False).modified_count
+
+        seen, duplicates = set(), []
+        projection = {"name_key": 1, "department": 1, "course_number": 1}
+        for doc in self.db.faculty.find({}, projection).sort("_id", -1):
+            key = (doc.get("name_key"), doc.get("department"), doc.get("course_number"))
+            if key in seen:
+                duplicates.append(doc["_id"])
+            seen.add(key)
+        if duplicates:
+            counts["duplicates"] = self.db.faculty.delete_many({"_id": {"$in": duplicates}}).deleted_count
+
+        self.bump_data_version()
+        return counts
+
+
+    def backfill_instructor_keys(self):
+        """
+        Adds name_key to grade records and instructor rollups written before it existed.
+        One UpdateMany per instructor, records that already have it are not touched.
+
+        Returns:
+            int: Number of grade and rollup documents updated.
+        """
+        missing = {"name_key": {"$exists": False}}
+        updated = 0
+        for collection in ("grades", "rollup_course_instructor", "rollup_term_instructor"):
+            for instructor in self.db[collection].distinct("instructor", missing):
+                updated += self.db[collection].update_many(
+                    {"instructor": instructor, **missing}, {"$set": {"name_key": name_key(instructor)}}
+                ).modified_count
+        if updated:
+            self.bump_data_version()
+        return updated
+
+
+    def backfill_terms(self, batch_size=5000):
+        """
+        Adds term_ord to grade records loaded before it existed, one UpdateMany per term,
+        then builds the per term rollups from the grades if they are empty.
+
+        Parameters:
+            batch_size (int): Grade records summed per rollup write.
+
+        Returns:
+            dict: Number of grade records updated and of records added to the term rollups.
+        """
+        missing = {"term_ord": {"$exists": False}}
+        counts = {"updated": 0, "rolled_up": 0}
+        for term in self.db.grades.distinct("term", missing):
+            counts["updated"] += self.db.grades.update_many(
+                {"term": term, **missing}, {"$set": {"term_ord": term_ordinal(term)}}
+            ).modified_count
+
+        if not any(self.db[name].find_one({}, {"_id": 1}) for name in TERM_ROLLUPS):
+            projection = {"_id": 0, "course": 1, "instructor": 1, "term": 1, "term_ord": 1, "dept": 1, "level": 1}
+            projection.update({field: 1 for field in GRADE_FIELDS})
+            for batch in batched(self.db.grades.find({}, projection), batch_size):
+                self.update_rollups(batch, names=TERM_ROLLUPS)
+                counts["rolled_up"] += len(batch)
+
+        if counts["rolled_up"]:
+            self.bump_data_version()
+        return counts
+
+
+    def faculty_by_key(self):
+        """
+        Loads the faculty collection as the build side of the faculty join, see match_faculty.
+
+        Returns:
+            dict: name_key -> set of (department, course_number) listed for that name.
+        """
+        faculty = {}
+        for record in self.db.faculty.find({}, {"_id": 0, "name": 1, "name_key": 1, "department": 1, "course_number": 1}):
+            key = record.get("name_key") or name_key(record.get("name"))
+            faculty.setdefault(key, set()).add((record.get("department"), record.get("course_number")))
+        return faculty
+
+
+    def merge_faculty_with_grades(self, batch_size=5000):
         """
         Merges faculty data into the grades collection by associating instructors
         with their respective departments and course numbers.
+        Done as one hash join on name_key: the faculty collection is loaded into a dictionary,
+        grades are streamed once and every grade document that needs a change is written
+        exactly once, with UpdateMany calls grouped by the values being set.
+        A name listed in several departments is resolved by the department of the course,
+        otherwise the grade documents are left as they are and counted as ambiguous.
+
+        Parameters:
+            batch_size (int): Maximum number of grade ids per UpdateMany.
+
+        Returns:
+            dict: Counts of matched, unmatched, ambiguous and modified grade records.
         """
+        counts = {"matched": 0, "unmatched": 0, "ambiguous": 0, "modified": 0}
         try:
-            faculty_records = list(self.db.faculty.find())
-            updates = []
-
-            for record in faculty_records:
-                name = record["name"]  
-                department = record.get("department", None)
-                course_num = record.get("course_number", None)
-
-                updates.append(
-                    UpdateOne(
-                        {"instructor": name},
-                        {"$set": {"department": department, "course_number": course_num}},
-                        upsert=False
-                    )
-                )
+            faculty = self.faculty_by_key()
+            if not faculty:
+                report("No faculty data to merge, scrape faculty first.", "info")
+                return counts
+
+            # (department, course_number) -> ids of the grade documents to set it on
+            targets = {}
+            projection = {"instructor": 1, "name_key": 1, "course": 1, "dept": 1, "department": 1, "course_number": 1}
+            for grade in self.db.grades.find({}, projection):
+                outcome, target = match_faculty(faculty, grade)
+                counts[outcome] += 1
+                if target is not None and (grade.get("department"), grade.get("course_number")) != target:
+                    targets.setdefault(target, []).append(grade["_id"])
+
+            updates = [
+                UpdateMany({"_id": {"$in": ids}}, {"$set": {"department": department, "course_number": course_num}})
+                for (department, course_num), grade_ids in targets.items()
+                for ids in batched(grade_ids, batch_size)
+            ]
+            for batch in batched(updates, 1000):
+                counts["modified"] += self.db.grades.bulk_write(batch, ordered=False).modified_count
+
+            if counts["modified"]:
+                self.bump_data_version()
+            report(
+                f"Merged faculty data into {counts['matched']} grade records ({counts['modified']} changed), "
+                f"{counts['unmatched']} had no faculty match and {counts['ambiguous']} were ambiguous.",
+                "success"
+            )
+
+        except Exception as e:
+            report(f"Error merging faculty with grades: {e}", "danger")
+
+        return counts
+
+
+    def replace_grade_records(self, records, batch_size=5000, progress=None):
+        """
+        Replaces the grades collection with new records and rebuilds the rollups from them.
+        Records are written in bounded insert_many batches into staging collections, which get
+        their indexes and are then renamed over the live ones, so readers never see a partly
+        loaded dataset. A copy of the replaced generation is kept for rollback_grade_records.
+
+        Parameters:
+            records (iterable): Formatted course records from transform_course_data or iter_course_records.
+            batch_size (int): Maximum number of records per insert_many call.
+            progress (callable): Optional, called with the number of records staged after each batch.
+
+        Returns:
+            int: Number of records inserted.
+        """
+        # Leftovers of an earlier failed load
+        for name in GENERATION_COLLECTIONS:
+            self.db.drop_collection(STAGING_PREFIX + name)
+
+        # Every batch upserts into the staging rollups by their key, so those need their indexes
+        # from the start, while the grades indexes are cheaper to build once after the bulk insert
+        for name in ROLLUPS:
+            for keys in INDEX_SPEC.get(name, []):
+                self.db[STAGING_PREFIX + name].create_index(keys)
+
+        staging = self.db[STAGING_PREFIX + "grades"]
+        inserted = 0
+        for batch in batched(records, batch_size):
+            staging.insert_many(batch)
+            self.update_rollups(batch, prefix=STAGING_PREFIX)
+            inserted += len(batch)
+            if progress:
+                progress(inserted)
+
+        for keys in INDEX_SPEC.get("grades", []):
+            staging.create_index(keys)
+
+        self._copy_generation(PREVIOUS_PREFIX)
+        self._rename_generation(STAGING_PREFIX)
+        self.bump_data_version()
+        return inserted
+
+
+    def rollback_grade_records(self):
+        """
+        Swaps the previous generation of grade data back in. Calling it again undoes the rollback.
+
+        Returns:
+            bool: False if there is no previous generation to roll back to.
+        """
+        if PREVIOUS_PREFIX + "grades" not in self.db.list_collection_names():
+            return False
+
+        # The live generation is copied aside, then becomes the previous one once the old is back
+        self._copy_generation(STAGING_PREFIX)
+        self._rename_generation(PREVIOUS_PREFIX)
+        self._rename_generation(STAGING_PREFIX, PREVIOUS_PREFIX)
+        self.bump_data_version()
+        return True
 
-            if updates:
-                result = self.db.grades.bulk_write(updates, ordered=False)
-                flash(f"Merged {result.modified_count} grade records with faculty data.", "success")
+
+    def _copy_generation(self, target_prefix):
+        """
+        Copies the live generation to target_prefix with a server side $out, and gives the copies
+        the live indexes so they can be renamed back in. Costs a pass over the data, which the
+        data lock keeps from changing meanwhile (see jobs.JobRunner).
+
+        Parameters:
+            target_prefix (str): Prefix of the copy, an existing copy is replaced.
+
+        Returns:
+            bool: False if there is no live generation to copy.
+        """
+        existing = set(self.db.list_collection_names())
+        if "grades" not in existing:
+            return False
+
+        for name in GENERATION_COLLECTIONS:
+            target = target_prefix + name
+            self.db.drop_collection(target)
+            if name in existing:
+                self.db[name].aggregate([{"$out": target}])
+            # Also creates an empty copy of a live collection that does not exist yet
+            for keys in INDEX_SPEC.get(name, []):
+                self.db[target].create_index(keys)
+        return True
+
+
+    def _rename_generation(self, source_prefix, target_prefix=""):
+        """
+        Renames every collection of a generation over another, the live one by default.
+        Each rename replaces its target in one step (dropTarget), so readers never find a
+        live collection missing or empty, and only touches metadata, so it does not depend
+        on the data size. The collections are still renamed one after the other: until the
+        last rename a reader can see the new grades next to old rollups. The data version is
+        bumped after the last one, so nothing cached during the swap outlives it.
+
+        Parameters:
+            source_prefix (str): Prefix of the generation to move.
+            target_prefix (str): Prefix of the generation it replaces, "" for the live collections.
+        """
+        existing = set(self.db.list_collection_names())
+        for name in GENERATION_COLLECTIONS:
+            source = source_prefix + name
+            if source not in existing:
+                # e.g. a previous generation kept before this rollup existed
+                self.db.create_collection(source)
+            self.db[source].rename(target_prefix + name, dropTarget=True)
+
+
+    def apply_grade_delta(self, records, remove_missing=False, batch_size=5000, progress=None, affected=None):
+        """
+        Applies new grade data on top of the live grades instead of replacing them.
+        Sections are matched on (course, term, crn): unchanged ones (same content hash) are skipped,
+        new and changed ones are written in bulk, and the rollups are adjusted by the difference.
+        New and changed sections are joined with the faculty collection on the way in, as
+        merge_faculty_with_grades would, so their department and course_number stay current.
+
+        Parameters:
+            records (iterable): Formatted course records from iter_course_records.
+            remove_missing (bool): Also delete live sections that are not in records.
+            batch_size (int): Maximum number of records per bulk write.
+            progress (callable): Optional, called with the counts so far after each batch.
+            affected (dict): Optional, filled with the "courses" and "instructors" sets of the
+                             sections that were added, changed (old and new values) or removed.
+
+        Returns:
+            dict: Counts of inserted, updated, unchanged, removed and duplicate sections, and of
+                  written sections left "unmerged" for lack of a single faculty match.
+        """
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "removed": 0, "duplicates": 0, "unmerged": 0}
+        faculty = self.faculty_by_key()
+
+        def adjust_rollups(changed, sign=1):
+            if affected is not None:
+                for record in changed:
+                    affected.setdefault("courses", set()).add(record.get("course"))
+                    affected.setdefault("instructors", set()).add(record.get("instructor"))
+            self.update_rollups(changed, sign=sign)
+
+        # Only the keys and hashes of the live sections are read
+        existing = {}
+        projection = {field: 1 for field in SECTION_KEY_FIELDS}
+        projection["content_hash"] = 1
+        for doc in self.db.grades.find({}, projection):
+            existing[section_key(doc)] = (doc["_id"], doc.get("content_hash"))
+        seen = set()
+
+        for batch in batched(records, batch_size):
+            if progress:
+                progress(counts)
+            operations, added, changed_ids = [], [], []
+
+            for record in batch:
+                record.setdefault("content_hash", content_hash(record))
+                key = section_key(record)
+                if key in seen:
+                    # The same section listed twice in the new data, the first one wins
+                    counts["duplicates"] += 1
+                    continue
+                seen.add(key)
+                current = existing.get(key)
+                if current is not None and current[1] == record["content_hash"]:
+                    counts["unchanged"] += 1
+                    continue
+
+                # The merge fields are not part of the content hash, a changed section may have a new instructor
+                _, target = match_faculty(faculty, record)
+                if target is None:
+                    record.pop("department", None)
+                    record.pop("course_number", None)
+                    counts["unmerged"] += 1
+                else:
+                    record["department"], record["course_number"] = target
+
+                if current is None:
+                    record.setdefault("_id", ObjectId())
+                    operations.append(InsertOne(record))
+                    existing[key] = (record["_id"], record["content_hash"])
+                    counts["inserted"] += 1
+                else:
+                    record.pop("_id", None)
+                    update = {"$set": record}
+                    if target is None:
+                        update["$unset"] = {"department": "", "course_number": ""}
+                    operations.append(UpdateOne({"_id": current[0]}, update))
+                    changed_ids.append(current[0])
+                    existing[key] = (current[0], record["content_hash"])
+                    counts["updated"] += 1
+                added.append(record)
+
+            if not operations:
+                continue
+
+            # Take the old values of changed sections out of the rollups before overwriting them
+            if changed_ids:
+                adjust_rollups(list(self.db.grades.find({"_id": {"$in": changed_ids}})), sign=-1)
+            self.db.grades.bulk_write(operations, ordered=False)
+            adjust_rollups(added)
+
+        if remove_missing:
+            vanished = [existing[key][0] for key in existing.keys() - seen]
+            for ids in batched(vanished, batch_size):
+                adjust_rollups(list(self.db.grades.find({"_id": {"$in": ids}})), sign=-1)
+                self.db.grades.delete_many({"_id": {"$in": ids}})
+                counts["removed"] += len(ids)
+
+        if counts["inserted"] or counts["updated"] or counts["removed"]:
+            self.bump_data_version()
+        return counts
+
+
+    # ROLLUPS, sums and counts of the grade percentages kept up to date at ingest
+    # so the user page reads a few documents instead of every section
+    def update_rollups(self, records, sign=1, prefix="", names=tuple(ROLLUPS)):
+        """
+        Adds grade records to the rollup collections, or removes them when sign is -1.
+        Records are summed in memory first so each rollup document is written once per call.
+
+        Parameters:
+            records (iterable): Grade records with course, instructor, term and aprec..fprec.
+            sign (int): 1 to add the records, -1 to subtract them.
+            prefix (str): Collection name prefix, STAGING_PREFIX while a reload is being staged.
+            names (tuple): Rollup collections to update, every one in ROLLUPS by default.
+        """
+        rollups = {name: ROLLUPS[name] for name in names}
+        totals = {name: {} for name in rollups}
+
+        for record in records:
+            if "dept" in record:
+                dept, level = record["dept"], record.get("level")
             else:
-                flash("No matching records found for merging.", "info")
+                dept, _, level = split_course_code(record.get("course", ""))
+            instructor = record.get("instructor", "Unknown")
+            fields = {
+                "course": record.get("course", ""),
+                "instructor": instructor,
+                "name_key": record["name_key"] if "name_key" in record else name_key(instructor),
+                "dept": dept,
+                "level": level,
+                "term": record.get("term", ""),
+                "term_ord": record["term_ord"] if "term_ord" in record else term_ordinal(record.get("term")),
+            }
+
+            for name, (key_fields, extra_fields) in rollups.items():
+                key = tuple(fields[f] for f in key_fields)
+                entry = totals[name].get(key)
+                if entry is None:
+                    entry = totals[name][key] = {
+                        "extra": {f: fields[f] for f in extra_fields},
+                        "count": 0,
+                        "sums": dict.fromkeys(GRADE_FIELDS, 0.0),
+                    }
+                entry["count"] += 1
+                for grade in GRADE_FIELDS:
+                    entry["sums"][grade] += float(record.get(grade, 0.0))
+
+        for name, (key_fields, _) in rollups.items():
+            operations = []
+            for key, entry in totals[name].items():
+                increments = {"count": sign * entry["count"]}
+                for grade in GRADE_FIELDS:
+                    increments[f"{grade}_sum"] = sign * entry["sums"][grade]
+
+                update = {"$inc": increments}
+                if entry["extra"]:
+                    update["$set"] = entry["extra"]
+                operations.append(UpdateOne(dict(zip(key_fields, key)), update, upsert=True))
+
+            if sign < 0:
+                # Rollups whose last section was removed, looked up by key instead of scanning for count <= 0
+                operations.extend(
+                    DeleteOne({**dict(zip(key_fields, key)), "count": {"$lte": 0}}) for key in totals[name]
+                )
+            if operations:
+                self.db[prefix + name].bulk_write(operations, ordered=False)
 
-        except Exception as e:
-            flash(f"Error merging faculty with grades: {e}", "danger")
 
+    def clear_rollups(self):
+        """
+        Removes every rollup document.
+        """
+        for name in ROLLUPS:
+            self.db[name].delete_many({})
+
+
+    # DATA VERSION, shared by every app process through the meta collection
+    def add_change_listener(self, callback):
+        """
+        Registers a callback that runs whenever the data changes, before the version is bumped,
+        so anything derived from the data (e.g. the dropdown catalog) is current once readers
+        see the new version.
+
+        Parameters:
+            callback (callable): Function called without arguments.
+        """
+        self.change_listeners.append(callback)
+
+
+    def bump_data_version(self):
+        """
+        Runs the change listeners, then increments the data version so cached user page
+        results are invalidated.
+
+        Returns:
+            int: The new data version.
+        """
+        for callback in self.change_listeners:
+            callback()
+
+        meta = self.db.meta.find_one_and_update(
+            {"_id": "data_version"},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return meta["version"]
+
+
+    def get_data_version(self):
+        """
+        Returns the current data version, 0 before any data was loaded.
+
+        Returns:
+            int: The current data version.
+        """
+        meta = self.db.meta.find_one({"_id": "data_version"}, {"version": 1})
+        return meta["version"] if meta else 0
+
+
+    def get_data_state(self):
+        """
+        Returns the current data version and when it was set, for HTTP validators.
+
+        Returns:
+            dict: "version" (0 before any data was loaded) and "updated_at" (datetime or None).
+        """
+        meta = self.db.meta.find_one({"_id": "data_version"}, {"version": 1, "updated_at": 1}) or {}
+        return {"version": meta.get("version", 0), "updated_at": meta.get("updated_at")}
 
 
     # Clears the database
@@ -268,8 +1013,10 @@ class DataLoader:
             faculty_count = self.db.faculty.count_documents({})
             self.db.grades.delete_many({})
             self.db.faculty.delete_many({})
+            self.clear_rollups()
+            self.bump_data_version()
 
-            flash(f"Cleared {grades_count} grade records and {faculty_count} faculty records.", "success")
+            report(f"Cleared {grades_count} grade records and {faculty_count} faculty records.", "success")
         except Exception as e:
-            flash(f"An error occurred while clearing the database: {e}", "danger")
+            report(f"An error occurred while clearing the database: {e}", "danger")
 
@@ -0,0 +1,124 @@
+import codecs
+import json
+import re
+
+"""
+grade_stream.py
+
+Incremental parser for the remote grade data file (e.g. gradedata.js).
+The file holds one large `var groups = {...};` object keyed by course. Instead of
+reading the whole response and running json.loads over it, the text is consumed in
+chunks and each course group is decoded and yielded as soon as it is complete,
+so memory stays bounded by the largest single course group.
+"""
+
+GROUPS_MARKER = re.compile(r'var\s+groups\s*=\s*')
+WHITESPACE = " \t\r\n"
+
+_decoder = json.JSONDecoder()
+
+
+def decode_chunks(chunks, encoding="utf-8"):
+    """
+    Turns an iterator of byte or text chunks into text chunks.
+    Multi-byte characters split across chunk boundaries are handled.
+
+    Parameters:
+        chunks (iterable): Byte or str chunks, e.g. response.iter_content().
+        encoding (str): Encoding used for byte chunks.
+
+    Yields:
+        str: Decoded text chunks.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_course_groups(chunks, encoding="utf-8"):
+    """
+    Parses `var groups = {...}` from a chunked JS file and yields one course group at a time.
+
+    Parameters:
+        chunks (iterable): Byte or str chunks of the JS file.
+        encoding (str): Encoding used for byte chunks.
+
+    Yields:
+        tuple: (course, sections) where sections is the list of section dictionaries.
+
+    Raises:
+        ValueError: If the groups object is missing, malformed or truncated.
+    """
+    chunks = decode_chunks(chunks, encoding)
+    buffer = ""
+
+    # Locate the start of the groups object, keeping a small tail in case the
+    # marker is split across two chunks
+    for chunk in chunks:
+        buffer += chunk
+        match = GROUPS_MARKER.search(buffer)
+        if match and match.end() < len(buffer):
+            buffer = buffer[match.end():]
+            break
+        if not match:
+            buffer = buffer[-64:]
+    else:
+        raise ValueError("Could not find 'var groups =' in the remote file.")
+
+    pos = 0
+
+    def fill(pos):
+        # Reads another chunk, dropping the already consumed part of the buffer
+        nonlocal buffer
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError("The groups object in the remote file is truncated.")
+        buffer = buffer[pos:] + chunk
+        return 0
+
+    def skip_whitespace(pos):
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buffer):
+                return pos
+            pos = fill(pos)
+
+    def decode_value(pos):
+        # A value cut off at the end of the buffer fails to decode, so retry with
+        # more data until it decodes or the file runs out
+        while True:
+            try:
+                return _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                try:
+                    pos = fill(pos)
+                except ValueError:
+                    raise ValueError(f"Malformed groups object: {e}") from None
+
+    pos = skip_whitespace(pos)
+    if buffer[pos] != "{":
+        raise ValueError("The groups value in the remote file is not an object.")
+    pos += 1
+
+    while True:
+        pos = skip_whitespace(pos)
+        if buffer[pos] == "}":
+            return
+        if buffer[pos] == ",":
+            pos = skip_whitespace(pos + 1)
+
+        course, pos = decode_value(pos)
+        pos = skip_whitespace(pos)
+        if buffer[pos] != ":":
+            raise ValueError(f"Expected ':' after course {course!r}.")
+
+        pos = skip_whitespace(pos + 1)
+        sections, pos = decode_value(pos)
+        yield course, sections
@@ -0,0 +1,145 @@
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+from data_loader import GRADE_FIELDS
+
+"""
+grades_api.py
+
+Raw grade section rows for /api/grades, for clients that need every section instead of
+the averaged distributions.
+Rows are read in _id order and paged by keyset: the cursor is the _id of the last row
+returned and the next page starts after it, so a page costs the same however deep it is.
+The filters are equality matches on fields with an (<field>, _id) index, so the filter and
+the sort are both served by one index. NDJSON output streams rows as they come off the
+MongoDB cursor instead of building the whole response in memory.
+"""
+
+# Fields a client can ask for with ?fields=, in output order
+EXPORT_FIELDS = ("course", "dept", "course_num", "level", "term", "crn", "instructor") + GRADE_FIELDS + (
+    "department", "course_number")
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+STREAM_BATCH_SIZE = 1000
+
+
+def grades_projection(fields=""):
+    """
+    Builds the projection for a comma separated field list.
+
+    Parameters:
+        fields (str): e.g. "course,term,aprec". Empty selects every field in EXPORT_FIELDS.
+
+    Returns:
+        dict: MongoDB projection. _id is always kept, it is the pagination cursor.
+
+    Raises:
+        ValueError: If a field is not in EXPORT_FIELDS.
+    """
+    selected = [field.strip() for field in fields.split(",") if field.strip()] or list(EXPORT_FIELDS)
+    unknown = [field for field in selected if field not in EXPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(EXPORT_FIELDS)}")
+    return {field: 1 for field in selected}
+
+
+def parse_cursor(after):
+    """
+    Decodes the cursor a client got from an earlier page.
+
+    Parameters:
+        after (str): The "next" value of the previous page, empty for the first page.
+
+    Returns:
+        bson.ObjectId: The _id to continue after, or None.
+
+    Raises:
+        ValueError: If the cursor is not a valid id.
+    """
+    if not after:
+        return None
+    try:
+        return ObjectId(after)
+    except (InvalidId, TypeError):
+        raise ValueError(f"Invalid cursor: {after}")
+
+
+def parse_limit(limit, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Parses a row limit.
+
+    Parameters:
+        limit (str): The ?limit= value, empty for the default.
+        default (int): Limit when none is given, None for no limit.
+        maximum (int): Cap on the limit, None for no cap.
+
+    Returns:
+        int: The limit, or default.
+
+    Raises:
+        ValueError: If the limit is not a positive integer.
+    """
+    if limit in (None, ""):
+        return default
+    try:
+        value = int(limit)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise ValueError(f"Invalid limit: {limit}")
+    return min(value, maximum) if maximum else value
+
+
+def find_grades(db, query, projection, after=None, limit=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Opens a cursor over the matching grade sections in _id order.
+
+    Parameters:
+        db (pymongo.database.Database): The MongoDB database connection.
+        query (dict): Filter, e.g. from build_course_query.
+        projection (dict): Fields to return, see grades_projection.
+        after (bson.ObjectId): Only return rows after this _id.
+        limit (int): Maximum number of rows, None for all.
+        batch_size (int): Rows per round trip to MongoDB.
+
+    Returns:
+        pymongo.cursor.Cursor: The rows.
+    """
+    if after is not None:
+        query = {**query, "_id": {"$gt": after}}
+    cursor = db.grades.find(query, projection).sort("_id", 1).batch_size(batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def grade_row(doc):
+    """
+    Returns a grade document as an API row, with its _id as the string "id".
+    """
+    row = {"id": str(doc["_id"])}
+    row.update((key, value) for key, value in doc.items() if key != "_id")
+    return row
+
+
+def page_grades(db, query, projection, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Reads one page of grade rows.
+
+    Returns:
+        tuple: (rows, next cursor). The cursor is None on the last page.
+    """
+    # One extra row tells whether there is a next page without a count query
+    docs = list(find_grades(db, query, projection, after, limit + 1, batch_size=limit + 1))
+    rows = [grade_row(doc) for doc in docs[:limit]]
+    next_cursor = rows[-1]["id"] if len(docs) > limit else None
+    return rows, next_cursor
+
+
+def iter_ndjson(cursor):
+    """
+    Yields one JSON line per row of a cursor.
+    """
+    for doc in cursor:
+        yield json.dumps(grade_row(doc)) + "\n"
@@ -0,0 +1,34 @@
+from config import Config
+
+"""
+gunicorn.conf.py
+
+Pre-fork serving settings for `gunicorn -c gunicorn.conf.py wsgi:app`, read from Config
+so they can be set through the same environment variables as the rest of the app.
+
+Each worker is its own process with WEB_THREADS request threads, so one slow /user render
+only holds one thread of one worker. The app is not preloaded: every worker imports app.py
+after the fork and creates its own MongoClient, connection pool and job thread pool, since
+neither a MongoClient nor a thread pool can be shared across a fork. Everything the workers
+share (grade data, the dropdown catalog, the data version and job status) lives in MongoDB.
+In-process state is not shared: /metrics and /cache_stats report the worker that answered,
+labelled with its pid, so dashboards should sum over pid.
+"""
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS
+threads = Config.WEB_THREADS
+worker_class = "gthread"
+preload_app = False
+
+# Seconds a worker may go silent before it is restarted, and seconds to finish requests on shutdown
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_TIMEOUT
+keepalive = Config.WEB_KEEPALIVE
+
+# Recycle workers after this many requests, 0 never recycles. The jitter keeps them from restarting together
+max_requests = Config.WEB_MAX_REQUESTS
+max_requests_jitter = Config.WEB_MAX_REQUESTS // 10
+
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,227 @@
+import gzip
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import request, make_response
+from werkzeug.http import http_date
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+"""
+http_caching.py
+
+Conditional requests, Cache-Control and compression for the EasyA pages and APIs.
+Views wrapped with HttpCaching.cached get a strong ETag built from the data version and the
+request URL, and a Last-Modified from the time the data last changed. Both only change when
+the admin page changes the data, so a matching If-None-Match or If-Modified-Since is answered
+with 304 before the view runs. HTML, JSON and text responses are compressed with brotli (if
+installed) or gzip, and the ETag gets a suffix per content coding as strong ETags require.
+"""
+
+COMPRESSIBLE_TYPES = {"text/html", "text/plain", "text/css", "application/json", "application/javascript"}
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+class HttpCaching:
+    """
+    Flask helpers for data version based HTTP caching and response compression.
+
+    ...
+
+    Attributes
+    ----------
+    get_state : callable
+        Returns the current data version and the time it was set, see DataLoader.get_data_state.
+    max_age : int
+        Seconds browsers may reuse a shared view without revalidating.
+    shared_max_age : int
+        Seconds a reverse proxy may reuse a shared view without revalidating.
+    compress_min_size : int
+        Smaller responses are sent uncompressed.
+    compress_level : int
+        gzip level (1-9), brotli uses the matching quality.
+    salt : str
+        Added to every ETag, change it on deploys that change the rendered output.
+
+
+    Methods
+    -------
+    init_app(app):
+        Compresses eligible responses of a Flask app.
+
+    cached(vary_accept=False):
+        Decorator answering conditional requests for a view whose output depends only on the data and URL.
+
+    no_store(view):
+        Decorator marking a view as never cacheable.
+    """
+
+
+    def __init__(self, get_state, max_age=0, shared_max_age=60, compress_min_size=500, compress_level=6, salt=""):
+        """
+        Initializes the helpers.
+
+        Parameters:
+            get_state (callable): Returns {"version": int, "updated_at": datetime or None}.
+            max_age (int): Browser max-age for shared views.
+            shared_max_age (int): Proxy s-maxage for shared views.
+            compress_min_size (int): Minimum body size in bytes to compress, 0 turns compression off.
+            compress_level (int): gzip compression level.
+            salt (str): Extra ETag input, e.g. the release.
+        """
+        self.get_state = get_state
+        self.max_age = max_age
+        self.shared_max_age = shared_max_age
+        self.compress_min_size = compress_min_size
+        self.compress_level = compress_level
+        self.salt = salt
+
+
+    def init_app(self, app):
+        """
+        Registers the compression hook on a Flask app.
+
+        Parameters:
+            app (flask.Flask): The app.
+        """
+        app.after_request(self.compress)
+
+
+    # CONDITIONAL REQUESTS
+    def make_etag(self, version, vary_accept=False):
+        """
+        Returns the strong ETag of the current request URL at a data version.
+        """
+        parts = [self.salt, str(version), request.full_path]
+        if vary_accept:
+            parts.append(request.headers.get("Accept", ""))
+        return hashlib.sha1("\n".join(parts).encode()).hexdigest()[:32]
+
+
+    def cache_control(self):
+        return f"public, max-age={self.max_age}, s-maxage={self.shared_max_age}"
+
+
+    def is_not_modified(self, etag, updated_at):
+        """
+        Checks the request's If-None-Match, or else If-Modified-Since, against the current state.
+
+        Returns:
+            str: The ETag to send with the 304 (the variant the client holds), or None when modified.
+        """
+        if request.if_none_match:
+            # Compressed responses carry the ETag with an encoding suffix, and If-None-Match
+            # uses the weak comparison since proxies may weaken the ETags they recompress
+            for suffix in ("",) + ENCODING_SUFFIXES:
+                if request.if_none_match.star_tag or request.if_none_match.contains_weak(etag + suffix):
+                    return etag + suffix
+            return None
+        if request.if_modified_since and updated_at and updated_at.replace(microsecond=0) <= request.if_modified_since:
+            return etag
+        return None
+
+
+    def cached(self, vary_accept=False):
+        """
+        Decorator for views whose output depends only on the data and the request URL.
+        A conditional request that still matches gets a 304 without running the view,
+        successful responses get the ETag, Last-Modified and a shared Cache-Control.
+
+        Parameters:
+            vary_accept (bool): The view picks its format from the Accept header.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                state = self.get_state()
+                updated_at = state.get("updated_at")
+                if updated_at is not None and updated_at.tzinfo is None:
+                    updated_at = updated_at.replace(tzinfo=timezone.utc)  # MongoDB returns naive UTC datetimes
+                etag = self.make_etag(state.get("version", 0), vary_accept)
+
+                headers = {"ETag": f'"{etag}"', "Cache-Control": self.cache_control()}
+                if updated_at is not None:
+                    headers["Last-Modified"] = http_date(updated_at)
+                vary = "Accept, Accept-Encoding" if vary_accept else "Accept-Encoding"
+
+                matched = self.is_not_modified(etag, updated_at) if request.method in ("GET", "HEAD") else None
+                if matched:
+                    response = make_response("", 304)
+                    headers["ETag"] = f'"{matched}"'
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+
+                response.headers.update(headers)
+                response.vary.update(header.strip() for header in vary.split(","))
+                return response
+            return wrapper
+        return decorator
+
+
+    @staticmethod
+    def no_store(view):
+        """
+        Decorator marking a view (admin pages, job status, counters) as never cacheable.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            response.headers["Cache-Control"] = "no-store"
+            return response
+        return wrapper
+
+
+    # COMPRESSION
+    def choose_encoding(self):
+        """
+        Returns "br" or "gzip" as accepted by the client, preferring brotli when it is installed.
+        """
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"]:
+            return "br"
+        if accepted["gzip"]:
+            return "gzip"
+        return None
+
+
+    def compress(self, response):
+        """
+        Compresses an HTML, JSON or text response the client accepts compressed.
+        Streamed responses (e.g. NDJSON from /api/grades) are passed through unchanged.
+
+        Parameters:
+            response (flask.Response): The response.
+
+        Returns:
+            flask.Response: The same response, compressed when eligible.
+        """
+        if (not self.compress_min_size
+                or response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = self.choose_encoding()
+        body = response.get_data()
+        if encoding is None or len(body) < self.compress_min_size:
+            return response
+
+        if encoding == "br":
+            body = brotli.compress(body, quality=min(11, self.compress_level + 2))
+        else:
+            body = gzip.compress(body, compresslevel=self.compress_level, mtime=0)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+
+        etag = response.headers.get("ETag")
+        if etag and etag.endswith('"'):
+            response.headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+        return response
@@ -0,0 +1,192 @@
+from bson import ObjectId
+
+"""
+indexes.py
+
+Declarative index spec for the EasyA collections and the tools that apply and check it.
+`flask init-indexes` creates every index in INDEX_SPEC (once per deploy, not on a request),
+and `flask audit-indexes` runs explain() on each query shape the app uses and flags any
+shape whose winning plan scans a whole collection or sorts in memory.
+"""
+
+# Collection -> index keys. A full grade reload builds the same indexes on its staging
+# collections before swapping them in, see DataLoader.replace_grade_records
+INDEX_SPEC = {
+    "grades": [
+        [("course", 1)],
+        [("name_key", 1), ("_id", 1)],
+        [("course", 1), ("instructor", 1)],
+        [("course", 1), ("term", 1), ("crn", 1)],
+        [("dept", 1), ("level", 1), ("course_num", 1)],
+        # /api/grades filters, each followed by _id so the keyset sort comes from the same index
+        [("dept", 1), ("_id", 1)],
+        [("dept", 1), ("course_num", 1), ("_id", 1)],
+        [("course_num", 1), ("_id", 1)],
+        [("course", 1), ("term_ord", 1)],
+        [("term_ord", 1)],
+    ],
+    "faculty": [
+        [("name_key", 1), ("department", 1)],
+    ],
+    "rollup_course_instructor": [
+        [("course", 1), ("instructor", 1)],
+        [("name_key", 1)],
+        [("dept", 1), ("level", 1)],
+    ],
+    "rollup_course": [
+        [("course", 1)],
+        [("dept", 1), ("level", 1)],
+    ],
+    "rollup_department": [
+        [("dept", 1)],
+    ],
+    "rollup_term_course": [
+        [("course", 1), ("term_ord", 1)],
+        [("dept", 1), ("term_ord", 1)],
+        [("term_ord", 1)],
+    ],
+    "rollup_term_instructor": [
+        [("instructor", 1), ("term_ord", 1)],
+        [("name_key", 1), ("term_ord", 1)],
+    ],
+}
+
+# Every filter the app sends to MongoDB, with example values. Full passes that read every
+# document on purpose (catalog rebuild, merge, delta key scan) are left out.
+QUERY_SHAPES = [
+    # user_page and /api/distribution, see aggregations.rollup_distribution
+    {"name": "distribution by department", "collection": "rollup_course_instructor", "filter": {"dept": "CIS"}},
+    {"name": "distribution by level", "collection": "rollup_course", "filter": {"dept": "CIS", "level": 200}},
+    {"name": "distribution by class", "collection": "rollup_course_instructor", "filter": {"course": "CIS210"}},
+    {"name": "distribution by teacher", "collection": "rollup_course_instructor", "filter": {"name_key": "doe, john"}},
+    {"name": "distribution by department and teacher", "collection": "rollup_course_instructor",
+     "filter": {"dept": "CIS", "name_key": "doe, john"}},
+    # /api/trend, see aggregations.build_trend_query
+    {"name": "trend by class", "collection": "rollup_term_course",
+     "filter": {"course": "MATH111", "term_ord": {"$gte": 8040, "$lte": 8059}}},
+    {"name": "trend by department", "collection": "rollup_term_course",
+     "filter": {"dept": "MATH", "term_ord": {"$gte": 8040}}},
+    {"name": "trend overall", "collection": "rollup_term_course", "filter": {"term_ord": {"$gte": 8040}}},
+    {"name": "trend by teacher", "collection": "rollup_term_instructor",
+     "filter": {"name_key": "doe, john", "term_ord": {"$gte": 8040}}},
+    {"name": "trend by class and teacher", "collection": "grades",
+     "filter": {"course": "MATH111", "name_key": "doe, john", "term_ord": {"$gte": 8040}}},
+    {"name": "teacher department lookup", "collection": "faculty", "filter": {"name_key": "doe, john"}},
+
+    # build_course_query, read in _id order by /api/grades
+    {"name": "course query by department", "collection": "grades", "filter": {"dept": "CIS"}, "sort": [("_id", 1)]},
+    {"name": "course query by department and class", "collection": "grades",
+     "filter": {"dept": "CIS", "course_num": "210"}, "sort": [("_id", 1)]},
+    {"name": "course query by class", "collection": "grades", "filter": {"course_num": "210"}, "sort": [("_id", 1)]},
+    {"name": "course query by instructor", "collection": "grades", "filter": {"name_key": "doe, john"}, "sort": [("_id", 1)]},
+    {"name": "grades api page", "collection": "grades",
+     "filter": {"dept": "CIS", "_id": {"$gt": ObjectId("000000000000000000000000")}}, "sort": [("_id", 1)]},
+
+    # DataLoader
+    {"name": "section by course, term and crn", "collection": "grades",
+     "filter": {"course": "CIS210", "term": "Fall 2013", "crn": "10001"}},
+    {"name": "course field backfill", "collection": "grades", "filter": {"course": "CIS210", "dept": {"$exists": False}}},
+    {"name": "faculty upsert", "collection": "faculty",
+     "filter": {"name_key": "doe, john", "department": "CIS", "course_number": None}},
+    {"name": "course instructor rollup upsert", "collection": "rollup_course_instructor",
+     "filter": {"course": "CIS210", "instructor": "Doe, John"}},
+    {"name": "course rollup upsert", "collection": "rollup_course", "filter": {"course": "CIS210"}},
+    {"name": "department rollup upsert", "collection": "rollup_department", "filter": {"dept": "CIS"}},
+    {"name": "term course rollup upsert", "collection": "rollup_term_course", "filter": {"course": "CIS210", "term_ord": 8055}},
+    {"name": "term instructor rollup upsert", "collection": "rollup_term_instructor",
+     "filter": {"instructor": "Doe, John", "term_ord": 8055}},
+]
+
+# Plan stages that mean a query is not served by an index
+FLAGGED_STAGES = {
+    "COLLSCAN": "collection scan",
+    "SORT": "in-memory sort",
+}
+
+
+def ensure_indexes(db, spec=INDEX_SPEC, prune=False):
+    """
+    Creates every index in the spec. create_index does nothing for indexes that already exist.
+
+    Parameters:
+        db (pymongo.database.Database): The MongoDB database connection.
+        spec (dict): Collection name -> list of index keys.
+        prune (bool): Also drop existing indexes that are not in the spec.
+
+    Returns:
+        dict: "indexes" with the "collection.index" names in the spec and "unlisted" with the
+              ones found that are not (dropped when prune is set).
+    """
+    indexes, unlisted = [], []
+    for collection, index_keys in spec.items():
+        wanted = {db[collection].create_index(keys) for keys in index_keys}
+        indexes.extend(f"{collection}.{name}" for name in sorted(wanted))
+
+        for name in sorted(db[collection].index_information()):
+            if name == "_id_" or name in wanted:
+                continue
+            if prune:
+                db[collection].drop_index(name)
+            unlisted.append(f"{collection}.{name}")
+
+    return {"indexes": indexes, "unlisted": unlisted}
+
+
+def plan_stages(plan):
+    """
+    Yields the stage name of every node in an explain() plan tree.
+
+    Parameters:
+        plan (dict): A winning plan, e.g. explain()["queryPlanner"]["winningPlan"].
+
+    Yields:
+        str: Stage names such as IXSCAN, FETCH or COLLSCAN.
+    """
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def plan_problems(explain):
+    """
+    Lists the flagged stages in the winning plan of an explain() result.
+
+    Parameters:
+        explain (dict): The output of cursor.explain().
+
+    Returns:
+        list: Descriptions of the problems, empty when the query is served by indexes.
+    """
+    stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+    return [FLAGGED_STAGES[stage] for stage in stages if stage in FLAGGED_STAGES]
+
+
+def audit_query_shapes(db, shapes=QUERY_SHAPES):
+    """
+    Runs explain() on each query shape and reports the plan MongoDB picks for it.
+
+    Parameters:
+        db (pymongo.database.Database): The MongoDB database connection.
+        shapes (list): Query shapes with a name, collection, filter and optional sort.
+
+    Returns:
+        list: One dictionary per shape with its name, collection, plan stages and problems.
+    """
+    results = []
+    for shape in shapes:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explain = cursor.explain()
+        results.append({
+            "name": shape["name"],
+            "collection": shape["collection"],
+            "stages": list(plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))),
+            "problems": plan_problems(explain),
+        })
+    return results
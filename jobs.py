@@ -0,0 +1,339 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+
+from data_loader import reporting_to
+
+"""
+jobs.py
+
+Background runner for the long admin operations (loading grade data, scraping faculty,
+merging). Jobs run on a small thread pool so the HTTP request returns right away with a
+job id, and their status is kept in the `jobs` collection so any app process can answer
+/jobs/<id> while the admin page polls it.
+Operations that change the data (loads, merges, scrapes, rollbacks, snapshot exports) also
+take the data lock, a single document in `job_locks`. It is shared by every app process,
+so only one of them runs at a time, and a second one is refused with JobConflict instead of
+racing the first over the staging and rollup collections.
+"""
+
+DATA_LOCK_ID = "data"
+
+
+class JobConflict(Exception):
+    """
+    Raised when the data lock is requested while another operation holds it.
+
+    Attributes
+    ----------
+    holder : dict
+        The lock document: owner (the job id), name and acquired_at.
+    """
+
+
+    def __init__(self, holder):
+        self.holder = holder or {}
+        super().__init__(f"Another data operation is running: {self.holder.get('name', 'unknown')}.")
+
+
+class Job:
+    """
+    Handle passed to a running job function to report progress.
+
+    ...
+
+    Attributes
+    ----------
+    id : str
+        The job id.
+
+
+    Methods
+    -------
+    progress(message, **counts):
+        Records a progress message and the record counts so far.
+    """
+
+
+    def __init__(self, runner, job_id, exclusive=False):
+        self.runner = runner
+        self.id = job_id
+        self.exclusive = exclusive
+
+
+    def progress(self, message, **counts):
+        """
+        Records a progress message and the record counts so far.
+
+        Parameters:
+            message (str): Short description of the current step.
+            counts (int): Record counts, e.g. records=5000.
+        """
+        update = {"progress": message}
+        for name, value in counts.items():
+            update[f"counts.{name}"] = value
+        self.runner._update(self.id, update)
+        if self.exclusive:
+            self.runner.refresh_lock(self.id)
+
+
+class JobRunner:
+    """
+    A thread pool that runs admin operations in the background and tracks them in MongoDB.
+
+    ...
+
+    Attributes
+    ----------
+    db : pymongo.database.Database
+        The MongoDB database connection, job documents live in db.jobs.
+
+
+    Methods
+    -------
+    submit(name, func, *args, **kwargs):
+        Queues func(job, *args, **kwargs) and returns the job id.
+
+    submit_exclusive(name, func, *args, **kwargs):
+        Queues a data changing job holding the data lock, raises JobConflict while another one holds it.
+
+    hold(name):
+        Context manager holding the data lock for a data change made outside a job.
+
+    get(job_id):
+        Returns the status document of a job.
+
+    wait(job_id, timeout=None):
+        Blocks until a job submitted by this runner has finished.
+
+    add_finish_listener(callback):
+        Registers a callback that receives the final document of every finished job.
+    """
+
+
+    def __init__(self, db, max_workers=2, lock_seconds=3600):
+        """
+        Initializes the runner and its thread pool.
+
+        Parameters:
+            db (pymongo.database.Database): The MongoDB database connection.
+            max_workers (int): Number of jobs that can run at the same time.
+            lock_seconds (int): The data lock expires this long after the holder last reported
+                                progress, so a process that died does not keep it forever.
+        """
+        self.db = db
+        self.lock_seconds = lock_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="easya-job")
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.finish_listeners = []
+
+
+    def submit(self, name, func, *args, **kwargs):
+        """
+        Queues a job. func is called as func(job, *args, **kwargs) and may return a dict of record counts.
+
+        Parameters:
+            name (str): Name of the operation, e.g. "load_remote_js".
+            func (callable): The operation to run.
+
+        Returns:
+            str: The job id.
+        """
+        return self._queue(uuid.uuid4().hex, name, func, args, kwargs, exclusive=False)
+
+
+    def submit_exclusive(self, name, func, *args, **kwargs):
+        """
+        Queues a job that changes the data. The job holds the data lock from now until it
+        finishes, so while it is queued or running no other data changing operation starts.
+
+        Parameters:
+            name (str): Name of the operation, e.g. "load_remote_js".
+            func (callable): The operation to run.
+
+        Returns:
+            str: The job id.
+
+        Raises:
+            JobConflict: If another operation holds the data lock.
+        """
+        job_id = uuid.uuid4().hex
+        self.acquire_lock(job_id, name)
+        try:
+            return self._queue(job_id, name, func, args, kwargs, exclusive=True)
+        except Exception:
+            self.release_lock(job_id)
+            raise
+
+
+    def _queue(self, job_id, name, func, args, kwargs, exclusive):
+        self.db.jobs.insert_one({
+            "_id": job_id,
+            "name": name,
+            "status": "queued",
+            "progress": "Waiting for a free worker",
+            "counts": {},
+            "messages": [],
+            "created_at": datetime.now(timezone.utc),
+        })
+
+        future = self.executor.submit(self._run, job_id, func, args, kwargs, exclusive)
+        with self._lock:
+            self._futures[job_id] = future
+        return job_id
+
+
+    # DATA LOCK
+    def acquire_lock(self, owner, name):
+        """
+        Takes the data lock if it is free or expired.
+
+        Parameters:
+            owner (str): Id of the holder, a job id.
+            name (str): Name of the operation, shown to whoever is refused.
+
+        Raises:
+            JobConflict: If another operation holds the lock.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            # Without a free or expired lock document the upsert inserts a second one with
+            # the same _id, which fails, in whichever process tries
+            self.db.job_locks.find_one_and_update(
+                {"_id": DATA_LOCK_ID, "$or": [{"owner": None}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": owner, "name": name, "acquired_at": now,
+                          "expires_at": now + timedelta(seconds=self.lock_seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            raise JobConflict(self.db.job_locks.find_one({"_id": DATA_LOCK_ID}))
+
+
+    def refresh_lock(self, owner):
+        """
+        Pushes back the expiry of the data lock while its holder makes progress.
+        """
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.lock_seconds)
+        self.db.job_locks.update_one({"_id": DATA_LOCK_ID, "owner": owner}, {"$set": {"expires_at": expires_at}})
+
+
+    def release_lock(self, owner):
+        """
+        Releases the data lock if owner still holds it.
+        """
+        self.db.job_locks.update_one({"_id": DATA_LOCK_ID, "owner": owner}, {"$set": {"owner": None, "expires_at": None}})
+
+
+    @contextmanager
+    def hold(self, name):
+        """
+        Holds the data lock for a data change made outside a job, e.g. a rollback.
+
+        Parameters:
+            name (str): Name of the operation.
+
+        Raises:
+            JobConflict: If another operation holds the lock.
+        """
+        owner = uuid.uuid4().hex
+        self.acquire_lock(owner, name)
+        try:
+            yield
+        finally:
+            self.release_lock(owner)
+
+
+    def _run(self, job_id, func, args, kwargs, exclusive=False):
+        try:
+            self._run_job(job_id, func, args, kwargs, exclusive)
+        finally:
+            if exclusive:
+                self.release_lock(job_id)  # Also when the status update itself failed
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+
+    def _run_job(self, job_id, func, args, kwargs, exclusive):
+        job = Job(self, job_id, exclusive)
+        started = time.monotonic()
+        self._update(job_id, {"status": "running", "progress": "Started", "started_at": datetime.now(timezone.utc)})
+
+        # Messages DataLoader would flash on the admin page are kept on the job instead
+        def collect(message, category):
+            self.db.jobs.update_one({"_id": job_id}, {"$push": {"messages": {"category": category, "message": message}}})
+
+        try:
+            with reporting_to(collect):
+                counts = func(job, *args, **kwargs) or {}
+            update = {"status": "succeeded", "progress": "Finished"}
+            for name, value in counts.items():
+                update[f"counts.{name}"] = value
+        except Exception as e:
+            traceback.print_exc()
+            update = {"status": "failed", "progress": "Failed", "error": str(e)}
+
+        update["finished_at"] = datetime.now(timezone.utc)
+        update["duration"] = round(time.monotonic() - started, 3)
+        if exclusive:
+            # Released before the final status, so a client that saw it can start the next operation
+            self.release_lock(job_id)
+        self._update(job_id, update)
+
+        if self.finish_listeners:
+            finished = self.get(job_id)
+            for callback in self.finish_listeners:
+                try:
+                    callback(finished)
+                except Exception:
+                    traceback.print_exc()
+
+
+    def add_finish_listener(self, callback):
+        """
+        Registers a callback that receives the final document of every finished job, e.g. for metrics.
+
+        Parameters:
+            callback (callable): Called with the job document once its status is final.
+        """
+        self.finish_listeners.append(callback)
+
+
+    def _update(self, job_id, update):
+        self.db.jobs.update_one({"_id": job_id}, {"$set": update})
+
+
+    def get(self, job_id):
+        """
+        Returns the status document of a job.
+
+        Parameters:
+            job_id (str): The job id.
+
+        Returns:
+            dict: Status, progress, counts, messages and timings, or None for an unknown id.
+        """
+        return self.db.jobs.find_one({"_id": job_id})
+
+
+    def wait(self, job_id, timeout=None):
+        """
+        Blocks until a job submitted by this runner has finished.
+
+        Parameters:
+            job_id (str): The job id.
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            dict: The final status document.
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return self.get(job_id)
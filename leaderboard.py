@@ -0,0 +1,177 @@
+import threading
+from collections import OrderedDict
+from data_loader import GRADE_FIELDS
+
+"""
+leaderboard.py
+
+Top-K / bottom-K "easiest and hardest" boards over the grade distributions.
+For each filter scope (department, level, class, teacher and grouping) the groups are
+sorted once per grade letter and kept in memory with prefix sums of their section counts
+and grade sums, tagged with the data version. A request then slices K groups off each end
+and computes the "others" bucket from the prefix sums, so its cost and payload do not grow
+with the number of groups in the scope.
+"""
+
+GRADES = "ABCDF"
+OTHERS_LABEL = "Others"
+
+
+class Board:
+    """
+    The groups of one scope, sorted per grade letter.
+
+    ...
+
+    Attributes
+    ----------
+    rows : list
+        Distribution rows with "label", "count" and aprec..fprec.
+    orders : dict
+        Grade letter -> row indexes from the highest to the lowest share of that grade.
+    prefix_counts : dict
+        Grade letter -> section counts summed over the first i rows of that order.
+    prefix_sums : dict
+        Grade letter -> per grade field sums of percentage * count over the first i rows.
+    """
+
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.orders, self.prefix_counts, self.prefix_sums = {}, {}, {}
+        for grade in GRADES:
+            field = grade.lower() + "prec"
+            # Label breaks ties so the same data always gives the same board
+            order = sorted(range(len(rows)), key=lambda i: (-rows[i].get(field, 0), rows[i]["label"]))
+            counts, sums = [0], [dict.fromkeys(GRADE_FIELDS, 0.0)]
+            for i in order:
+                row = rows[i]
+                counts.append(counts[-1] + row["count"])
+                sums.append({f: sums[-1][f] + row.get(f, 0) * row["count"] for f in GRADE_FIELDS})
+            self.orders[grade], self.prefix_counts[grade], self.prefix_sums[grade] = order, counts, sums
+
+
+    def slice(self, grade, k):
+        """
+        Returns the k groups with the most and the fewest of a grade and the bucket in between.
+
+        Parameters:
+            grade (str): Letter grade (A, B, C, D or F).
+            k (int): Number of groups at each end.
+
+        Returns:
+            dict: "top" (most first), "bottom" (most first, so the fewest is last), "others"
+                  (None when every group is listed) and "total_groups".
+        """
+        order, counts, sums = self.orders[grade], self.prefix_counts[grade], self.prefix_sums[grade]
+        total = len(order)
+        top_end = min(k, total)
+        bottom_start = max(top_end, total - k)
+
+        others = None
+        if bottom_start > top_end:
+            count = counts[bottom_start] - counts[top_end]
+            others = {"label": OTHERS_LABEL, "groups": bottom_start - top_end, "count": count}
+            for field in GRADE_FIELDS:
+                total_sum = sums[bottom_start][field] - sums[top_end][field]
+                others[field] = total_sum / count if count else 0.0
+
+        return {
+            "top": [self.rows[i] for i in order[:top_end]],
+            "bottom": [self.rows[i] for i in order[bottom_start:]],
+            "others": others,
+            "total_groups": total,
+        }
+
+
+class Leaderboard:
+    """
+    In-memory cache of Boards per filter scope, cleared when the data version changes.
+
+    ...
+
+    Attributes
+    ----------
+    source : callable
+        source(query, group_by, version) returns the distribution rows of a scope,
+        e.g. from the rollup collections or the columnar store.
+    max_boards : int
+        Number of scopes kept, least recently used ones are dropped first.
+
+
+    Methods
+    -------
+    get(query, group_by, grade, k, version):
+        Returns the top and bottom k groups of a scope for a grade letter and the others bucket.
+
+    stats():
+        Returns the number of boards held and the data version they belong to.
+    """
+
+
+    def __init__(self, source, max_boards=256):
+        """
+        Initializes an empty leaderboard.
+
+        Parameters:
+            source (callable): Returns distribution rows with a "count" for (query, group_by, version).
+            max_boards (int): Number of scopes kept in memory.
+        """
+        self.source = source
+        self.max_boards = max_boards
+        self._boards = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+
+    def _board(self, query, group_by, version):
+        key = (tuple(sorted(query.items())), group_by)
+        with self._lock:
+            if version != self._version:
+                self._boards.clear()
+                self._version = version
+            board = self._boards.get(key)
+            if board is not None:
+                self._boards.move_to_end(key)
+                return board
+
+        # Built outside the lock, two requests for a new scope may both build it
+        board = Board(self.source(query, group_by, version))
+        with self._lock:
+            if version == self._version:
+                self._boards[key] = board
+                while len(self._boards) > self.max_boards:
+                    self._boards.popitem(last=False)
+        return board
+
+
+    def get(self, query, group_by, grade="A", k=10, version=None):
+        """
+        Returns the top and bottom k groups of a scope for a grade letter and the others bucket.
+
+        Parameters:
+            query (dict): Query from build_distribution_query.
+            group_by (str): "course" or "instructor".
+            grade (str): Letter grade (A, B, C, D or F).
+            k (int): Number of groups at each end.
+            version (int): Current data version.
+
+        Returns:
+            dict: See Board.slice, plus the grade and grouping.
+
+        Raises:
+            ValueError: If the grade is not one of A, B, C, D or F.
+        """
+        grade = (grade or "A").upper()
+        if grade not in GRADES:
+            raise ValueError(f"Invalid grade: {grade}")
+        result = self._board(query, group_by, version).slice(grade, k)
+        return {"grade": grade, "group_by": group_by, **result}
+
+
+    def stats(self):
+        """
+        Returns the number of boards held and the data version they belong to.
+        """
+        with self._lock:
+            return {"boards": len(self._boards), "data_version": self._version}
@@ -0,0 +1,321 @@
+import bisect
+import threading
+import time
+from flask import request
+from pymongo import monitoring
+
+"""
+metrics.py
+
+In-process metrics for the EasyA app, served at /metrics in the Prometheus text format.
+- Per route request latency histograms.
+- MongoDB commands counted and timed through a pymongo command listener, overall and per
+  request, so a page that issues one query per item (an N+1 pattern) stands out.
+- Duration and record throughput of the background ingest, scrape and merge jobs.
+Requests slower than SLOW_REQUEST_SECONDS are logged with their MongoDB command breakdown.
+The registry lives in one process. Under gunicorn every worker keeps its own counts, so the
+app labels every series with the worker pid: sum over pid in queries, and read a change of
+easya_process_start_time_seconds as a worker restart rather than a counter reset.
+"""
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+JOB_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# Metric name -> (type, help text)
+METRICS = {
+    "easya_http_request_duration_seconds": ("histogram", "Request latency by route, method and status."),
+    "easya_http_request_mongo_commands": ("histogram", "MongoDB commands issued per request, by route."),
+    "easya_mongo_commands_total": ("counter", "MongoDB commands by command name and outcome."),
+    "easya_mongo_command_duration_seconds": ("histogram", "MongoDB command latency by command name."),
+    "easya_job_duration_seconds": ("histogram", "Background job duration by job and final status."),
+    "easya_job_records_total": ("counter", "Records processed by background jobs, by job and count name."),
+    "easya_job_records_per_second": ("gauge", "Throughput of the last finished run of a job, by count name."),
+    "easya_process_start_time_seconds": ("gauge", "Unix time the process keeping these metrics started."),
+}
+
+
+class Histogram:
+    """
+    Cumulative bucket histogram like the Prometheus client keeps.
+
+    ...
+
+    Attributes
+    ----------
+    buckets : tuple
+        Upper bounds of the buckets, +Inf is implied.
+    counts : list
+        Observations per bucket (not cumulative).
+    sum : float
+        Sum of all observed values.
+    count : int
+        Number of observations.
+    """
+
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    pymongo command listener that reports every finished command to a Metrics instance.
+    Pass it to the client, e.g. PyMongo(app, event_listeners=[metrics.listener]).
+    """
+
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+
+    def started(self, event):
+        pass
+
+
+    def succeeded(self, event):
+        self.metrics.record_command(event.command_name, event.duration_micros / 1e6)
+
+
+    def failed(self, event):
+        self.metrics.record_command(event.command_name, event.duration_micros / 1e6, failed=True)
+
+
+class Metrics:
+    """
+    Thread safe metrics registry with Flask request hooks and a Prometheus text renderer.
+
+    ...
+
+    Attributes
+    ----------
+    slow_request_seconds : float
+        Requests at least this slow are logged, 0 disables the log.
+    logger : logging.Logger
+        Logger for slow requests, e.g. app.logger.
+    listener : MongoCommandListener
+        Command listener to register with the MongoDB client.
+    const_labels : dict
+        Labels added to every series, e.g. the worker pid.
+
+
+    Methods
+    -------
+    init_app(app):
+        Times every request of a Flask app.
+
+    record_command(command, seconds, failed=False):
+        Records a finished MongoDB command.
+
+    record_job(job):
+        Records the duration and record counts of a finished background job.
+
+    render():
+        Returns all metrics in the Prometheus text format.
+    """
+
+
+    def __init__(self, slow_request_seconds=0, logger=None, clock=time.perf_counter, const_labels=None):
+        """
+        Initializes an empty registry.
+
+        Parameters:
+            slow_request_seconds (float): Requests at least this slow are logged, 0 disables the log.
+            logger (logging.Logger): Logger for slow requests.
+            clock (callable): Time source, replaceable in tests.
+            const_labels (dict): Labels added to every series, e.g. {"pid": os.getpid()}.
+        """
+        self.slow_request_seconds = slow_request_seconds
+        self.logger = logger
+        self.clock = clock
+        self.const_labels = const_labels or {}
+        self.listener = MongoCommandListener(self)
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._values = {}      # (name, labels) -> counter or gauge value
+        self._request = threading.local()
+        self._set("easya_process_start_time_seconds", {}, time.time())
+
+
+    def _observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+
+    def _inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def _set(self, name, labels, value):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+
+    # REQUESTS
+    def init_app(self, app):
+        """
+        Registers request hooks that time every request of a Flask app.
+
+        Parameters:
+            app (flask.Flask): The app to instrument.
+        """
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+
+    def _start_request(self):
+        self._request.started = self.clock()
+        self._request.commands = []
+
+
+    def _finish_request(self, response):
+        started = getattr(self._request, "started", None)
+        commands = getattr(self._request, "commands", None) or []
+        self._request.started = self._request.commands = None
+        if started is None:
+            return response
+
+        seconds = self.clock() - started
+        # The route pattern, not the path, keeps the number of label values bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        self._observe("easya_http_request_duration_seconds",
+                      {"route": route, "method": request.method, "status": str(response.status_code)},
+                      seconds, LATENCY_BUCKETS)
+        self._observe("easya_http_request_mongo_commands", {"route": route}, len(commands), COMMAND_COUNT_BUCKETS)
+
+        if self.slow_request_seconds and seconds >= self.slow_request_seconds and self.logger:
+            self.logger.warning(
+                "Slow request: %s %s took %.3fs, %s", request.method, request.full_path.rstrip("?"),
+                seconds, describe_commands(commands)
+            )
+        return response
+
+
+    # MONGODB
+    def record_command(self, command, seconds, failed=False):
+        """
+        Records a finished MongoDB command, and adds it to the current request if there is one.
+
+        Parameters:
+            command (str): Command name, e.g. "find" or "aggregate".
+            seconds (float): Command duration.
+            failed (bool): Whether the command failed.
+        """
+        self._inc("easya_mongo_commands_total", {"command": command, "outcome": "failed" if failed else "succeeded"})
+        self._observe("easya_mongo_command_duration_seconds", {"command": command}, seconds, LATENCY_BUCKETS)
+
+        commands = getattr(self._request, "commands", None)
+        if commands is not None:
+            commands.append((command, seconds))
+
+
+    # BACKGROUND JOBS
+    def record_job(self, job):
+        """
+        Records the duration and record counts of a finished background job.
+        Registered with JobRunner.add_finish_listener.
+
+        Parameters:
+            job (dict): The final job document.
+        """
+        name = job.get("name", "unknown")
+        duration = job.get("duration") or 0.0
+        self._observe("easya_job_duration_seconds", {"job": name, "status": job.get("status", "unknown")},
+                      duration, JOB_BUCKETS)
+
+        for count, value in (job.get("counts") or {}).items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            self._inc("easya_job_records_total", {"job": name, "count": count}, value)
+            if duration > 0 and job.get("status") == "succeeded":
+                self._set("easya_job_records_per_second", {"job": name, "count": count}, value / duration)
+
+
+    # EXPORT
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        with self._lock:
+            histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+            values = sorted(self._values.items())
+
+        const = tuple((key, str(value)) for key, value in sorted(self.const_labels.items()))
+        histograms = [((metric, const + labels), data) for (metric, labels), data in histograms]
+        values = [((metric, const + labels), value) for (metric, labels), value in values]
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            if kind == "histogram":
+                for (metric, labels), (buckets, counts, total, count) in histograms:
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else format_value(bound)
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+            else:
+                for (metric, labels), value in values:
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def describe_commands(commands):
+    """
+    Summarizes the MongoDB commands of a request for the slow request log.
+
+    Parameters:
+        commands (list): (command name, seconds) pairs.
+
+    Returns:
+        str: e.g. "7 mongo commands in 0.120s (find x5, aggregate x2)".
+    """
+    if not commands:
+        return "no mongo commands"
+
+    counts = {}
+    for command, _ in commands:
+        counts[command] = counts.get(command, 0) + 1
+    breakdown = ", ".join(f"{command} x{count}" for command, count in sorted(counts.items(), key=lambda c: -c[1]))
+    total = sum(seconds for _, seconds in commands)
+    return f"{len(commands)} mongo commands in {total:.3f}s ({breakdown})"
@@ -1,9 +1,14 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution
+from html.parser import HTMLParser
+import asyncio
 import json
 import os
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from scrape_cache import HttpDiskCache
+from scrape_async import AsyncFetcher
 
 """
 scrap.py
@@ -15,19 +20,24 @@ into a JSON file for integration with the EasyA system.
 Dependencies:
 - requests
 - BeautifulSoup (bs4)
-- concurrent.futures (for multithreading)
+- aiohttp and asyncio (for concurrent downloads, see scrape_async.py)
 - re (for regex parsing)
 - json (for saving extracted data)
 
 Usage:
 - Run this script to scrape faculty names from archived pages.
 - Faculty names will be saved in `faculty_data.json`.
+- Downloaded pages are cached in `output/http_cache`, archived snapshots are never downloaded twice.
 """
 
 # Define Main URL and Base URL for Web Archive
 MainUrl = "https://web.archive.org/web/20140901091007/http://catalog.uoregon.edu/arts_sciences/"
 baseUrl = "https://web.archive.org"
 
+# Async engine limits, requests in flight and requests per second to each host
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "10"))
+SCRAPER_RATE_PER_HOST = float(os.getenv("SCRAPER_RATE_PER_HOST", "2"))
+
 # Output directory setup
 output = os.path.join(os.path.dirname(__file__), "output")
 os.makedirs(output, exist_ok=True)
@@ -77,6 +87,9 @@ def requests_retry_session(retries=5, backoff_factor=2):
 
 session = requests_retry_session()
 
+# Disk cache for downloaded pages, archived snapshots never change
+http_cache = HttpDiskCache(os.path.join(output, "http_cache"), session)
+
 # Function to format names as "Last, First Middle"
 def format_name(name):
     parts = name.strip().split()
@@ -85,6 +98,36 @@ def format_name(name):
     return name  # Return as-is if it's a single name
 
 # Get department catalog links and filter only natural sciences
+def parse_catalog(content):
+    """
+    Extracts the natural sciences department links from the main archive page.
+
+    Parameters:
+        content (bytes): HTML of the main archive page.
+
+    Returns:
+        dict: A dictionary of department URLs mapped to department codes.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+
+    catalogs = [a["href"] for a in soup.find_all("a", href=True) if "arts_sciences/" in a["href"]]
+    links = [link if link.startswith("http") else baseUrl + link for link in catalogs]
+
+    filtered_links = {}
+    for link in links:
+        for dept_code, dept_name in NATURAL_SCIENCES_DEPARTMENTS:
+            # Special case for CIS
+            if dept_code == "CIS" and "computerandinfoscience" in link.lower():
+                filtered_links[link] = dept_code
+                break
+            # General case for other departments
+            elif dept_name.replace(" ", "").lower() in link.replace(" ", "").lower():
+                filtered_links[link] = dept_code
+                break
+
+    return filtered_links
+
+
 def get_catalog(url):
     """
     Retrieves department catalog links from the main archive page.
@@ -96,32 +139,238 @@ def get_catalog(url):
         dict: A dictionary of department URLs mapped to department codes.
     """
     try:
-        response = session.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        catalogs = [a["href"] for a in soup.find_all("a", href=True) if "arts_sciences/" in a["href"]]
-        links = [link if link.startswith("http") else baseUrl + link for link in catalogs]
-
-        filtered_links = {}
-        for link in links:
-            for dept_code, dept_name in NATURAL_SCIENCES_DEPARTMENTS:
-                # Special case for CIS
-                if dept_code == "CIS" and "computerandinfoscience" in link.lower():
-                    filtered_links[link] = dept_code
-                    break
-                # General case for other departments
-                elif dept_name.replace(" ", "").lower() in link.replace(" ", "").lower():
-                    filtered_links[link] = dept_code
-                    break
-
-        return filtered_links
+        return parse_catalog(http_cache.get(url, timeout=10))
     except Exception as e:
         print(f"Could not get catalog links: {e}")
         return {}
 
 
+# Faculty entries look like "Jane Doe, associate professor (...)" inside <p> elements
+FACULTY_PATTERN = re.compile(r"([A-Z][a-zA-Z\-\.\s]+),\s*(professor|assistant professor|associate professor|lecturer|instructor)", re.IGNORECASE)
+# Every match contains one of these words, texts without them are not run through FACULTY_PATTERN
+FACULTY_TITLE = re.compile(r"professor|lecturer|instructor", re.IGNORECASE)
+
+# Same rules BeautifulSoup's html.parser tree uses: void tags close themselves, text in
+# string container tags (script, style, template, ...) is left out of get_text() and
+# whitespace-only strings are collapsed outside of pre/textarea
+VOID_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+HIDDEN_TEXT_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+PRESERVE_WHITESPACE_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+ASCII_SPACES = frozenset("\x20\x0a\x09\x0c\x0d")
+
+
+class ParagraphTextParser(HTMLParser):
+    """
+    Streaming tokenizer that collects the text of every <p> element without building a tree.
+    Produces the same texts as `[p.get_text() for p in BeautifulSoup(html, "html.parser").find_all("p")]`,
+    in the order the paragraphs close.
+
+    ...
+
+    Attributes
+    ----------
+    texts : list
+        Text of each closed <p> element.
+
+
+    Methods
+    -------
+    feed(data):
+        Parses more HTML text (inherited from html.parser.HTMLParser).
+
+    close():
+        Flushes the remaining text and closes the tags still open.
+    """
+
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.texts = []
+        self._open = []         # open tag names, like the BeautifulSoup tag stack
+        self._paragraphs = []   # text parts of the open <p> elements
+        self._hidden = 0        # open string container tags
+        self._preserve = 0      # open pre/textarea tags
+        self._closed_void = []  # void tags closed on their start tag, a later </tag> is ignored
+        self._pending = []      # text since the last tag, one string in the BeautifulSoup tree
+
+
+    def _flush(self, hidden=None):
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+        if not self._preserve and all(c in ASCII_SPACES for c in text):
+            text = "\n" if "\n" in text else " "
+        if self._hidden if hidden is None else hidden:
+            return
+        for parts in self._paragraphs:
+            parts.append(text)
+
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self._flush()
+        self._open.append(tag)
+        if tag == "p":
+            self._paragraphs.append([])
+        elif tag in HIDDEN_TEXT_TAGS:
+            self._hidden += 1
+        elif tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve += 1
+
+        if tag in VOID_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self._closed_void.append(tag)
+
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self._closed_void:
+            self._closed_void.remove(tag)
+            return
+
+        # An end tag closes everything opened after the matching start tag, a stray one is ignored
+        self._flush()
+        if tag not in self._open:
+            return
+        while True:
+            name = self._open.pop()
+            if name == "p":
+                self.texts.append("".join(self._paragraphs.pop()))
+            elif name in HIDDEN_TEXT_TAGS:
+                self._hidden -= 1
+            elif name in PRESERVE_WHITESPACE_TAGS:
+                self._preserve -= 1
+            if name == tag:
+                return
+
+
+    def handle_data(self, data):
+        self._pending.append(data)
+
+
+    def handle_entityref(self, name):
+        self.handle_data(EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name, f"&{name}"))
+
+
+    def handle_charref(self, name):
+        # "&#65q" is read as "A" followed by "q", like BeautifulSoup does
+        base, digits = (16, "0123456789abcdefABCDEF") if name[:1] in "xX" else (10, "0123456789")
+        number = name[1:] if base == 16 else name
+        end = 0
+        while end < len(number) and number[end] in digits:
+            end += 1
+        if end:
+            self.handle_data(UnicodeDammit.numeric_character_reference(int(number[:end], base))[0])
+        self.handle_data(number[end:] if end else name)
+
+
+    def handle_comment(self, data):
+        self._flush()
+
+
+    def handle_decl(self, decl):
+        self._flush()
+
+
+    def handle_pi(self, data):
+        self._flush()
+
+
+    def unknown_decl(self, data):
+        # CDATA sections count as text, even inside script/style/template, other declarations do not
+        self._flush()
+        if data.upper().startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+            self._flush(hidden=False)
+        else:
+            self._pending = []
+
+
+    def close(self):
+        """
+        Flushes the remaining text and closes the tags still open.
+        """
+        super().close()
+        self._flush()
+        while self._open:
+            self.handle_endtag(self._open[-1], check_already_closed=False)
+
+
+def paragraph_texts(content):
+    """
+    Returns the text of every <p> element of an HTML page.
+
+    Parameters:
+        content (bytes or str): HTML of the page.
+
+    Returns:
+        list: The paragraph texts.
+    """
+    if isinstance(content, bytes):
+        # Same encoding detection BeautifulSoup applies to bytes
+        content = UnicodeDammit(content, is_html=True).unicode_markup
+    parser = ParagraphTextParser()
+    parser.feed(content)
+    parser.close()
+    return parser.texts
+
+
+def faculty_from_texts(texts, department_code):
+    faculty_names = set()
+    for text in texts:
+        if not FACULTY_TITLE.search(text):
+            continue
+        for match in FACULTY_PATTERN.findall(text):
+            faculty_names.add(format_name(match[0]))
+
+    return [{"name": name, "department": department_code} for name in faculty_names]
+
+
 # Extract faculty names from a department page
+def parse_faculty(content, department_code):
+    """
+    Extracts faculty names from the HTML of a department page.
+    Uses the streaming ParagraphTextParser, which skips building a BeautifulSoup tree.
+
+    Parameters:
+        content (bytes): HTML of the department page.
+        department_code (str): Department code (e.g., "CIS" for Computer Science).
+
+    Returns:
+        list: A list of dictionaries containing faculty names and department.
+    """
+    return faculty_from_texts(paragraph_texts(content), department_code)
+
+
+def parse_faculty_soup(content, department_code):
+    """
+    Reference version of parse_faculty that builds the full BeautifulSoup tree.
+    Kept to check the streaming parser against, see tests and benchmarks/parse_faculty.py.
+
+    Parameters:
+        content (bytes): HTML of the department page.
+        department_code (str): Department code (e.g., "CIS" for Computer Science).
+
+    Returns:
+        list: A list of dictionaries containing faculty names and department.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    return faculty_from_texts((p.get_text() for p in soup.find_all("p")), department_code)
+
+
+def log_faculty(url, faculty_data):
+    # Same progress output for the threaded and the async paths
+    if not faculty_data:
+        print(f"No faculty found in {url}, skipping department.")
+    else:
+        print(f"Extracted {len(faculty_data)} faculty members from {url}")
+    return faculty_data
+
+
 def get_faculty(url, department_code):
     """
     Extracts faculty names from a department webpage.
@@ -135,52 +384,63 @@ def get_faculty(url, department_code):
     """
     try:
         print(f"Fetching: {url}")
-        response = session.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Extract Faculty Names
-        faculty_names = set()
-        faculty_pattern = re.compile(r"([A-Z][a-zA-Z\-\.\s]+),\s*(professor|assistant professor|associate professor|lecturer|instructor)", re.IGNORECASE)
-        for p in soup.find_all("p"):
-            matches = faculty_pattern.findall(p.get_text())
-            for match in matches:
-                formatted_name = format_name(match[0])
-                faculty_names.add(formatted_name)
-
-        if not faculty_names:
-            print(f"No faculty found in {url}, skipping department.")
-            return []
-
-        faculty_data = [{"name": name, "department": department_code} for name in faculty_names]
-
-        print(f"Extracted {len(faculty_names)} faculty members from {url}")
-        return faculty_data
+        return log_faculty(url, parse_faculty(http_cache.get(url, timeout=10), department_code))
 
     except Exception as e:
         print(f"Error scraping {url}: {e}")
         return []
 
-# Scrape faculty data from filtered catalog links
-def scrape_faculty():
-    faculty = []
-    catalog_links = get_catalog(MainUrl)
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_link = {executor.submit(get_faculty, link, dept_code): link for link, dept_code in catalog_links.items()}
+# Scrape faculty data from filtered catalog links with the asyncio engine
+async def scrape_faculty_async(main_url=MainUrl, concurrency=SCRAPER_CONCURRENCY, rate_per_host=SCRAPER_RATE_PER_HOST):
+    """
+    Scrapes every natural sciences department page concurrently.
+
+    Parameters:
+        main_url (str): The main archive URL.
+        concurrency (int): Maximum number of requests in flight.
+        rate_per_host (float): Requests per second allowed to each host.
+
+    Returns:
+        list: A list of dictionaries containing faculty names and department.
+    """
+    async with AsyncFetcher(concurrency=concurrency, rate_per_host=rate_per_host, cache=http_cache) as fetcher:
+        try:
+            catalog_links = parse_catalog(await fetcher.fetch(main_url))
+        except Exception as e:
+            print(f"Could not get catalog links: {e}")
+            return []
 
-        for future in as_completed(future_to_link):
+        async def department(link, dept_code):
+            print(f"Fetching: {link}")
             try:
-                faculty.extend(future.result())
+                return log_faculty(link, parse_faculty(await fetcher.fetch(link), dept_code))
             except Exception as e:
-                print(f"Error processing {future_to_link[future]}: {e}")
+                print(f"Error scraping {link}: {e}")
+                return []
+
+        results = await asyncio.gather(*(department(link, code) for link, code in catalog_links.items()))
+        print(f"Requests: {fetcher.stats()}")
+
+    return [entry for faculty in results for entry in faculty]
+
+
+def scrape_faculty(main_url=MainUrl):
+    """
+    Runs the asyncio scraper to completion from synchronous code (e.g. a background job thread).
 
-    return faculty
+    Parameters:
+        main_url (str): The main archive URL.
+
+    Returns:
+        list: A list of dictionaries containing faculty names and department.
+    """
+    return asyncio.run(scrape_faculty_async(main_url))
 
 # Main function to scrape faculty data
-def run_scraper():
+def run_scraper(main_url=MainUrl):
     print("Starting Scraper...")
-    faculty_data = scrape_faculty()
+    faculty_data = scrape_faculty(main_url)
     print(f"Scraped {len(faculty_data)} faculty entries.")
 
     if not faculty_data:
@@ -188,6 +448,9 @@ def run_scraper():
     else:
         print(f"Successfully collected {len(faculty_data)} faculty records.")
 
+    stats = http_cache.stats()
+    print(f"Page cache: {stats['hits']} hits, {stats['revalidated']} revalidated, {stats['misses']} downloaded.")
+
     return faculty_data
 
 # Flask integration
@@ -201,7 +464,7 @@ def scraper_api():
     data = run_scraper()
     with open("faculty_data.json", "w") as file:
         json.dump(data, file, indent=4)
-    return {"status": "success", "message": f"Scraped {len(data)} faculty records."}
+    return {"status": "success", "message": f"Scraped {len(data)} faculty records.", "cache": http_cache.stats()}
 
 if __name__ == "__main__":
     scraper_api()
@@ -0,0 +1,195 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+"""
+scrape_async.py
+
+Asyncio download engine for the faculty scraper.
+Pages are fetched with aiohttp under a global concurrency limit and a token bucket
+per host, so many catalog pages can be in flight without one thread per request.
+Timeouts and retries with exponential backoff are awaited, never slept in a thread.
+"""
+
+# Same statuses the requests retry session retries on, plus rate limiting
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter, allows `rate` requests per second with bursts of `capacity`.
+
+    ...
+
+    Attributes
+    ----------
+    rate : float
+        Tokens added per second.
+    capacity : float
+        Maximum number of tokens stored.
+
+
+    Methods
+    -------
+    acquire():
+        Waits until a token is available and takes it.
+    """
+
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        """
+        Initializes a full bucket.
+
+        Parameters:
+            rate (float): Tokens added per second.
+            capacity (float): Maximum number of tokens stored.
+            clock (callable): Time source, replaceable in tests.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+
+    async def acquire(self):
+        """
+        Waits until a token is available and takes it.
+        """
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncFetcher:
+    """
+    Fetches pages concurrently with a concurrency limit, per-host rate limiting, timeouts and retries.
+    Use as `async with AsyncFetcher(...) as fetcher: body = await fetcher.fetch(url)`.
+
+    ...
+
+    Attributes
+    ----------
+    concurrency : int
+        Maximum number of requests in flight.
+    rate_per_host : float
+        Requests per second allowed to each host.
+    burst : int
+        Requests a host can receive at once before the rate applies.
+    timeout : float
+        Total timeout of one request attempt in seconds.
+    retries : int
+        Retry attempts after the first failure.
+    backoff : float
+        Base delay of the exponential backoff in seconds.
+    cache : scrape_cache.HttpDiskCache
+        Optional disk cache, archived pages in it are not requested at all.
+
+
+    Methods
+    -------
+    fetch(url):
+        Returns the body of url.
+
+    stats():
+        Returns request, retry and failure counters.
+    """
+
+
+    def __init__(self, concurrency=10, rate_per_host=2.0, burst=4, timeout=10, retries=5, backoff=0.5, cache=None):
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self._buckets = {}
+        self._counters = {"requests": 0, "retries": 0, "failures": 0}
+        self._session = None
+        self._semaphore = None
+
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+
+    def _bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return self._buckets[host]
+
+
+    async def _request(self, url, headers):
+        # One logical request, retried with exponential backoff on timeouts, connection errors and RETRY_STATUSES
+        for attempt in range(self.retries + 1):
+            await self._bucket(url).acquire()
+            try:
+                async with self._semaphore:
+                    self._counters["requests"] += 1
+                    async with self._session.get(url, headers=headers) as response:
+                        if response.status not in RETRY_STATUSES:
+                            if response.status != 304:
+                                response.raise_for_status()
+                            return response.status, await response.read(), dict(response.headers)
+                        error = aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status, message=response.reason
+                        )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRY_STATUSES:
+                    self._counters["failures"] += 1
+                    raise
+                error = e
+
+            if attempt < self.retries:
+                self._counters["retries"] += 1
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+        self._counters["failures"] += 1
+        raise error
+
+
+    async def fetch(self, url):
+        """
+        Returns the body of url, going through the disk cache when one is set.
+
+        Parameters:
+            url (str): URL to fetch.
+
+        Returns:
+            bytes: The response body.
+
+        Raises:
+            aiohttp.ClientError: If the request still fails after all retries.
+        """
+        if self.cache is not None:
+            return await self.cache.get_async(url, self._request)
+
+        _, body, _ = await self._request(url, {})
+        return body
+
+
+    def stats(self):
+        """
+        Returns request, retry and failure counters.
+
+        Returns:
+            dict: The counters.
+        """
+        return dict(self._counters)
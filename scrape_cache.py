@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+"""
+scrape_cache.py
+
+Persistent on-disk HTTP cache for the faculty scraper.
+Response bodies are stored content-addressed (by the SHA-256 of the body) under
+objects/, and each URL gets a small JSON entry under urls/ pointing at its body
+together with the validators (ETag, Last-Modified) the server sent.
+
+Wayback Machine snapshot URLs (/web/<14 digit timestamp>/...) never change, so
+they are served straight from disk. Other URLs are revalidated with a conditional
+request and only downloaded again when the server says they changed.
+"""
+
+# Archived snapshots are immutable, e.g. https://web.archive.org/web/20140901091007/http://...
+IMMUTABLE_URL = re.compile(r"^https?://web\.archive\.org/web/\d{14}[a-z_]*/")
+
+
+class HttpDiskCache:
+    """
+    A content-addressed disk cache in front of a requests session.
+
+    ...
+
+    Attributes
+    ----------
+    directory : str
+        Root directory of the cache.
+    session : requests.Session
+        Session used for downloads and revalidation.
+
+
+    Methods
+    -------
+    get(url, timeout=10):
+        Returns the body of url, from disk when possible.
+
+    get_async(url, fetch):
+        Same as get, downloading through an async fetch function.
+
+    stats():
+        Returns the hit/miss/revalidation counters.
+    """
+
+
+    def __init__(self, directory, session):
+        """
+        Initializes the cache and creates its directories.
+
+        Parameters:
+            directory (str): Root directory of the cache.
+            session (requests.Session): Session used for downloads and revalidation.
+        """
+        self.directory = directory
+        self.session = session
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "urls"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "revalidated": 0, "bytes_from_cache": 0, "bytes_downloaded": 0}
+
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+
+    def _url_path(self, url):
+        return os.path.join(self.directory, "urls", hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+
+    def _write_atomic(self, path, data):
+        # Write to a temporary file first so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+
+    def _load(self, url):
+        # Returns (entry, body) for a cached url, or (None, None)
+        try:
+            with open(self._url_path(url)) as file:
+                entry = json.load(file)
+            with open(self._object_path(entry["sha256"]), "rb") as file:
+                return entry, file.read()
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+
+    def _store(self, url, body, headers):
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            self._write_atomic(object_path, body)
+
+        entry = {
+            "url": url,
+            "sha256": digest,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "stored_at": time.time(),
+        }
+        self._write_atomic(self._url_path(url), json.dumps(entry).encode())
+        return body
+
+
+    def _lookup(self, url):
+        # Returns (cached body or None, fresh) and the conditional headers to send
+        entry, body = self._load(url)
+        if entry is None:
+            return None, False, {}
+
+        if IMMUTABLE_URL.match(url):
+            return body, True, {}
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return body, False, headers
+
+
+    def _hit(self, body, counter="hits"):
+        self._count(counter)
+        self._count("bytes_from_cache", len(body))
+        return body
+
+
+    def _downloaded(self, url, body, headers):
+        self._count("misses")
+        self._count("bytes_downloaded", len(body))
+        return self._store(url, body, headers)
+
+
+    def get(self, url, timeout=10):
+        """
+        Returns the body of url. Immutable archive URLs are served from disk without a request,
+        other cached URLs are revalidated with If-None-Match/If-Modified-Since.
+
+        Parameters:
+            url (str): URL to fetch.
+            timeout (float): Request timeout in seconds.
+
+        Returns:
+            bytes: The response body.
+
+        Raises:
+            requests.HTTPError: If the server answers with an error status.
+        """
+        cached, fresh, headers = self._lookup(url)
+        if fresh:
+            return self._hit(cached)
+
+        response = self.session.get(url, timeout=timeout, headers=headers)
+        if cached is not None and response.status_code == 304:
+            return self._hit(cached, "revalidated")
+
+        response.raise_for_status()
+        return self._downloaded(url, response.content, response.headers)
+
+
+    async def get_async(self, url, fetch):
+        """
+        Async version of get for the asyncio crawler.
+
+        Parameters:
+            url (str): URL to fetch.
+            fetch (coroutine function): Called as fetch(url, headers), returns (status, body, response headers)
+                                        and raises on error statuses other than 304.
+
+        Returns:
+            bytes: The response body.
+        """
+        cached, fresh, headers = self._lookup(url)
+        if fresh:
+            return self._hit(cached)
+
+        status, body, response_headers = await fetch(url, headers)
+        if cached is not None and status == 304:
+            return self._hit(cached, "revalidated")
+
+        return self._downloaded(url, body, response_headers)
+
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hits, misses, revalidations and bytes served from cache or downloaded.
+        """
+        with self._lock:
+            return dict(self._counters)
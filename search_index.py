@@ -0,0 +1,205 @@
+import bisect
+import threading
+
+"""
+search_index.py
+
+In-memory prefix search over the dropdown catalog, used by the typeahead endpoints
+/api/search/teachers and /api/search/classes instead of embedding every teacher and class
+in the user page.
+Each entry is indexed under the lowercase start of every word of its label (and under the
+course number for classes), in a sorted list that a prefix lookup bisects into, with one
+index per department so a department filter does not scan other departments. The index is
+rebuilt from the stored catalog when the data version changes.
+"""
+
+
+class PrefixIndex:
+    """
+    Sorted (key, label) pairs searched by key prefix with bisect.
+
+    ...
+
+    Attributes
+    ----------
+    keys : list
+        Lowercase search keys in sorted order.
+    labels : list
+        The label each key belongs to, in the same order.
+    """
+
+
+    def __init__(self, entries):
+        """
+        Builds the index.
+
+        Parameters:
+            entries (iterable): (label, search keys) pairs.
+        """
+        pairs = sorted({(key.lower(), label) for label, keys in entries for key in keys if key})
+        self.keys = [key for key, _ in pairs]
+        self.labels = [label for _, label in pairs]
+
+
+    def search(self, prefix, limit, accept=None):
+        """
+        Returns labels with a key starting with prefix, in key order without duplicates.
+
+        Parameters:
+            prefix (str): Typed text, matched case insensitively.
+            limit (int): Maximum number of labels.
+            accept (callable): Optional filter on the label.
+
+        Returns:
+            list: Matching labels.
+        """
+        prefix = prefix.lower()
+        results, seen = [], set()
+        for i in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix) or len(results) >= limit:
+                break
+            label = self.labels[i]
+            if label not in seen and (accept is None or accept(label)):
+                seen.add(label)
+                results.append(label)
+        return results
+
+
+def word_keys(label):
+    """
+    Returns the search keys of a label, the label itself and the text from each later word on,
+    e.g. "Doe, John" -> ["Doe, John", "John"].
+    """
+    words = label.replace(",", " ").split()
+    return [label] + [" ".join(words[i:]) for i in range(1, len(words))]
+
+
+class CatalogSearch:
+    """
+    Typeahead search over the teachers and classes of the dropdown catalog.
+
+    ...
+
+    Attributes
+    ----------
+    version : int
+        Data version the indexes were built from, None before the first build.
+
+
+    Methods
+    -------
+    build(catalog, version):
+        Builds the indexes from a stored catalog document.
+
+    ensure_current(load_catalog, version):
+        Rebuilds the indexes if they were built from another data version.
+
+    teachers(prefix, department="", course="", limit=20):
+        Returns teachers whose name has a word starting with prefix.
+
+    classes(prefix, department="", teacher="", limit=20):
+        Returns classes whose code or number starts with prefix.
+    """
+
+
+    def __init__(self):
+        self.version = None
+        self._teachers = {}  # department ("" for all) -> PrefixIndex
+        self._classes = {}
+        self._teacher_info = {}
+        self._class_info = {}
+        self._lock = threading.Lock()
+
+
+    def build(self, catalog, version):
+        """
+        Builds the indexes from a stored catalog document.
+
+        Parameters:
+            catalog (dict): The catalog document, see FilterCatalog.rebuild.
+            version (int): Data version of the catalog.
+        """
+        teacher_info = {t["name"]: t for t in catalog.get("teachers", [])}
+        class_info = {c["course"]: c for c in catalog.get("classes", [])}
+
+        def by_department(info):
+            # Teachers listed in several departments are found under each of them
+            groups = {"": list(info.values())}
+            for item in info.values():
+                for dept in item.get("departments") or [item.get("department")]:
+                    groups.setdefault(dept, []).append(item)
+            return groups
+
+        teachers = {
+            dept: PrefixIndex((t["name"], word_keys(t["name"])) for t in items)
+            for dept, items in by_department(teacher_info).items()
+        }
+        classes = {
+            dept: PrefixIndex((c["course"], [c["course"], c["course"].lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ ")]) for c in items)
+            for dept, items in by_department(class_info).items()
+        }
+
+        with self._lock:
+            self._teachers, self._classes = teachers, classes
+            self._teacher_info, self._class_info = teacher_info, class_info
+            self.version = version
+
+
+    def ensure_current(self, load_catalog, version):
+        """
+        Rebuilds the indexes if they were built from another data version.
+
+        Parameters:
+            load_catalog (callable): Returns the stored catalog document.
+            version (int): Current data version.
+        """
+        if self.version != version:
+            self.build(load_catalog(), version)
+
+
+    def teachers(self, prefix, department="", course="", limit=20):
+        """
+        Returns teachers whose name has a word starting with prefix.
+
+        Parameters:
+            prefix (str): Typed text, empty lists teachers alphabetically.
+            department (str): Only teachers of this department.
+            course (str): Only teachers of this class.
+            limit (int): Maximum number of results.
+
+        Returns:
+            list: {"name", "department"} dictionaries.
+        """
+        with self._lock:
+            index, info = self._teachers.get(department or ""), self._teacher_info
+            class_teachers = set(self._class_info.get(course, {}).get("teachers", [])) if course else None
+        if index is None:
+            return []
+
+        accept = (lambda name: name in class_teachers) if course else None
+        return [{"name": name, "department": info[name].get("department")}
+                for name in index.search(prefix, limit, accept)]
+
+
+    def classes(self, prefix, department="", teacher="", limit=20):
+        """
+        Returns classes whose code or number starts with prefix.
+
+        Parameters:
+            prefix (str): Typed text, e.g. "CIS2" or "210". Empty lists classes in order.
+            department (str): Only classes of this department.
+            teacher (str): Only classes this teacher taught.
+            limit (int): Maximum number of results.
+
+        Returns:
+            list: {"course", "department"} dictionaries.
+        """
+        with self._lock:
+            index, info = self._classes.get(department or ""), self._class_info
+            teacher_classes = set(self._teacher_info.get(teacher, {}).get("classes", [])) if teacher else None
+        if index is None:
+            return []
+
+        accept = (lambda course: course in teacher_classes) if teacher else None
+        return [{"course": course, "department": info[course].get("department")}
+                for course in index.search(prefix, limit, accept)]
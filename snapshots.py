@@ -0,0 +1,285 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from aggregations import build_distribution_query, rollup_distribution, sort_distribution
+from data_loader import batched, split_course_code
+
+"""
+snapshots.py
+
+Static JSON export of every filter view of the user page, for a static file server or nginx
+to serve without touching Python or MongoDB. After an ingest the exporter writes:
+- departments/<DEPT>.json      instructors of a department
+- levels/<DEPT>-<LEVEL>.json   courses of a department level
+- courses/<COURSE>.json        instructors of a course
+- instructors/<name>.json      courses of an instructor
+- catalog.json                 the dropdown maps
+- manifest.json                data version and the file of every view, written last
+Department, level and course shards hold the same rows as /api/distribution for that
+filter. A teacher shard is grouped by course instead, giving the teacher's per class
+breakdown where the user page shows one bar. All are sorted by A and rendered from the
+rollup collections by a process pool, each worker with its own MongoClient. A delta load
+only re-renders the shards of the courses and instructors it touched.
+"""
+
+VIEWS = ("departments", "levels", "courses", "instructors")
+
+# Set in each pool worker by _init_worker
+_worker_db = None
+
+
+SAFE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9-]*")
+
+
+def slugify(label):
+    """
+    Returns the file name of a label. Labels that are already safe (e.g. "CIS210") are kept,
+    others get a readable slug and a hash of the label, e.g. "Doe, John" -> "doe-john-<8 hex>",
+    so labels that only differ in punctuation or case, like "O'Neil, Pat" and "ONeil, Pat",
+    do not share a file.
+    """
+    if SAFE_NAME.fullmatch(label):
+        return label
+    slug = re.sub(r"[^a-z0-9]+", "-", label.lower()).strip("-") or "unknown"
+    return f"{slug}-{hashlib.sha1(label.encode()).hexdigest()[:8]}"
+
+
+def write_json(path, data):
+    """
+    Writes JSON atomically, so a file server never sees a half written shard.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(data, file, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def render_shards(db, out_dir, shards, version):
+    """
+    Renders shards and writes them, removing the file of a view that has no data left.
+
+    Parameters:
+        db (pymongo.database.Database): The MongoDB database connection.
+        out_dir (str): Export directory.
+        shards (list): (relative path, view, filters, query, group_by) tuples.
+        version (int): Data version written into each shard.
+
+    Returns:
+        int: Number of shards written.
+    """
+    written = 0
+    for path, view, filters, query, group_by in shards:
+        results = sort_distribution(rollup_distribution(db, query, group_by), "A")
+        target = os.path.join(out_dir, path)
+        if not results and view != "departments":
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        write_json(target, {"view": view, "filters": filters, "group_by": group_by,
+                            "data_version": version, "results": results})
+        written += 1
+    return written
+
+
+def _init_worker(mongo_uri, db_name):
+    # Every pool process opens its own MongoClient
+    global _worker_db
+    from pymongo import MongoClient
+    _worker_db = MongoClient(mongo_uri, connect=False)[db_name]
+
+
+def _render_in_worker(out_dir, shards, version):
+    return render_shards(_worker_db, out_dir, shards, version)
+
+
+class SnapshotExporter:
+    """
+    A class to export the user page filter views as static JSON files.
+
+    ...
+
+    Attributes
+    ----------
+    db : pymongo.database.Database
+        The MongoDB database connection.
+    out_dir : str
+        Export directory.
+    NATURAL_SCIENCES_DEPARTMENTS : dict
+        A mapping of department codes to full department names.
+    catalog : catalog.FilterCatalog
+        Source of the dropdown maps.
+    mongo_uri : str
+        Connection string for the pool workers, None renders in this process.
+    workers : int
+        Number of pool processes.
+
+
+    Methods
+    -------
+    list_shards():
+        Returns the files of every current view.
+
+    export(affected=None, version=0):
+        Renders every shard, or only those of the affected courses and instructors.
+    """
+
+
+    def __init__(self, db, out_dir, NATURAL_SCIENCES_DEPARTMENTS, catalog, mongo_uri=None, workers=1, chunk_size=200):
+        """
+        Initializes the exporter.
+
+        Parameters:
+            db (pymongo.database.Database): The MongoDB database connection.
+            out_dir (str): Export directory.
+            NATURAL_SCIENCES_DEPARTMENTS (dict): Mapping of department codes to full department names.
+            catalog (catalog.FilterCatalog): Source of the dropdown maps.
+            mongo_uri (str): Connection string for the pool workers, None renders in this process.
+            workers (int): Number of pool processes.
+            chunk_size (int): Shards per pool task.
+        """
+        self.db = db
+        self.out_dir = out_dir
+        self.NATURAL_SCIENCES_DEPARTMENTS = NATURAL_SCIENCES_DEPARTMENTS
+        self.catalog = catalog
+        self.mongo_uri = mongo_uri
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+
+    def list_shards(self):
+        """
+        Returns the shard of every view that currently has data, read from the rollups.
+
+        Returns:
+            dict: View name -> {label: (relative path, view, filters, query, group_by)}.
+
+        Raises:
+            ValueError: If two labels would be written to the same file.
+        """
+        departments = list(self.NATURAL_SCIENCES_DEPARTMENTS)
+        shards = {view: {} for view in VIEWS}
+
+        for dept in departments:
+            shards["departments"][dept] = self._shard("departments", dept)
+
+        for doc in self.db.rollup_course.find({"dept": {"$in": departments}}, {"course": 1, "dept": 1, "level": 1}):
+            if doc.get("level"):
+                level = f"{doc['dept']}-{doc['level']}"
+                shards["levels"].setdefault(level, self._shard("levels", level))
+            shards["courses"][doc["course"]] = self._shard("courses", doc["course"])
+
+        for name in self.db.rollup_course_instructor.distinct("instructor", {"dept": {"$in": departments}}):
+            shards["instructors"][name] = self._shard("instructors", name)
+
+        paths = {}
+        for view in VIEWS:
+            for label, shard in shards[view].items():
+                other = paths.setdefault(shard[0], label)
+                if other != label:
+                    raise ValueError(f"{label!r} and {other!r} would both be written to {shard[0]}")
+        return shards
+
+
+    def _shard(self, view, label):
+        # The user page query for each view. Departments, levels and courses also use its grouping,
+        # a teacher is grouped by course rather than by instructor, which would be a single row
+        if view == "departments":
+            return (f"departments/{slugify(label)}.json", view, {"department": label},
+                    build_distribution_query(department=label), "instructor")
+        if view == "levels":
+            return (f"levels/{slugify(label)}.json", view, {"level": label},
+                    build_distribution_query(selected_level=label), "course")
+        if view == "courses":
+            return (f"courses/{slugify(label)}.json", view, {"class": label},
+                    build_distribution_query(single_class=label), "instructor")
+        return (f"instructors/{slugify(label)}.json", view, {"teacher": label},
+                build_distribution_query(selected_teacher=label), "course")
+
+
+    def affected_shards(self, affected):
+        """
+        Returns the shards touched by a delta.
+
+        Parameters:
+            affected (dict): "courses" and "instructors" whose sections changed, see DataLoader.apply_grade_delta.
+
+        Returns:
+            list: Shards of the courses, their departments and levels, and the instructors.
+        """
+        shards = {}
+        for course in filter(None, affected.get("courses", ())):
+            dept, _, level = split_course_code(course)
+            shards[("courses", course)] = self._shard("courses", course)
+            if dept in self.NATURAL_SCIENCES_DEPARTMENTS:
+                shards[("departments", dept)] = self._shard("departments", dept)
+                if level:
+                    shards[("levels", f"{dept}-{level}")] = self._shard("levels", f"{dept}-{level}")
+        for name in filter(None, affected.get("instructors", ())):
+            shards[("instructors", name)] = self._shard("instructors", name)
+        return list(shards.values())
+
+
+    def render(self, shards, version):
+        """
+        Renders shards, split over the process pool when there are workers and a connection string.
+
+        Returns:
+            int: Number of shards written.
+        """
+        if not shards:
+            return 0
+        if self.workers <= 1 or not self.mongo_uri:
+            return render_shards(self.db, self.out_dir, shards, version)
+
+        # Spawned rather than forked: the export runs on a job thread of a threaded server, and a
+        # forked child would inherit locks held by other threads (pymongo monitors, logging)
+        chunks = list(batched(shards, self.chunk_size))
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks)), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(self.mongo_uri, self.db.name)) as pool:
+            futures = [pool.submit(_render_in_worker, self.out_dir, chunk, version) for chunk in chunks]
+            return sum(future.result() for future in futures)
+
+
+    def export(self, affected=None, version=0):
+        """
+        Renders every shard, or with affected only the shards of the changed courses and
+        instructors, then writes the catalog and the manifest. A full export also removes
+        files of views that no longer exist.
+
+        Parameters:
+            affected (dict): Optional "courses" and "instructors" changed by a delta load. Empty
+                             after a change that only affects the catalog, e.g. a faculty scrape.
+            version (int): Current data version.
+
+        Returns:
+            dict: Counts of shards written and stale files removed.
+        """
+        current = self.list_shards()
+        if affected is None:
+            shards = [shard for view in VIEWS for shard in current[view].values()]
+        else:
+            shards = self.affected_shards(affected)
+        written = self.render(shards, version)
+
+        removed = 0
+        if affected is None:
+            keep = {shard[0] for shard in shards}
+            for view in VIEWS:
+                directory = os.path.join(self.out_dir, view)
+                for name in os.listdir(directory) if os.path.isdir(directory) else []:
+                    if f"{view}/{name}" not in keep:
+                        os.remove(os.path.join(directory, name))
+                        removed += 1
+
+        write_json(os.path.join(self.out_dir, "catalog.json"), {"data_version": version, **self.catalog.load()})
+        write_json(os.path.join(self.out_dir, "manifest.json"), {
+            "data_version": version,
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            **{view: {label: shard[0] for label, shard in sorted(current[view].items())} for view in VIEWS},
+        })
+        return {"shards": written, "removed": removed}
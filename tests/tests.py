@@ -1,13 +1,48 @@
+import asyncio
+import glob
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 from pymongo import MongoClient
+from bs4 import BeautifulSoup
 import mongomock  # Fake MongoDB for testing
+from flask import Flask, request
 
-from data_loader import DataLoader
+from data_loader import DataLoader, report, name_key, canonical_name, term_ordinal, term_label
+from jobs import JobRunner, JobConflict
+from metrics import Metrics
+from http_caching import HttpCaching
+from scrape_cache import HttpDiskCache
+from scrape_async import AsyncFetcher, TokenBucket
+import scrap
+from catalog import FilterCatalog
+from search_index import CatalogSearch, PrefixIndex
+from cache import QueryCache
+from grade_stream import iter_course_groups
+from indexes import INDEX_SPEC, QUERY_SHAPES, ensure_indexes, plan_problems, plan_stages, audit_query_shapes
+from aggregations import build_distribution_query, grade_distribution, rollup_distribution, sort_distribution
+from aggregations import parse_term_bound, trend_distribution
+from columnar import ColumnarGrades
+from leaderboard import Leaderboard
+from snapshots import SnapshotExporter, slugify
+from grades_api import find_grades, grades_projection, iter_ndjson, page_grades, parse_cursor, parse_limit
 
 # Mock database connection
 mock_db = mongomock.MongoClient().db
 
+# DataLoader reports through flash(), which needs a request context
+flask_app = Flask(__name__)
+flask_app.secret_key = "testing"
+
 # Sample test data
 SAMPLE_FACULTY_DATA = [
     {"name": "Doe, John", "department": "CIS", "course_number": "101"},
@@ -25,9 +60,12 @@ class TestDatabaseOperations(unittest.TestCase):
         """Set up a mock MongoDB instance before each test."""
         self.mock_db = mongomock.MongoClient().db
         self.data_loader = DataLoader(self.mock_db, {})
+        self.request_context = flask_app.test_request_context()
+        self.request_context.push()
 
     def tearDown(self):
         """Clean up after each test."""
+        self.request_context.pop()
         self.mock_db.faculty.delete_many({})
         self.mock_db.grades.delete_many({})
 
@@ -44,6 +82,18 @@ class TestDatabaseOperations(unittest.TestCase):
         self.assertEqual(stored_faculty[1]["name"], "Smith, Alice")
         self.assertEqual(stored_faculty[1]["department"], "MATH")
 
+    def test_rescrape_does_not_duplicate_old_faculty(self):
+        """Test that faculty records written before name_key are keyed instead of duplicated by the next scrape."""
+        self.mock_db.faculty.insert_many([
+            {"name": "Doe, John", "department": "CIS", "course_number": "101"},
+            {"name": "Doe, John", "department": "CIS", "course_number": "101"},
+        ])
+        self.data_loader.insert_faculty_data(SAMPLE_FACULTY_DATA)
+
+        self.assertEqual(self.mock_db.faculty.count_documents({}), 2)
+        self.assertEqual(self.mock_db.faculty.count_documents({"name_key": "doe, john", "department": "CIS"}), 1)
+        self.assertEqual(self.data_loader.backfill_faculty_keys(), {"keyed": 0, "duplicates": 0})
+
     def test_insert_grade_data(self):
         """Test if grade data is inserted correctly into MongoDB."""
         self.mock_db.grades.insert_many(SAMPLE_GRADE_DATA)
@@ -68,6 +118,63 @@ class TestDatabaseOperations(unittest.TestCase):
         self.assertEqual(updated_grades[0]["department"], "CIS")
         self.assertEqual(updated_grades[1]["department"], "MATH")
 
+    def test_merge_tags_every_section_once(self):
+        """Test that all sections of an instructor are tagged and a second merge writes nothing."""
+        self.mock_db.faculty.insert_many([dict(f) for f in SAMPLE_FACULTY_DATA])
+        self.mock_db.grades.insert_many([dict(g) for g in SAMPLE_GRADE_DATA] + [
+            {"course": "CIS102", "term": "Winter 2023", "instructor": "Doe, John"},
+            {"course": "CIS103", "term": "Winter 2023", "instructor": "Roe, Richard"},
+        ])
+
+        counts = self.data_loader.merge_faculty_with_grades()
+        self.assertEqual(counts, {"matched": 3, "unmatched": 1, "ambiguous": 0, "modified": 3})
+        self.assertEqual(self.mock_db.grades.count_documents({"instructor": "Doe, John", "department": "CIS"}), 2)
+        self.assertNotIn("department", self.mock_db.grades.find_one({"instructor": "Roe, Richard"}))
+
+        self.assertEqual(self.data_loader.merge_faculty_with_grades()["modified"], 0)
+
+    def test_merge_resolves_duplicate_names_by_course(self):
+        """Test that a name in two departments is matched by the course department, or left alone."""
+        self.mock_db.faculty.insert_many([
+            {"name": "Lee, Ann", "department": "MATH", "course_number": None},
+            {"name": "Lee, Ann", "department": "BI", "course_number": None},
+        ])
+        self.mock_db.grades.insert_many([
+            {"course": "MATH111", "term": "Fall 2013", "instructor": "Lee, Ann"},
+            {"course": "BI211", "term": "Fall 2013", "instructor": "Lee, Ann"},
+            {"course": "PHYS201", "term": "Fall 2013", "instructor": "Lee, Ann"},
+        ])
+
+        counts = self.data_loader.merge_faculty_with_grades()
+        self.assertEqual(counts, {"matched": 2, "unmatched": 0, "ambiguous": 1, "modified": 2})
+        departments = {g["course"]: g.get("department") for g in self.mock_db.grades.find()}
+        self.assertEqual(departments, {"MATH111": "MATH", "BI211": "BI", "PHYS201": None})
+
+    def test_merge_joins_on_name_key(self):
+        """Test that faculty and grade names written in different formats are joined and keyed."""
+        self.data_loader.insert_faculty_data([{"name": "Jane Q. Doe", "department": "MATH"}])
+        self.data_loader.replace_grade_records(self.data_loader.transform_course_data(
+            {"MATH111": [{"TERM_DESC": "Fall 2013", "crn": "1", "instructor": "DOE, JANE QUINN", "aprec": 50}]}
+        ))
+
+        self.assertEqual(self.mock_db.faculty.find_one()["name_key"], "doe, jane")
+        self.assertEqual(self.mock_db.grades.find_one()["name_key"], "doe, jane")
+        self.assertEqual(self.data_loader.merge_faculty_with_grades()["matched"], 1)
+        self.assertEqual(self.mock_db.grades.find_one()["department"], "MATH")
+
+    def test_course_fields_derived_at_ingest(self):
+        """Test that dept, course_num and level are stored with each grade record."""
+        records = self.data_loader.transform_course_data({"CIS210": [{"TERM_DESC": "Fall 2013", "crn": "1", "instructor": "Doe, John"}]})
+        self.assertEqual((records[0]["dept"], records[0]["course_num"], records[0]["level"]), ("CIS", "210", 200))
+
+    def test_backfill_course_fields(self):
+        """Test that older grade records get the course fields, once."""
+        self.mock_db.grades.insert_many([dict(g) for g in SAMPLE_GRADE_DATA])
+
+        self.assertEqual(self.data_loader.backfill_course_fields(), 2)
+        self.assertEqual(self.mock_db.grades.count_documents({"dept": "MATH", "level": 200, "course_num": "201"}), 1)
+        self.assertEqual(self.data_loader.backfill_course_fields(), 0)
+
     def test_clear_database(self):
         """Test if the database clears correctly."""
         self.mock_db.faculty.insert_many(SAMPLE_FACULTY_DATA)
@@ -78,5 +185,1440 @@ class TestDatabaseOperations(unittest.TestCase):
         self.assertEqual(self.mock_db.faculty.count_documents({}), 0)
         self.assertEqual(self.mock_db.grades.count_documents({}), 0)
 
+
+# explain() output of a classic and a slot based engine plan
+IXSCAN_EXPLAIN = {"queryPlanner": {
+    "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "dept_1_level_1"}},
+    "rejectedPlans": [{"stage": "COLLSCAN"}],
+}}
+SORT_EXPLAIN = {"queryPlanner": {
+    "winningPlan": {"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}, "slotBasedPlan": {"stages": "[1] scan"}},
+}}
+
+
+class FakeExplainDb:
+    """Database stand-in whose cursors return a canned explain() per collection."""
+
+    def __init__(self, explains):
+        self.explains = explains
+        self.sorts = []
+
+    def __getitem__(self, collection):
+        db = self
+
+        class Cursor:
+            def sort(self, keys):
+                db.sorts.append(keys)
+                return self
+
+            def explain(self):
+                return db.explains[collection]
+
+        class Collection:
+            def find(self, query):
+                return Cursor()
+
+        return Collection()
+
+
+class TestIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = mongomock.MongoClient().db
+
+    def test_ensure_indexes_applies_spec(self):
+        """Test that every index in the spec exists afterwards and unlisted ones are reported or pruned."""
+        self.mock_db.faculty.create_index("department")
+
+        result = ensure_indexes(self.mock_db)
+        self.assertEqual(len(result["indexes"]), sum(len(keys) for keys in INDEX_SPEC.values()))
+        self.assertIn("dept_1_level_1_course_num_1", self.mock_db.grades.index_information())
+        self.assertEqual(result["unlisted"], ["faculty.department_1"])
+
+        self.assertEqual(ensure_indexes(self.mock_db, prune=True)["unlisted"], ["faculty.department_1"])
+        self.assertNotIn("department_1", self.mock_db.faculty.index_information())
+        self.assertEqual(ensure_indexes(self.mock_db)["unlisted"], [])
+
+    def test_plan_walker_flags_scans_and_sorts(self):
+        """Test that only the winning plan is checked, in both explain formats."""
+        self.assertEqual(list(plan_stages(IXSCAN_EXPLAIN["queryPlanner"]["winningPlan"])), ["FETCH", "IXSCAN"])
+        self.assertEqual(plan_problems(IXSCAN_EXPLAIN), [])
+        self.assertEqual(plan_problems(SORT_EXPLAIN), ["in-memory sort", "collection scan"])
+
+    def test_audit_reports_each_shape(self):
+        """Test the audit over query shapes with fake explain output."""
+        db = FakeExplainDb({"grades": IXSCAN_EXPLAIN, "faculty": SORT_EXPLAIN})
+        shapes = [
+            {"name": "by dept", "collection": "grades", "filter": {"dept": "CIS"}},
+            {"name": "sorted names", "collection": "faculty", "filter": {}, "sort": [("name", 1)]},
+        ]
+
+        results = audit_query_shapes(db, shapes)
+        self.assertEqual([r["problems"] for r in results], [[], ["in-memory sort", "collection scan"]])
+        self.assertEqual(db.sorts, [[("name", 1)]])
+
+    def test_query_shapes_have_indexes(self):
+        """Test that each query shape filters on the leading field of an index on its collection."""
+        for shape in QUERY_SHAPES:
+            with self.subTest(shape=shape["name"]):
+                leading = {keys[0][0] for keys in INDEX_SPEC[shape["collection"]]}
+                self.assertTrue(leading & set(shape["filter"]))
+
+
+class TestNameKey(unittest.TestCase):
+
+    def test_formats_share_a_key(self):
+        """Test that grade, faculty and scraper name formats map to one key."""
+        for name in ["Doe, John", "DOE, JOHN A", "Doe,  John A.", "John A. Doe", "  john   doe "]:
+            with self.subTest(name=name):
+                self.assertEqual(name_key(name), "doe, john")
+        self.assertEqual(name_key("Van Dyke, Mary-Ann"), "van dyke, mary-ann")
+        self.assertEqual(name_key("Staff"), "staff")
+        self.assertEqual(name_key(""), "")
+
+    def test_normalizers_are_memoized(self):
+        """Test that repeated names are served from the bounded caches."""
+        canonical_name.cache_clear()
+        for _ in range(3):
+            self.assertEqual(canonical_name("SMITH, ALICE B"), "Smith, Alice")
+        info = canonical_name.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+        self.assertIsNotNone(info.maxsize)
+        self.assertEqual(canonical_name("Doe,"), "Doe, ")
+
+
+class TestFilterCatalog(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance with faculty and grades."""
+        self.mock_db = mongomock.MongoClient().db
+        self.mock_db.faculty.insert_many(SAMPLE_FACULTY_DATA)
+        self.mock_db.grades.insert_many(SAMPLE_GRADE_DATA + [
+            {"course": "CIS210", "term": "Fall 2023", "aprec": 60.0, "bprec": 20.0, "cprec": 10.0, "dprec": 5.0, "fprec": 5.0, "instructor": "Doe, John"},
+            {"course": "HIST101", "term": "Fall 2023", "aprec": 60.0, "bprec": 20.0, "cprec": 10.0, "dprec": 5.0, "fprec": 5.0, "instructor": "Smith, Alice"},
+        ])
+        # Raw inserts lack the fields ingest derives from the course code
+        DataLoader(self.mock_db, {}).backfill_course_fields()
+        self.catalog = FilterCatalog(self.mock_db, {"CIS": "Computer and Information Science", "MATH": "Mathematics"})
+
+    def test_rebuild_builds_dropdown_maps(self):
+        """Test that the catalog holds the same maps the user page used to compute."""
+        self.catalog.rebuild()
+        catalog = self.catalog.load()
+
+        self.assertEqual(catalog["teachers"], ["Doe, John", "Smith, Alice"])
+        self.assertEqual(catalog["classes"], ["CIS101", "CIS210", "MATH201"])
+        self.assertEqual(catalog["teacher_department_map"]["Smith, Alice"], "MATH")
+        self.assertEqual(catalog["teacher_classes_map"]["Doe, John"], "CIS101;CIS210")
+        self.assertEqual(catalog["teacher_classes_map"]["Smith, Alice"], "HIST101;MATH201")
+        self.assertEqual(catalog["class_department_map"]["CIS210"], "CIS")
+        self.assertEqual(catalog["class_teachers_map"]["MATH201"], "Smith, Alice")
+
+    def test_teachers_join_faculty_on_name_key(self):
+        """Test that grade instructors match faculty by name_key and multi department teachers have no single department."""
+        self.mock_db.grades.insert_one({"course": "MATH301", "term": "Fall 2023", "aprec": 50.0, "bprec": 30.0, "cprec": 10.0,
+                                        "dprec": 5.0, "fprec": 5.0, "instructor": "Doe, John A.", "dept": "MATH"})
+        self.mock_db.faculty.insert_one({"name": "Smith, Alice", "department": "CIS", "course_number": "102"})
+        teachers = {t["name"]: t for t in self.catalog.rebuild()["teachers"]}
+
+        self.assertEqual(teachers["Doe, John A."]["classes"], ["MATH301"])
+        self.assertEqual(teachers["Doe, John A."]["department"], "CIS")
+        self.assertEqual((teachers["Smith, Alice"]["department"], teachers["Smith, Alice"]["departments"]), (None, ["CIS", "MATH"]))
+
+        search = CatalogSearch()
+        search.build(self.mock_db.catalog.find_one(), 1)
+        self.assertEqual([t["name"] for t in search.teachers("smith", department="CIS")], ["Smith, Alice"])
+        self.assertEqual([t["name"] for t in search.teachers("smith", department="MATH")], ["Smith, Alice"])
+
+    def test_load_builds_missing_catalog(self):
+        """Test that loading without a stored catalog builds one."""
+        self.assertIsNone(self.mock_db.catalog.find_one({}))
+        catalog = self.catalog.load()
+
+        self.assertEqual(len(catalog["teachers"]), 2)
+        self.assertEqual(self.mock_db.catalog.count_documents({}), 1)
+
+    def test_rebuild_after_clear(self):
+        """Test that rebuilding after the data is cleared empties the catalog."""
+        self.catalog.rebuild()
+        self.mock_db.grades.delete_many({})
+        self.mock_db.faculty.delete_many({})
+        self.catalog.rebuild()
+
+        catalog = self.catalog.load()
+        self.assertEqual(catalog["teachers"], [])
+        self.assertEqual(catalog["classes"], [])
+
+
+class TestUserPage(unittest.TestCase):
+
+    def setUp(self):
+        """Set up the app on a mock MongoDB instance loaded with the sample groups."""
+        import app as easya
+        self.mock_db = mongomock.MongoClient().db
+        loader = DataLoader(self.mock_db, {})
+        loader.replace_grade_records(loader.transform_course_data(SAMPLE_GROUPS))
+
+        self.patches = [
+            patch.object(easya.mongo, "db", self.mock_db),
+            patch.object(easya.data_processor, "db", self.mock_db),
+            patch.object(easya, "query_cache", QueryCache(16, 60)),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        self.client = easya.app.test_client()
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+
+    def chart_labels(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_data(as_text=True).split("const gradeData = ", 1)[1].split(";\n", 1)[0]
+        return [row["label"] for row in json.loads(data)]
+
+    def test_group_is_part_of_the_cache_key(self):
+        """Test that the same filters grouped by course are not served the cached instructor chart."""
+        by_instructor = self.chart_labels("/user?department=CIS")
+        by_course = self.chart_labels("/user?department=CIS&group=course")
+
+        self.assertNotIn("CIS210", by_instructor)
+        self.assertEqual(by_course, ["CIS210"])
+
+    def test_teacher_department_only_when_unambiguous(self):
+        """Test that a teacher view is narrowed to a department only when the teacher has exactly one."""
+        import app as easya
+        self.mock_db.faculty.insert_many([
+            {"name": "Smith, Alice", "name_key": "smith, alice", "department": "MATH"},
+            {"name": "Roe, Jane", "name_key": "roe, jane", "department": "CIS"},
+            {"name": "Roe, Jane", "name_key": "roe, jane", "department": "MATH"},
+        ])
+
+        query, _ = easya.distribution_scope({"teacher": "Smith, Alice"})
+        self.assertEqual(query, {"dept": "MATH", "name_key": "smith, alice"})
+        query, _ = easya.distribution_scope({"teacher": "Roe, Jane"})
+        self.assertEqual(query, {"name_key": "roe, jane"})
+
+    def test_invalid_level_is_a_bad_request(self):
+        """Test that a malformed level gives 400 on the user page and the distribution API."""
+        self.assertEqual(self.client.get("/user?level=bad").status_code, 400)
+        response = self.client.get("/api/distribution?level=bad")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Invalid level", response.get_json()["error"])
+
+    def test_invalid_grade_is_a_bad_request(self):
+        """Test that /api/distribution rejects a grade other than A-F instead of sorting on a missing field."""
+        response = self.client.get("/api/distribution?department=CIS&grade=Z")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Invalid grade", response.get_json()["error"])
+        self.assertEqual(self.client.get("/api/distribution?department=CIS&grade=b").get_json()["grade"], "B")
+
+
+class TestScrapeJob(unittest.TestCase):
+
+    def test_page_counts_are_per_run(self):
+        """Test that a second scrape reports only its own downloads, not the process totals."""
+        import app as easya
+        cache = SimpleNamespace(counts={"hits": 0, "misses": 0})
+        cache.stats = lambda: dict(cache.counts)
+
+        def scraper():
+            cache.counts["hits"] += 1
+            cache.counts["misses"] += 2
+            return list(SAMPLE_FACULTY_DATA)
+
+        exports = []
+        with patch.object(easya, "http_cache", cache), patch.object(easya, "run_scraper", scraper), \
+                patch.object(easya.data_processor, "insert_faculty_data", len), \
+                patch.object(easya, "export_snapshots", lambda job, affected=None: exports.append(affected)):
+            first = easya.scrape_faculty_job(MagicMock())
+            second = easya.scrape_faculty_job(MagicMock())
+
+        self.assertEqual((first["pages_downloaded"], first["page_cache_hits"]), (2, 1))
+        self.assertEqual((second["pages_downloaded"], second["page_cache_hits"]), (2, 1))
+        self.assertEqual(exports, [{}, {}])  # The catalog snapshot follows every scrape
+
+
+class TestCatalogSearch(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a search index over a small catalog document."""
+        self.search = CatalogSearch()
+        self.loads = []
+
+        def load_catalog():
+            self.loads.append(1)
+            return {
+                "teachers": [
+                    {"name": "Doe, John", "department": "CIS", "classes": ["CIS210", "CIS315"]},
+                    {"name": "Johnson, Mary", "department": "MATH", "classes": ["MATH251"]},
+                    {"name": "Roe, Jane", "department": "CIS", "classes": ["CIS315"]},
+                ],
+                "classes": [
+                    {"course": "CIS210", "department": "CIS", "teachers": ["Doe, John"]},
+                    {"course": "CIS315", "department": "CIS", "teachers": ["Doe, John", "Roe, Jane"]},
+                    {"course": "MATH251", "department": "MATH", "teachers": ["Johnson, Mary"]},
+                ],
+            }
+
+        self.search.ensure_current(load_catalog, 1)
+        self.load_catalog = load_catalog
+
+    def test_teacher_prefix_matches_any_word(self):
+        """Test that a prefix matches the last or first name, case insensitively."""
+        names = [t["name"] for t in self.search.teachers("jo")]
+        self.assertEqual(names, ["Doe, John", "Johnson, Mary"])
+        self.assertEqual([t["name"] for t in self.search.teachers("JO", department="MATH")], ["Johnson, Mary"])
+        self.assertEqual([t["name"] for t in self.search.teachers("", course="CIS315")], ["Doe, John", "Roe, Jane"])
+        self.assertEqual(len(self.search.teachers("", limit=2)), 2)
+        self.assertEqual(self.search.teachers("jo", department="PHYS"), [])
+
+    def test_class_prefix_matches_code_or_number(self):
+        """Test class search by course code or number, narrowed by department or teacher."""
+        self.assertEqual([c["course"] for c in self.search.classes("cis")], ["CIS210", "CIS315"])
+        self.assertEqual([c["course"] for c in self.search.classes("2")], ["CIS210", "MATH251"])
+        self.assertEqual([c["course"] for c in self.search.classes("", teacher="Roe, Jane")], ["CIS315"])
+        self.assertEqual(self.search.classes("2", department="CIS"), [{"course": "CIS210", "department": "CIS"}])
+
+    def test_rebuilds_on_new_version(self):
+        """Test that the index is rebuilt only when the data version changes."""
+        self.search.ensure_current(self.load_catalog, 1)
+        self.assertEqual(len(self.loads), 1)
+        self.search.ensure_current(self.load_catalog, 2)
+        self.assertEqual(len(self.loads), 2)
+
+    def test_prefix_index_range(self):
+        """Test that a lookup stops at the end of the matching key range."""
+        index = PrefixIndex([("a", ["apple"]), ("b", ["apricot"]), ("c", ["banana"])])
+        self.assertEqual(index.search("ap", 10), ["a", "b"])
+        self.assertEqual(index.search("apr", 10), ["b"])
+        self.assertEqual(index.search("z", 10), [])
+
+
+EXTRA_GRADE_DATA = [
+    {"course": "CIS210", "term": "Fall 2023", "aprec": 70.0, "bprec": 10.0, "cprec": 10.0, "dprec": 5.0, "fprec": 5.0, "instructor": "Doe, John"},
+    {"course": "CIS210", "term": "Winter 2024", "aprec": 30.0, "bprec": 40.0, "cprec": 20.0, "dprec": 5.0, "fprec": 5.0, "instructor": "Roe, Jane"},
+]
+
+
+class TestGradeDistribution(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance with several sections per group."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.data_loader.replace_grade_records([dict(r) for r in SAMPLE_GRADE_DATA + EXTRA_GRADE_DATA])
+
+    def test_groups_by_instructor(self):
+        """Test that section averages are computed per instructor."""
+        query = build_distribution_query(department="CIS")
+        graph_data = {row["label"]: row for row in rollup_distribution(self.mock_db, query, "instructor")}
+
+        self.assertEqual(set(graph_data), {"Doe, John", "Roe, Jane"})
+        self.assertAlmostEqual(graph_data["Doe, John"]["aprec"], 60.0)
+        self.assertAlmostEqual(graph_data["Doe, John"]["bprec"], 20.0)
+        self.assertAlmostEqual(graph_data["Roe, Jane"]["aprec"], 30.0)
+
+    def test_groups_by_course_for_level(self):
+        """Test that the level view groups by course."""
+        query = build_distribution_query(selected_level="CIS-200")
+        graph_data = rollup_distribution(self.mock_db, query, "course")
+
+        self.assertEqual(len(graph_data), 1)
+        self.assertEqual(graph_data[0]["label"], "CIS210")
+        self.assertAlmostEqual(graph_data[0]["aprec"], 50.0)
+
+    def test_teacher_matches_any_name_format(self):
+        """Test that a teacher filter matches the sections of every spelling of the name."""
+        self.assertEqual(build_distribution_query(selected_teacher="John Doe"), {"name_key": "doe, john"})
+        for teacher in ("Doe, John", "John Doe", "DOE, JOHN Q."):
+            with self.subTest(teacher=teacher):
+                graph_data = rollup_distribution(self.mock_db, build_distribution_query(selected_teacher=teacher), "course")
+                self.assertEqual(sorted(row["label"] for row in graph_data), ["CIS101", "CIS210"])
+
+    def test_invalid_level(self):
+        """Test that a malformed level is rejected with a clear message."""
+        for level in ("bad", "CIS-", "CIS-2x0", "CIS-200-1"):
+            with self.assertRaisesRegex(ValueError, "Invalid level"):
+                build_distribution_query(selected_level=level)
+
+    def test_rollups_match_raw_sections(self):
+        """Test that rollups give the same averages as grouping the raw sections."""
+        raw = {row["label"]: row for row in grade_distribution(self.mock_db.grades, {}, "instructor")}
+        rolled = {row["label"]: row for row in rollup_distribution(self.mock_db, {}, "instructor")}
+
+        self.assertEqual(set(raw), set(rolled))
+        for label, row in raw.items():
+            self.assertAlmostEqual(row["aprec"], rolled[label]["aprec"])
+            self.assertAlmostEqual(row["fprec"], rolled[label]["fprec"])
+
+    def test_sort_distribution(self):
+        """Test that sorting puts the highest selected grade first."""
+        graph_data = rollup_distribution(self.mock_db, {}, "instructor")
+
+        self.assertEqual(sort_distribution(graph_data, "A")[0]["label"], "Doe, John")
+        self.assertEqual(sort_distribution(graph_data, "B")[0]["label"], "Roe, Jane")
+        self.assertEqual(sort_distribution(graph_data, "b")[0]["label"], "Roe, Jane")
+        with self.assertRaisesRegex(ValueError, "Invalid grade"):
+            sort_distribution(graph_data, "Z")
+
+
+class TestLeaderboard(unittest.TestCase):
+
+    def setUp(self):
+        """Set up rollups for one course with seven instructors of known A shares."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.sections = [
+            {"course": "CIS210", "term": "Fall 2023", "instructor": f"Person, {name}", "aprec": aprec,
+             "bprec": 100.0 - aprec, "cprec": 0.0, "dprec": 0.0, "fprec": 0.0}
+            for name, aprec in zip("ABCDEFG", (90.0, 80.0, 70.0, 60.0, 50.0, 40.0, 30.0))
+        ]
+        self.sections.append(dict(self.sections[3], term="Winter 2024", aprec=20.0, bprec=80.0))
+        self.data_loader.update_rollups(self.sections)
+
+        self.calls = []
+
+        def source(query, group_by, version):
+            self.calls.append(version)
+            return rollup_distribution(self.mock_db, query, group_by)
+
+        self.leaderboard = Leaderboard(source)
+
+    def test_top_bottom_and_others(self):
+        """Test the k groups at each end and the section weighted others bucket."""
+        board = self.leaderboard.get({"course": "CIS210"}, "instructor", "A", k=2, version=1)
+
+        self.assertEqual([row["label"] for row in board["top"]], ["Person, A", "Person, B"])
+        self.assertEqual([row["label"] for row in board["bottom"]], ["Person, F", "Person, G"])
+        self.assertEqual(board["total_groups"], 7)
+        # C (70), D (60 and 20) and E (50) over four sections
+        self.assertEqual((board["others"]["groups"], board["others"]["count"]), (3, 4))
+        self.assertAlmostEqual(board["others"]["aprec"], 50.0)
+        self.assertAlmostEqual(board["others"]["bprec"], 50.0)
+
+        board = self.leaderboard.get({"course": "CIS210"}, "instructor", "b", k=1, version=1)
+        self.assertEqual(board["grade"], "B")
+        self.assertEqual(board["top"][0]["label"], "Person, G")
+
+    def test_small_scope_has_no_others(self):
+        """Test that every group is listed once when there are at most 2k groups."""
+        board = self.leaderboard.get({"course": "CIS210"}, "instructor", "A", k=4, version=1)
+
+        labels = [row["label"] for row in board["top"] + board["bottom"]]
+        self.assertEqual(len(labels), 7)
+        self.assertEqual(len(set(labels)), 7)
+        self.assertIsNone(board["others"])
+
+    def test_boards_are_reused_until_the_version_changes(self):
+        """Test that a scope is sorted once per data version."""
+        for grade in "ABCDF":
+            self.leaderboard.get({"course": "CIS210"}, "instructor", grade, k=2, version=1)
+        self.assertEqual(self.calls, [1])
+
+        self.leaderboard.get({"course": "CIS210"}, "instructor", "A", k=2, version=2)
+        self.assertEqual(self.calls, [1, 2])
+        self.assertEqual(self.leaderboard.stats(), {"boards": 1, "data_version": 2})
+        with self.assertRaises(ValueError):
+            self.leaderboard.get({}, "instructor", "E", version=2)
+
+
+@unittest.skipUnless(ColumnarGrades.available(), "numpy is not installed")
+class TestColumnarGrades(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance and a columnar store loaded from it."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.data_loader.replace_grade_records([dict(r) for r in SAMPLE_GRADE_DATA + EXTRA_GRADE_DATA])
+        self.data_loader.backfill_course_fields()
+        self.store = ColumnarGrades(self.mock_db)
+
+    def test_matches_rollups(self):
+        """Test that the columnar averages match the rollup collections for every view."""
+        queries = [
+            ({}, "instructor"),
+            (build_distribution_query(department="CIS"), "instructor"),
+            (build_distribution_query(selected_level="CIS-200"), "course"),
+            (build_distribution_query(single_class="CIS210"), "instructor"),
+            (build_distribution_query(department="CIS", selected_teacher="Doe, John"), "instructor"),
+            (build_distribution_query(selected_teacher="JOHN DOE"), "course"),
+        ]
+        for query, group_by in queries:
+            with self.subTest(query=query):
+                expected = {row["label"]: row for row in rollup_distribution(self.mock_db, query, group_by)}
+                actual = {row["label"]: row for row in self.store.distribution(query, group_by, version=1)}
+
+                self.assertEqual(set(actual), set(expected))
+                for label, row in expected.items():
+                    for field in ("aprec", "bprec", "cprec", "dprec", "fprec"):
+                        self.assertAlmostEqual(actual[label][field], row[field], places=4)
+
+    def test_reloads_on_new_version(self):
+        """Test that the columns are reloaded only when the data version changes."""
+        self.store.distribution({}, "instructor", version=1)
+        self.assertEqual(self.store.size, 4)
+
+        self.mock_db.grades.delete_many({"course": "MATH201"})
+        self.assertEqual(len(self.store.distribution({}, "instructor", version=1)), 3)
+        self.assertEqual(len(self.store.distribution({}, "instructor", version=2)), 2)
+        self.assertEqual(self.store.size, 3)
+
+    def test_concurrent_requests_reload_once(self):
+        """Test that threads arriving after a version bump share a single reload."""
+        loads = []
+        load = self.store.load
+
+        def slow_load(version):
+            loads.append(version)
+            time.sleep(0.05)
+            load(version)
+
+        with patch.object(self.store, "load", slow_load):
+            threads = [threading.Thread(target=self.store.distribution, args=({}, "instructor", 1)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(loads, [1])
+        self.assertEqual(self.store.size, 4)
+
+    def test_unknown_value_and_row_size(self):
+        """Test that a filter value missing from the data matches nothing and rows stay small."""
+        self.assertEqual(self.store.distribution({"dept": "ART"}, "instructor", version=1), [])
+        self.assertLessEqual(self.store.nbytes() / self.store.size, 40)
+
+
+class TestGradesApi(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance with sections in two departments."""
+        self.mock_db = mongomock.MongoClient().db
+        data_loader = DataLoader(self.mock_db, {})
+        data_loader.replace_grade_records([dict(r) for r in SAMPLE_GRADE_DATA + EXTRA_GRADE_DATA])
+        data_loader.backfill_course_fields()
+        self.cis_count = self.mock_db.grades.count_documents({"dept": "CIS"})
+
+    def test_keyset_pages_cover_every_row_once(self):
+        """Test that following the next cursor returns every matching row exactly once."""
+        projection = grades_projection("course,aprec")
+        seen, after = [], None
+        while True:
+            rows, next_cursor = page_grades(self.mock_db, {"dept": "CIS"}, projection, parse_cursor(after), limit=1)
+            seen.extend(row["id"] for row in rows)
+            self.assertTrue(all(set(row) == {"id", "course", "aprec"} for row in rows))
+            if next_cursor is None:
+                break
+            after = next_cursor
+
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(seen, sorted(set(seen)))
+
+    def test_ndjson_stream(self):
+        """Test that the stream yields one JSON object per matching row."""
+        lines = list(iter_ndjson(find_grades(self.mock_db, {"dept": "CIS"}, grades_projection())))
+
+        self.assertEqual(len(lines), self.cis_count)
+        self.assertTrue(all(line.endswith("\n") for line in lines))
+        self.assertEqual(json.loads(lines[0])["dept"], "CIS")
+
+    def test_invalid_arguments(self):
+        """Test that unknown fields, bad cursors and bad limits are rejected."""
+        with self.assertRaises(ValueError):
+            grades_projection("course,content_hash")
+        with self.assertRaises(ValueError):
+            parse_cursor("not-a-cursor")
+        with self.assertRaises(ValueError):
+            parse_limit("0")
+        self.assertEqual(parse_limit("100000"), 5000)
+        self.assertIsNone(parse_limit("", default=None, maximum=None))
+
+    def test_instructor_query_uses_name_key(self):
+        """Test that the instructor filter of /api/grades matches any spelling once older records are keyed."""
+        import app as easya
+        query = easya.build_course_query("", "", "John Doe")
+        self.assertEqual(query, {"name_key": "doe, john"})
+        self.assertEqual(self.mock_db.grades.count_documents(query), 0)
+
+        DataLoader(self.mock_db, {}).backfill_instructor_keys()
+        self.assertEqual(self.mock_db.grades.count_documents(query), 2)
+
+
+class TestRollups(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance with rollups for the sample grades."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.data_loader.update_rollups(SAMPLE_GRADE_DATA + EXTRA_GRADE_DATA)
+
+    def test_rollup_sums_and_counts(self):
+        """Test the stored sums and counts per course, instructor and department."""
+        pair = self.mock_db.rollup_course_instructor.find_one({"course": "CIS210", "instructor": "Doe, John"})
+        self.assertEqual(pair["count"], 1)
+        self.assertEqual(pair["aprec_sum"], 70.0)
+        self.assertEqual(pair["level"], 200)
+
+        course = self.mock_db.rollup_course.find_one({"course": "CIS210"})
+        self.assertEqual(course["count"], 2)
+        self.assertEqual(course["aprec_sum"], 100.0)
+
+        department = self.mock_db.rollup_department.find_one({"dept": "CIS"})
+        self.assertEqual(department["count"], 3)
+
+    def test_incremental_add_and_remove(self):
+        """Test that adding then removing a section restores the rollups."""
+        section = {"course": "CIS210", "term": "Spring 2024", "aprec": 10.0, "bprec": 10.0, "cprec": 10.0, "dprec": 10.0, "fprec": 60.0, "instructor": "New, Person"}
+        self.data_loader.update_rollups([section])
+        self.assertEqual(self.mock_db.rollup_course.find_one({"course": "CIS210"})["count"], 3)
+
+        self.data_loader.update_rollups([section], sign=-1)
+        self.assertEqual(self.mock_db.rollup_course.find_one({"course": "CIS210"})["count"], 2)
+        self.assertIsNone(self.mock_db.rollup_course_instructor.find_one({"instructor": "New, Person"}))
+
+    def test_instructor_rollups_carry_name_key(self):
+        """Test that instructor rollups store name_key and older ones are backfilled."""
+        pair = self.mock_db.rollup_course_instructor.find_one({"course": "CIS210", "instructor": "Doe, John"})
+        self.assertEqual(pair["name_key"], "doe, john")
+
+        for name in ("rollup_course_instructor", "rollup_term_instructor"):
+            self.mock_db[name].update_many({}, {"$unset": {"name_key": ""}})
+        self.assertEqual(self.data_loader.backfill_instructor_keys(), 7)
+        self.assertEqual(self.mock_db.rollup_course_instructor.count_documents({"name_key": "doe, john"}), 2)
+        self.assertEqual(self.data_loader.backfill_instructor_keys(), 0)
+
+    def test_clear_rollups(self):
+        """Test that clearing removes every rollup document."""
+        self.data_loader.clear_rollups()
+        self.assertEqual(self.mock_db.rollup_course.count_documents({}), 0)
+        self.assertEqual(self.mock_db.rollup_department.count_documents({}), 0)
+
+
+class TestTermTrends(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance with the sample grades and their rollups."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.data_loader.replace_grade_records(
+            self.data_loader.transform_course_data({
+                "CIS210": [
+                    {"TERM_DESC": "Fall 2023", "crn": "1", "instructor": "Doe, John", "aprec": "70", "fprec": "30"},
+                    {"TERM_DESC": "Winter 2024", "crn": "2", "instructor": "Roe, Jane", "aprec": "30", "fprec": "70"},
+                    {"TERM_DESC": "Winter 2024", "crn": "3", "instructor": "Doe, John", "aprec": "50", "fprec": "50"},
+                ],
+                "MATH111": [
+                    {"TERM_DESC": "Fall 2010", "crn": "4", "instructor": "Smith, Alice", "aprec": "20", "fprec": "80"},
+                ],
+            })
+        )
+
+    def test_term_ordinal(self):
+        """Test that term ordinals sort in calendar order and convert back."""
+        terms = ["Fall 2013", "Winter 2014", "Spring 2014", "Summer 2014", "Fall 2014"]
+        ordinals = [term_ordinal(term) for term in terms]
+
+        self.assertEqual(ordinals, sorted(ordinals))
+        self.assertEqual(ordinals[1] - ordinals[0], 1)
+        self.assertEqual([term_label(o) for o in ordinals], terms)
+        self.assertEqual(term_ordinal("FALL 2013"), ordinals[0])
+        self.assertIsNone(term_ordinal("N/A"))
+        self.assertEqual(parse_term_bound("2014"), ordinals[1])
+        self.assertEqual(parse_term_bound("2014", end=True), ordinals[4])
+        with self.assertRaises(ValueError):
+            parse_term_bound("someday")
+
+    def test_trend_by_class_and_teacher(self):
+        """Test per term averages from the term rollups and from raw sections."""
+        trend = trend_distribution(self.mock_db, single_class="CIS210")
+        self.assertEqual([row["term"] for row in trend], ["Fall 2023", "Winter 2024"])
+        self.assertAlmostEqual(trend[1]["aprec"], 40.0)
+
+        trend = trend_distribution(self.mock_db, single_class="CIS210", selected_teacher="Doe, John")
+        self.assertEqual([row["aprec"] for row in trend], [70.0, 50.0])
+        self.assertEqual(trend_distribution(self.mock_db, single_class="CIS210", selected_teacher="JOHN DOE"), trend)
+
+        trend = trend_distribution(self.mock_db, selected_teacher="Doe, John", start=parse_term_bound("2024"))
+        self.assertEqual([row["term"] for row in trend], ["Winter 2024"])
+
+        trend = trend_distribution(self.mock_db, department="MATH", end=parse_term_bound("2012", end=True))
+        self.assertEqual([(row["term"], row["fprec"]) for row in trend], [("Fall 2010", 80.0)])
+
+    def test_backfill_terms(self):
+        """Test that older grade records get a term ordinal and the term rollups are built."""
+        self.mock_db.grades.update_many({}, {"$unset": {"term_ord": ""}})
+        for name in ("rollup_term_course", "rollup_term_instructor"):
+            self.mock_db[name].delete_many({})
+
+        counts = self.data_loader.backfill_terms()
+
+        self.assertEqual(counts, {"updated": 4, "rolled_up": 4})
+        self.assertEqual(self.mock_db.grades.count_documents({"term_ord": term_ordinal("Winter 2024")}), 2)
+        self.assertEqual(len(trend_distribution(self.mock_db)), 3)
+        self.assertEqual(self.data_loader.backfill_terms(), {"updated": 0, "rolled_up": 0})
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a small cache with a controllable clock."""
+        self.now = 0.0
+        self.cache = QueryCache(max_entries=2, ttl=10, clock=lambda: self.now)
+
+    def test_key_normalization(self):
+        """Test that equivalent request args share a key."""
+        self.assertEqual(
+            QueryCache.make_key({"department": " CIS ", "grade": "b"}),
+            QueryCache.make_key({"department": "CIS", "grade": "B", "faculty_type": "all"}),
+        )
+        self.assertEqual(QueryCache.make_key({}), QueryCache.make_key({"grade": "A"}))
+        self.assertNotEqual(
+            QueryCache.make_key({"class": "MATH111", "from": "2010"}, "trend", extra=("from", "to")),
+            QueryCache.make_key({"class": "MATH111", "from": "2012"}, "trend", extra=("from", "to")),
+        )
+
+    def test_hit_miss_and_eviction(self):
+        """Test LRU eviction and the counters."""
+        self.assertIsNone(self.cache.get("a", 1))
+        self.cache.set("a", 1, 1)
+        self.cache.set("b", 2, 1)
+        self.assertEqual(self.cache.get("a", 1), 1)
+        self.cache.set("c", 3, 1)  # evicts "b", the least recently used
+
+        self.assertIsNone(self.cache.get("b", 1))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["size"]), (1, 2, 1, 2))
+
+    def test_ttl_and_version_invalidation(self):
+        """Test that entries expire and that a new data version clears the cache."""
+        self.cache.set("a", 1, 1)
+        self.now = 11
+        self.assertIsNone(self.cache.get("a", 1))
+
+        self.cache.set("a", 1, 1)
+        self.assertIsNone(self.cache.get("a", 2))
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+
+class TestDataVersion(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance and a request context for flash()."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.request_context = flask_app.test_request_context()
+        self.request_context.push()
+
+    def tearDown(self):
+        self.request_context.pop()
+
+    def test_writes_bump_version(self):
+        """Test that every data changing method bumps the data version."""
+        self.assertEqual(self.data_loader.get_data_version(), 0)
+        self.data_loader.replace_grade_records([dict(r) for r in SAMPLE_GRADE_DATA])
+        self.data_loader.insert_faculty_data(SAMPLE_FACULTY_DATA)
+        self.data_loader.merge_faculty_with_grades()
+        self.data_loader.clear_all_collections()
+        self.assertEqual(self.data_loader.get_data_version(), 4)
+
+    def test_listeners_run_before_bump(self):
+        """Test that change listeners see the old version."""
+        seen = []
+        self.data_loader.add_change_listener(lambda: seen.append(self.data_loader.get_data_version()))
+        self.data_loader.bump_data_version()
+        self.assertEqual(seen, [0])
+
+
+SAMPLE_GROUPS = {
+    "CIS210": [
+        {"TERM_DESC": "Fall 2013", "aprec": "50.5", "bprec": "30", "cprec": "10", "dprec": "5", "fprec": "4.5", "crn": "12345", "instructor": "Doe, John Q"},
+        {"TERM_DESC": "Winter 2014", "aprec": "40", "bprec": "30", "cprec": "20", "dprec": "5", "fprec": "5", "crn": "22345", "instructor": "ROE, JANE"},
+    ],
+    "MATH111": [
+        {"TERM_DESC": "Fall 2013", "aprec": "20", "bprec": "30", "cprec": "30", "dprec": "10", "fprec": "10", "crn": "13579", "instructor": "Smith, Alice"},
+    ],
+}
+
+
+class TestGradeStream(unittest.TestCase):
+
+    def setUp(self):
+        """Set up the sample groups as a JS file."""
+        self.data = ("// grade data\nvar groups = " + json.dumps(SAMPLE_GROUPS, indent=2) + ";\nvar x = 1;").encode()
+
+    def chunks(self, size):
+        return [self.data[i:i + size] for i in range(0, len(self.data), size)]
+
+    def test_stream_matches_json_loads(self):
+        """Test that every chunk size yields the same groups as parsing the whole file."""
+        for size in (1, 7, 64, len(self.data)):
+            self.assertEqual(dict(iter_course_groups(self.chunks(size))), SAMPLE_GROUPS)
+
+    def test_stream_yields_lazily(self):
+        """Test that the first group is yielded before the rest of the file is read."""
+        read = []
+        def tracked():
+            for chunk in self.chunks(16):
+                read.append(chunk)
+                yield chunk
+
+        course, _ = next(iter_course_groups(tracked()))
+        self.assertEqual(course, "CIS210")
+        self.assertLess(len(read), len(self.chunks(16)))
+
+    def test_missing_or_truncated_groups(self):
+        """Test that bad files raise ValueError."""
+        with self.assertRaises(ValueError):
+            list(iter_course_groups([b"var other = {};"]))
+        with self.assertRaises(ValueError):
+            list(iter_course_groups([self.data[:len(self.data) // 2]]))
+
+    def test_streamed_ingest_in_batches(self):
+        """Test that streamed records are inserted in batches with rollups."""
+        mock_db = mongomock.MongoClient().db
+        data_loader = DataLoader(mock_db, {})
+        records = data_loader.iter_course_records(iter_course_groups(self.chunks(32)))
+
+        self.assertEqual(data_loader.replace_grade_records(records, batch_size=2), 3)
+        self.assertEqual(mock_db.grades.count_documents({}), 3)
+        self.assertEqual(mock_db.grades.find_one({"crn": "22345"})["instructor"], "Roe, Jane")
+        self.assertEqual(mock_db.rollup_course.find_one({"course": "CIS210"})["count"], 2)
+        self.assertEqual(data_loader.transform_course_data(SAMPLE_GROUPS)[0]["aprec"], 50.5)
+
+
+class TestGradeGenerations(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance with one loaded generation."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.data_loader.replace_grade_records([dict(r) for r in SAMPLE_GRADE_DATA])
+
+    def test_reload_swaps_staging_and_keeps_previous(self):
+        """Test that a reload replaces the live data and keeps the old generation."""
+        self.data_loader.replace_grade_records([dict(r) for r in EXTRA_GRADE_DATA])
+        names = self.mock_db.list_collection_names()
+
+        self.assertEqual(self.mock_db.grades.count_documents({}), 2)
+        self.assertEqual(self.mock_db.grades.count_documents({"course": "MATH201"}), 0)
+        self.assertEqual(self.mock_db.previous_grades.count_documents({"course": "MATH201"}), 1)
+        self.assertIsNone(self.mock_db.rollup_course.find_one({"course": "MATH201"}))
+        self.assertFalse([name for name in names if name.startswith("staging_")])
+        self.assertIn("course_1_instructor_1", self.mock_db.grades.index_information())
+
+    def test_staging_rollups_are_indexed_before_the_first_batch(self):
+        """Test that the rollup upserts of a reload are served by indexes from the first batch on."""
+        seen = []
+
+        def progress(count):
+            seen.append((set(self.mock_db.staging_rollup_course_instructor.index_information()),
+                         set(self.mock_db.staging_grades.index_information())))
+
+        self.data_loader.replace_grade_records([dict(r) for r in EXTRA_GRADE_DATA], batch_size=1, progress=progress)
+        rollup_indexes, grades_indexes = seen[0]
+        self.assertIn("course_1_instructor_1", rollup_indexes)
+        self.assertNotIn("course_1_instructor_1", grades_indexes)
+        self.assertIn("course_1_instructor_1", self.mock_db.rollup_course_instructor.index_information())
+
+    def test_rollback_restores_previous_generation(self):
+        """Test that rollback restores the previous grades and rollups, and can be undone."""
+        self.data_loader.replace_grade_records([dict(r) for r in EXTRA_GRADE_DATA])
+        version = self.data_loader.get_data_version()
+
+        self.assertTrue(self.data_loader.rollback_grade_records())
+        self.assertEqual(self.mock_db.grades.count_documents({"course": "MATH201"}), 1)
+        self.assertEqual(self.mock_db.rollup_course.find_one({"course": "MATH201"})["count"], 1)
+        self.assertGreater(self.data_loader.get_data_version(), version)
+
+        self.assertTrue(self.data_loader.rollback_grade_records())
+        self.assertEqual(self.mock_db.grades.count_documents({"course": "MATH201"}), 0)
+
+    def test_live_collections_never_missing(self):
+        """Test that a reload and a rollback always leave every live collection in place and keep an indexed copy."""
+        rename, missing = mongomock.collection.Collection.rename, []
+
+        def checked_rename(collection, new_name, **kwargs):
+            rename(collection, new_name, **kwargs)
+            names = set(self.mock_db.list_collection_names())
+            missing.extend(name for name in ("grades", "rollup_course_instructor") if name not in names)
+
+        with patch.object(mongomock.collection.Collection, "rename", checked_rename):
+            self.data_loader.replace_grade_records([dict(r) for r in EXTRA_GRADE_DATA])
+            self.assertIn("course_1_instructor_1", self.mock_db.previous_grades.index_information())
+            self.data_loader.rollback_grade_records()
+
+        self.assertEqual(missing, [])
+        self.assertIn("course_1_instructor_1", self.mock_db.grades.index_information())
+        self.assertEqual(self.mock_db.previous_grades.count_documents({}), 2)
+
+    def test_rollback_without_previous(self):
+        """Test that rollback reports when there is nothing to restore."""
+        fresh_loader = DataLoader(mongomock.MongoClient().db, {})
+        self.assertFalse(fresh_loader.rollback_grade_records())
+
+
+class TestGradeDelta(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance loaded with the sample groups."""
+        self.mock_db = mongomock.MongoClient().db
+        self.data_loader = DataLoader(self.mock_db, {})
+        self.data_loader.replace_grade_records(self.data_loader.transform_course_data(SAMPLE_GROUPS))
+
+    def changed_groups(self):
+        groups = json.loads(json.dumps(SAMPLE_GROUPS))
+        groups["CIS210"][0]["aprec"] = "90"
+        groups["CIS210"][0]["fprec"] = "0"
+        groups["BI211"] = [{"TERM_DESC": "Spring 2014", "aprec": "35", "bprec": "35", "cprec": "20", "dprec": "5", "fprec": "5", "crn": "33333", "instructor": "New, Person"}]
+        del groups["MATH111"]
+        return groups
+
+    def test_delta_counts_and_rollups(self):
+        """Test that only new and changed sections are written and rollups follow."""
+        records = self.data_loader.transform_course_data(self.changed_groups())
+        counts = self.data_loader.apply_grade_delta(records)
+
+        self.assertEqual((counts["inserted"], counts["updated"], counts["unchanged"], counts["removed"]), (1, 1, 1, 0))
+        self.assertEqual(self.mock_db.grades.count_documents({}), 4)
+        self.assertEqual(self.mock_db.grades.find_one({"crn": "12345"})["aprec"], 90.0)
+
+        rollup = self.mock_db.rollup_course.find_one({"course": "CIS210"})
+        self.assertEqual(rollup["count"], 2)
+        self.assertAlmostEqual(rollup["aprec_sum"], 130.0)
+        self.assertEqual(self.mock_db.rollup_department.find_one({"dept": "BI"})["count"], 1)
+
+    def test_delta_keeps_merge_fields_current(self):
+        """Test that written sections are joined with the faculty and lose a match that no longer holds."""
+        self.mock_db.faculty.insert_many([
+            {"name": "Doe, John", "name_key": "doe, john", "department": "CIS", "course_number": "210"},
+            {"name": "New, Person", "name_key": "new, person", "department": "BI", "course_number": "211"},
+        ])
+        self.data_loader.merge_faculty_with_grades()
+        self.assertEqual(self.mock_db.grades.find_one({"crn": "12345"})["department"], "CIS")
+
+        groups = self.changed_groups()
+        groups["CIS210"][0]["instructor"] = "Smith, Alice"
+        counts = self.data_loader.apply_grade_delta(self.data_loader.transform_course_data(groups))
+
+        self.assertEqual(counts["unmerged"], 1)
+        self.assertNotIn("department", self.mock_db.grades.find_one({"crn": "12345"}))
+        added = self.mock_db.grades.find_one({"crn": "33333"})
+        self.assertEqual((added["department"], added["course_number"]), ("BI", "211"))
+
+    def test_delta_removes_missing(self):
+        """Test that vanished sections are removed from grades and rollups."""
+        records = self.data_loader.transform_course_data(self.changed_groups())
+        counts = self.data_loader.apply_grade_delta(records, remove_missing=True)
+
+        self.assertEqual(counts["removed"], 1)
+        self.assertEqual(self.mock_db.grades.count_documents({"course": "MATH111"}), 0)
+        self.assertIsNone(self.mock_db.rollup_course.find_one({"course": "MATH111"}))
+
+    def test_unchanged_delta_does_not_bump_version(self):
+        """Test that reloading identical data writes nothing."""
+        version = self.data_loader.get_data_version()
+        counts = self.data_loader.apply_grade_delta(self.data_loader.transform_course_data(SAMPLE_GROUPS))
+
+        self.assertEqual(counts["unchanged"], 3)
+        self.assertEqual(self.data_loader.get_data_version(), version)
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mock MongoDB instance loaded with the sample groups and an export directory."""
+        self.mock_db = mongomock.MongoClient().db
+        departments = {"BI": "Biology", "CIS": "Computer Science", "MATH": "Mathematics"}
+        self.data_loader = DataLoader(self.mock_db, departments)
+        self.data_loader.replace_grade_records(self.data_loader.transform_course_data(SAMPLE_GROUPS))
+        self.out_dir = tempfile.mkdtemp()
+        self.exporter = SnapshotExporter(self.mock_db, self.out_dir, departments, FilterCatalog(self.mock_db, departments))
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def read(self, path):
+        with open(os.path.join(self.out_dir, path)) as file:
+            return json.load(file)
+
+    def test_full_export(self):
+        """Test that every view gets a shard with the rollup rows and the manifest lists them."""
+        result = self.exporter.export(version=3)
+        manifest = self.read("manifest.json")
+
+        self.assertEqual(manifest["data_version"], 3)
+        self.assertEqual(sorted(manifest["courses"]), ["CIS210", "MATH111"])
+        self.assertEqual(manifest["levels"], {"CIS-200": "levels/CIS-200.json", "MATH-100": "levels/MATH-100.json"})
+        self.assertEqual(result["shards"], 3 + 2 + 2 + len(manifest["instructors"]))
+
+        shard = self.read("courses/CIS210.json")
+        self.assertEqual((shard["group_by"], shard["data_version"]), ("instructor", 3))
+        self.assertEqual(shard["results"], sort_distribution(
+            rollup_distribution(self.mock_db, build_distribution_query(single_class="CIS210"), "instructor"), "A"))
+        self.assertEqual(self.read("departments/BI.json")["results"], [])
+        self.assertIn("teachers", self.read("catalog.json"))
+        for name, path in manifest["instructors"].items():
+            self.assertEqual(path, f"instructors/{slugify(name)}.json")
+            self.assertEqual(self.read(path)["filters"], {"teacher": name})
+
+    def test_file_names_do_not_collide(self):
+        """Test that labels differing only in punctuation or case get different files."""
+        self.assertEqual(slugify("CIS210"), "CIS210")
+        self.assertNotEqual(slugify("O'Neil, Pat"), slugify("ONeil, Pat"))
+        self.assertNotEqual(slugify("Doe, John"), slugify("doe john"))
+        self.assertTrue(slugify("O'Neil, Pat").startswith("o-neil-pat-"))
+
+    def test_delta_export_rewrites_affected_shards(self):
+        """Test that a delta load only re-renders the shards of the courses and instructors it touched."""
+        self.exporter.export(version=1)
+        os.remove(os.path.join(self.out_dir, "courses", "MATH111.json"))
+
+        groups = json.loads(json.dumps(SAMPLE_GROUPS))
+        groups["CIS210"][0]["aprec"] = "90"
+        groups["BI211"] = [{"TERM_DESC": "Spring 2014", "aprec": "35", "bprec": "35", "cprec": "20", "dprec": "5", "fprec": "5", "crn": "33333", "instructor": "New, Person"}]
+        affected = {}
+        self.data_loader.apply_grade_delta(self.data_loader.transform_course_data(groups), affected=affected)
+        self.assertEqual(affected["courses"], {"CIS210", "BI211"})
+
+        self.exporter.export(affected, version=2)
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, "courses", "MATH111.json")))
+        self.assertEqual(self.read("courses/CIS210.json")["data_version"], 2)
+        self.assertEqual(self.read("departments/BI.json")["results"][0]["label"], "New, Person")
+        self.assertEqual(self.read("levels/BI-200.json")["results"][0]["label"], "BI211")
+        self.assertIn("MATH111", self.read("manifest.json")["courses"])
+
+    def test_catalog_only_export(self):
+        """Test that an export without affected views rewrites only the catalog and manifest."""
+        self.exporter.export(version=1)
+        os.remove(os.path.join(self.out_dir, "courses", "MATH111.json"))
+        self.data_loader.insert_faculty_data([{"name": "Smith, Alice", "department": "MATH", "course_number": "111"}])
+        self.exporter.catalog.rebuild()  # The app rebuilds it on every data change
+
+        self.assertEqual(self.exporter.export({}, version=2)["shards"], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, "courses", "MATH111.json")))
+        catalog = self.read("catalog.json")
+        self.assertEqual((catalog["data_version"], catalog["teacher_department_map"]["Smith, Alice"]), (2, "MATH"))
+
+    def test_full_export_removes_stale_shards(self):
+        """Test that a full export deletes shards of views that no longer have data."""
+        self.exporter.export(version=1)
+        self.data_loader.apply_grade_delta(self.data_loader.transform_course_data({"CIS210": SAMPLE_GROUPS["CIS210"]}), remove_missing=True)
+
+        result = self.exporter.export(version=2)
+        self.assertEqual(result["removed"], 3)  # MATH111, MATH-100 and Smith, Alice
+        self.assertNotIn("MATH111", self.read("manifest.json")["courses"])
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, "levels", "MATH-100.json")))
+
+
+class TestJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a job runner on a mock MongoDB instance."""
+        self.mock_db = mongomock.MongoClient().db
+        self.runner = JobRunner(self.mock_db, max_workers=1)
+
+    def test_successful_job(self):
+        """Test that progress, counts, messages and timings are recorded."""
+        def work(job, total):
+            job.progress("Halfway", records=total // 2)
+            report("Loaded everything.", "success")
+            return {"records": total}
+
+        job_id = self.runner.submit("load", work, 10)
+        job = self.runner.wait(job_id, timeout=5)
+
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["counts"], {"records": 10})
+        self.assertEqual(job["messages"], [{"category": "success", "message": "Loaded everything."}])
+        self.assertIn("duration", job)
+
+    def test_failed_job(self):
+        """Test that an exception marks the job as failed with the error."""
+        def work(job):
+            raise ValueError("bad file")
+
+        job = self.runner.wait(self.runner.submit("load", work), timeout=5)
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["error"], "bad file")
+
+    def test_data_loader_reports_to_job(self):
+        """Test that DataLoader messages reach the job outside a request context."""
+        data_loader = DataLoader(self.mock_db, {})
+        job = self.runner.wait(self.runner.submit("scrape", lambda job: {"faculty": data_loader.insert_faculty_data(SAMPLE_FACULTY_DATA)}), timeout=5)
+
+        self.assertEqual(job["counts"], {"faculty": 2})
+        self.assertEqual(job["messages"][0]["category"], "success")
+        self.assertIsNone(self.runner.get("missing"))
+
+    def test_data_jobs_run_one_at_a_time(self):
+        """Test that a second data changing job is refused while the first one holds the lock."""
+        release = threading.Event()
+        first = self.runner.submit_exclusive("load_remote_js", lambda job: {"records": int(release.wait(5))})
+
+        # Another runner stands in for another app process sharing the database
+        other = JobRunner(self.mock_db, max_workers=1)
+        with self.assertRaises(JobConflict) as conflict:
+            other.submit_exclusive("load_remote_js", lambda job: {})
+        self.assertEqual(conflict.exception.holder["owner"], first)
+        with self.assertRaises(JobConflict):
+            with self.runner.hold("rollback_grades"):
+                pass
+
+        release.set()
+        self.assertEqual(self.runner.wait(first, timeout=5)["status"], "succeeded")
+        second = other.submit_exclusive("load_remote_js", lambda job: {"records": 1})
+        self.assertEqual(other.wait(second, timeout=5)["counts"], {"records": 1})
+
+    def test_expired_lock_is_taken_over(self):
+        """Test that a lock left by a process that died is taken over once it expires."""
+        JobRunner(self.mock_db, lock_seconds=-1).acquire_lock("dead", "load_remote_js")
+        job_id = self.runner.submit_exclusive("merge_data", lambda job: {"merged": 1})
+        self.assertEqual(self.runner.wait(job_id, timeout=5)["status"], "succeeded")
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an instrumented Flask app whose view issues two MongoDB commands."""
+        self.now = [0.0]
+        self.logger = MagicMock()
+        self.metrics = Metrics(slow_request_seconds=0.5, logger=self.logger, clock=lambda: self.now[0])
+        self.app = Flask(__name__)
+        self.metrics.init_app(self.app)
+
+        @self.app.route("/items/<int:item_id>")
+        def item(item_id):
+            for _ in range(2):
+                self.metrics.listener.succeeded(SimpleNamespace(command_name="find", duration_micros=2000))
+            self.now[0] += item_id
+            return "ok"
+
+    def test_request_latency_and_commands(self):
+        """Test per route latency and MongoDB commands per request."""
+        client = self.app.test_client()
+        client.get("/items/0")
+        client.get("/missing")
+        self.metrics.listener.failed(SimpleNamespace(command_name="insert", duration_micros=1000))
+        page = self.metrics.render()
+
+        self.assertIn('easya_http_request_duration_seconds_count{method="GET",route="/items/<int:item_id>",status="200"} 1', page)
+        self.assertIn('easya_http_request_duration_seconds_bucket{method="GET",route="/items/<int:item_id>",status="200",le="0.005"} 1', page)
+        self.assertIn('easya_http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1', page)
+        self.assertIn('easya_http_request_mongo_commands_sum{route="/items/<int:item_id>"} 2.0', page)
+        self.assertIn('easya_mongo_commands_total{command="find",outcome="succeeded"} 2', page)
+        self.assertIn('easya_mongo_commands_total{command="insert",outcome="failed"} 1', page)
+        self.assertIn("# TYPE easya_mongo_command_duration_seconds histogram", page)
+        self.assertIn("easya_process_start_time_seconds ", page)
+        self.logger.warning.assert_not_called()
+
+    def test_slow_request_log(self):
+        """Test that slow requests are logged with their command breakdown."""
+        self.app.test_client().get("/items/1")
+        message = self.logger.warning.call_args[0][0] % self.logger.warning.call_args[0][1:]
+        self.assertIn("GET /items/1 took 1.000s", message)
+        self.assertIn("2 mongo commands in 0.004s (find x2)", message)
+
+    def test_job_throughput(self):
+        """Test job durations, record totals and throughput from a finished job."""
+        runner = JobRunner(mongomock.MongoClient().db, max_workers=1)
+        runner.add_finish_listener(self.metrics.record_job)
+        runner.wait(runner.submit("merge_data", lambda job: {"matched": 10}), timeout=5)
+        self.metrics.record_job({"name": "load_remote_js", "status": "succeeded", "duration": 2.0, "counts": {"records": 5000}})
+        page = self.metrics.render()
+
+        self.assertIn('easya_job_records_total{count="matched",job="merge_data"} 10', page)
+        self.assertIn('easya_job_records_per_second{count="records",job="load_remote_js"} 2500.0', page)
+        self.assertIn('easya_job_duration_seconds_count{job="merge_data",status="succeeded"} 1', page)
+
+    def test_const_labels_mark_the_worker(self):
+        """Test that constant labels, e.g. the worker pid, are added to every series."""
+        metrics = Metrics(const_labels={"pid": 1234})
+        metrics.record_command("find", 0.002)
+        page = metrics.render()
+
+        self.assertIn('easya_mongo_commands_total{pid="1234",command="find",outcome="succeeded"} 1', page)
+        self.assertIn('easya_mongo_command_duration_seconds_bucket{pid="1234",command="find",le="0.005"} 1', page)
+        self.assertIn('easya_process_start_time_seconds{pid="1234"} ', page)
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response."""
+
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Session that answers from a list of canned responses and records requests."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, timeout=None, headers=None):
+        self.requests.append((url, headers or {}))
+        return self.responses.pop(0)
+
+
+class TestHttpCaching(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a Flask app with a cached view, a no-store view and a data state."""
+        self.state = {"version": 3, "updated_at": datetime(2024, 1, 15, 12, 0, 30, 500000)}
+        self.renders = []
+        self.caching = HttpCaching(lambda: self.state, shared_max_age=120, compress_min_size=100)
+        self.app = Flask(__name__)
+        self.caching.init_app(self.app)
+
+        @self.app.route("/page")
+        @self.caching.cached()
+        def page():
+            self.renders.append(request.args.get("department"))
+            return "<p>" + "grade data " * 50 + "</p>"
+
+        @self.app.route("/admin")
+        @self.caching.no_store
+        def admin():
+            return "admin"
+
+        self.client = self.app.test_client()
+
+    def test_validators_and_not_modified(self):
+        """Test that a matching ETag or date gets a 304 without rendering the view."""
+        first = self.client.get("/page?department=CIS")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers["Cache-Control"], "public, max-age=0, s-maxage=120")
+        self.assertEqual(first.headers["Last-Modified"], "Mon, 15 Jan 2024 12:00:30 GMT")
+
+        again = self.client.get("/page?department=CIS", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], first.headers["ETag"])
+        since = self.client.get("/page?department=CIS", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+        self.assertEqual(since.status_code, 304)
+        self.assertEqual(self.renders, ["CIS"])
+
+        other = self.client.get("/page?department=MATH", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(other.status_code, 200)
+
+        self.state = {"version": 4, "updated_at": datetime(2024, 2, 1)}
+        changed = self.client.get("/page?department=CIS", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], first.headers["ETag"])
+
+    def test_gzip_and_encoded_etag(self):
+        """Test that accepted responses are gzipped and their ETag still validates."""
+        response = self.client.get("/page", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertTrue(response.headers["ETag"].endswith('-gzip"'))
+        self.assertIn(b"grade data", gzip.decompress(response.data))
+
+        again = self.client.get("/page", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], response.headers["ETag"])
+
+        plain = self.client.get("/page")
+        self.assertNotIn("Content-Encoding", plain.headers)
+
+    def test_no_store(self):
+        """Test that admin views are never cached or compressed below the minimum size."""
+        response = self.client.get("/admin", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Cache-Control"], "no-store")
+        self.assertNotIn("Content-Encoding", response.headers)
+
+
+class TestHttpDiskCache(unittest.TestCase):
+
+    ARCHIVED_URL = "https://web.archive.org/web/20140901091007/http://catalog.uoregon.edu/arts_sciences/"
+    LIVE_URL = "http://catalog.uoregon.edu/arts_sciences/"
+
+    def setUp(self):
+        """Set up a temporary cache directory."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_archived_urls_are_served_from_disk(self):
+        """Test that an archived snapshot is downloaded once, even across cache instances."""
+        session = FakeSession([FakeResponse(200, b"<html>catalog</html>")])
+        self.assertEqual(HttpDiskCache(self.directory, session).get(self.ARCHIVED_URL), b"<html>catalog</html>")
+
+        cache = HttpDiskCache(self.directory, session)
+        self.assertEqual(cache.get(self.ARCHIVED_URL), b"<html>catalog</html>")
+        self.assertEqual(len(session.requests), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_live_urls_are_revalidated(self):
+        """Test that other URLs use conditional requests and reuse the body on 304."""
+        session = FakeSession([
+            FakeResponse(200, b"v1", {"ETag": '"abc"'}),
+            FakeResponse(304),
+            FakeResponse(200, b"v2", {"ETag": '"def"'}),
+        ])
+        cache = HttpDiskCache(self.directory, session)
+
+        self.assertEqual(cache.get(self.LIVE_URL), b"v1")
+        self.assertEqual(cache.get(self.LIVE_URL), b"v1")
+        self.assertEqual(session.requests[1][1]["If-None-Match"], '"abc"')
+        self.assertEqual(cache.get(self.LIVE_URL), b"v2")
+        self.assertEqual(cache.stats()["revalidated"], 1)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_errors_are_not_cached(self):
+        """Test that failed downloads raise and are retried next time."""
+        session = FakeSession([FakeResponse(503), FakeResponse(200, b"ok")])
+        cache = HttpDiskCache(self.directory, session)
+
+        with self.assertRaises(RuntimeError):
+            cache.get(self.ARCHIVED_URL)
+        self.assertEqual(cache.get(self.ARCHIVED_URL), b"ok")
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Markup BeautifulSoup handles in a particular way, the streaming parser has to agree on all of it
+TRICKY_HTML = [
+    "<p>a<p>b</p>c</p>d",
+    "<div><p>x</div>y",
+    "<p>a<br>b</br>c<br/>d</p>",
+    "<p>a &amp b &foo; &#65; &#x42z; &nbsp;x</p>",
+    "<p>a<script>s</script><!--c-->b<template>t</template><style>s</style></p>",
+    "<p>a<![CDATA[q]]>b<?pi x?>c<!DOCTYPE y>d</p>",
+    "<p>a\n\n<b>\n \n</b><pre>\n\n</pre></p>",
+    "</p><P>Jane Doe, professor<p>John Roe, lecturer",
+]
+
+
+class TestParseFaculty(unittest.TestCase):
+
+    def assertSameFaculty(self, content):
+        self.assertEqual(
+            sorted((f["name"], f["department"]) for f in scrap.parse_faculty(content, "MATH")),
+            sorted((f["name"], f["department"]) for f in scrap.parse_faculty_soup(content, "MATH")),
+        )
+
+    def test_fixtures_match_soup_parser(self):
+        """Test that the streaming parser finds the same faculty as the BeautifulSoup tree on saved pages."""
+        pages = sorted(glob.glob(os.path.join(FIXTURES, "catalog", "*.html")))
+        self.assertTrue(pages)
+        for path in pages:
+            with open(path, "rb") as file:
+                content = file.read()
+            with self.subTest(page=os.path.basename(path)):
+                self.assertTrue(scrap.parse_faculty(content, "MATH"))
+                self.assertSameFaculty(content)
+
+    def test_paragraph_texts_match_get_text(self):
+        """Test paragraph texts against BeautifulSoup on malformed and unusual markup."""
+        for html in TRICKY_HTML:
+            with self.subTest(html=html):
+                expected = [p.get_text() for p in BeautifulSoup(html, "html.parser").find_all("p")]
+                self.assertEqual(sorted(scrap.paragraph_texts(html)), sorted(expected))
+
+    def test_bytes_use_declared_encoding(self):
+        """Test that byte pages are decoded like BeautifulSoup does."""
+        html = '<meta charset="iso-8859-1"><p>Ann Lee, associate professor (mathématiques)</p>'.encode("latin-1")
+        self.assertEqual(scrap.paragraph_texts(html), ["Ann Lee, associate professor (mathématiques)"])
+        self.assertEqual(scrap.parse_faculty(html, "MATH"), [{"name": "Lee, Ann", "department": "MATH"}])
+        self.assertSameFaculty(html)
+
+
+class CatalogHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the archived catalog, the biology page fails once with 503."""
+
+    failures = {"/arts_sciences/biology/": 1}
+    pages = {
+        "/arts_sciences/": (
+            '<a href="{base}/arts_sciences/mathematics/">Math</a>'
+            '<a href="{base}/arts_sciences/biology/">Biology</a>'
+            '<a href="{base}/arts_sciences/history/">History</a>'
+        ),
+        "/arts_sciences/mathematics/": "<p>Jane Q. Doe, professor. John Smith, lecturer</p><p>Courses</p>",
+        "/arts_sciences/biology/": "<div><p>Ann Lee, associate professor</p></div>",
+    }
+
+    def do_GET(self):
+        if self.failures.get(self.path):
+            self.failures[self.path] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        page = self.pages.get(self.path)
+        self.send_response(200 if page else 404)
+        self.end_headers()
+        if page:
+            self.wfile.write(page.format(base=self.server.base_url).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAsyncScraper(unittest.TestCase):
+
+    def setUp(self):
+        """Start the stand-in catalog server and point the scraper at a temporary cache."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), CatalogHandler)
+        self.server.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        CatalogHandler.failures["/arts_sciences/biology/"] = 1
+
+        self.directory = tempfile.mkdtemp()
+        self.cache_patch = patch.object(scrap, "http_cache", HttpDiskCache(self.directory, scrap.session))
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_scrape_matches_run_scraper_format(self):
+        """Test the async scrape end to end, including a retried 503."""
+        with patch("builtins.print"):
+            faculty = scrap.scrape_faculty(self.server.base_url + "/arts_sciences/")
+
+        self.assertEqual(
+            sorted((f["name"], f["department"]) for f in faculty),
+            [("Doe, Jane Q.", "MATH"), ("Lee, Ann", "BI"), ("Smith, John", "MATH")],
+        )
+        self.assertEqual(set(faculty[0]), {"name", "department"})
+
+    def test_fetch_gives_up_after_retries(self):
+        """Test that a page failing more often than the retries allow raises."""
+        CatalogHandler.failures["/arts_sciences/biology/"] = 5
+
+        async def fetch():
+            async with AsyncFetcher(retries=1, backoff=0.01) as fetcher:
+                try:
+                    await fetcher.fetch(self.server.base_url + "/arts_sciences/biology/")
+                finally:
+                    self.assertEqual(fetcher.stats(), {"requests": 2, "retries": 1, "failures": 1})
+
+        with self.assertRaises(Exception):
+            asyncio.run(fetch())
+
+    def test_token_bucket_limits_rate(self):
+        """Test that the token bucket spaces requests after the burst."""
+        async def take(count):
+            bucket = TokenBucket(rate=50, capacity=2)
+            start = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(take(7)), 0.09)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,11 @@
+from app import app
+
+"""
+wsgi.py
+
+Production entry point, served by gunicorn with the settings in gunicorn.conf.py:
+    gunicorn -c gunicorn.conf.py wsgi:app
+`flask run` stays the development server.
+"""
+
+application = app